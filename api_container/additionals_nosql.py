@@ -6,6 +6,7 @@ import os
 import sys
 import uuid
 from lib.utils import get_actual_time, get_mongo_client
+from lib.indexes import Index, ensure_indexes
 
 HOUR = 60 * 60
 MINUTE = 60
@@ -24,6 +25,13 @@ class Additionals:
     - hidden (bool): If the additional is hidden or not
     """
 
+    INDEXES = {
+        'additionals': [
+            Index([('uuid', ASCENDING)], unique=True),
+            Index([('provider_id', ASCENDING)])  # get_by_provider
+        ]
+    }
+
     def __init__(self, test_client=None, test_db=None):
         self.client = test_client or get_mongo_client()
         if not self._check_connection():
@@ -44,7 +52,8 @@ class Additionals:
         return True
 
     def _create_collection(self):
-        self.collection.create_index([('uuid', ASCENDING)], unique=True)
+        for collection, indexes in self.INDEXES.items():
+            ensure_indexes(self.db[collection], indexes)
     
     def insert(self, name: str, provider_id: str, description: str, price: float) -> Optional[str]:
         try:
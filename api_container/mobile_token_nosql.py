@@ -1,19 +1,22 @@
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 from pymongo import ASCENDING
-from pymongo.errors import DuplicateKeyError, OperationFailure
+from pymongo.errors import OperationFailure
 import logging as logger
 import os
 import sys
 import uuid
 from firebase_admin import messaging
-from lib.utils import get_actual_time, get_mongo_client
+from lib.utils import get_actual_time, get_mongo_client, bulk_upsert
+from lib.indexes import Index, ensure_indexes
 
 HOUR = 60 * 60
 MINUTE = 60
 MILLISECOND = 1_000
 
+MAX_NOTIFICATIONS = int(os.getenv('MAX_NOTIFICATIONS', 0))  # Kept per user (the newest ones), 0 keeps all of them
+
 # TODO: (General) -> Create tests for each method && add the required checks in each method
 
 class MobileToken:
@@ -24,9 +27,25 @@ class MobileToken:
     - mobile_token: str: The mobile token of the user
     - created_at: int: The timestamp of the creation of the mobile token
     - updated_at: int: The timestamp of the last update of the mobile token
+
+    Notifications (collection 'notifications'):
+    - user_id: str (unique) [pk]
+    - notifications (List[Dict]): title, message and created_at of each notification,
+      oldest first (only the newest max_notifications if set)
+    - created_at, updated_at
     """
 
-    def __init__(self, test_client=None, test_db=None):
+    INDEXES = {
+        'chats': [
+            Index([('user_id', ASCENDING)], unique=True)
+        ],
+        'notifications': [
+            Index([('user_id', ASCENDING)], unique=True)
+        ]
+    }
+
+    def __init__(self, test_client=None, test_db=None, max_notifications: int = MAX_NOTIFICATIONS):
+        self.max_notifications = max_notifications
         self.client = test_client or get_mongo_client()
         if not self._check_connection():
             raise Exception("Failed to connect to MongoDB")
@@ -47,46 +66,43 @@ class MobileToken:
         return True
 
     def _create_collection(self):
-        try:
-            self.collection.create_index([('user_id', ASCENDING)], unique=True)
-            self.notifications.create_index([('user_id', ASCENDING)], unique=True)
-        except DuplicateKeyError:
-            logger.warning("Index on 'user_id' already exists.")
+        for collection, indexes in self.INDEXES.items():
+            ensure_indexes(self.db[collection], indexes)
             
     def _get_user_notifications(self, user_id: str) -> Optional[Dict]:
         notifications = self.notifications.find_one({'user_id': user_id})
         return notifications or None
     
-    def _add_user_to_notifications(self, user_id: str):
+    def _push_notifications(self, notifications: List[Dict], actual_time: str) -> Dict:
+        """
+        Upsert that appends the notifications to the ones of the user, without
+        reading them, keeping only the newest max_notifications if set.
+        """
+        push = {'$each': notifications}
+        if self.max_notifications:
+            push['$slice'] = -self.max_notifications
+        return {
+            '$push': {'notifications': push},
+            '$set': {'updated_at': actual_time},
+            '$setOnInsert': {'created_at': actual_time}
+        }
+
+    def save_notifications(self, notifications: List[Tuple[str, str, str]], session=None):
+        """
+        Saves the (user_id, title, message) notifications with one upsert per user,
+        in a single bulk write.
+        """
         actual_time = get_actual_time()
-        try:
-            self.notifications.insert_one({
-                'user_id': user_id,
-                'notifications': [],
-                'created_at': actual_time,
-                'updated_at': actual_time
+        by_user = {}
+        for user_id, title, message in notifications:
+            by_user.setdefault(user_id, []).append({
+                'title': title,
+                'message': message,
+                'created_at': actual_time
             })
-        except DuplicateKeyError:
-            logger.warning(f"User {user_id} already exists in notifications.")
-            
-    def _save_notification(self, user_id: str, title: str, message: str):
-        notifications = self._get_user_notifications(user_id)
-        if not notifications:
-            self._add_user_to_notifications(user_id)
-            notifications = self._get_user_notifications(user_id)
-        actual_time = get_actual_time()
-        notifications['notifications'].append({
-            'title': title,
-            'message': message,
-            'created_at': actual_time
-        })
-        self.notifications.update_one({'user_id': user_id}, {
-            '$set': {
-                'notifications': notifications['notifications'],
-                'updated_at': actual_time
-            }
-        })
-        
+        bulk_upsert(self.notifications, [({'user_id': user_id}, self._push_notifications(user_notifications, actual_time))
+                                         for user_id, user_notifications in by_user.items()], session)
+
     # def get_notifications(self, user_id: str, delete: bool = False) -> List[Dict]:
     #     notifications = self._get_user_notifications(user_id)
     #     if not notifications:
@@ -121,19 +137,25 @@ class MobileToken:
         mobile_token = self.collection.find_one({'user_id': user_id}) or {}
         return mobile_token.get('mobile_token')
     
-def send_notification(mobile_token_manager: MobileToken, user_id: str, title: str, message: str):
-    mobile_token_manager._save_notification(user_id, title, message)
-    
+def send_notifications(mobile_token_manager: MobileToken, notifications: List[Tuple[str, str, str]], session=None):
+    """
+    Delivers the (user_id, title, message) notifications: saves them in a single
+    bulk write and pushes them to the devices of the users. Every delivery (outbox,
+    reminders) goes through here.
+    """
+    mobile_token_manager.save_notifications(notifications, session)
+
     ## Uncomment the following lines to send notifications using Firebase
-    # token = mobile_token_manager.get_mobile_token(user_id)
-    # if not token:
-    #     logger.error(f"Failed to send notification to user {user_id}: No mobile token found")
-    #     return
-    # message = messaging.Message(
-    #                 notification=messaging.Notification(
-    #                     title=title,
-    #                     body=message,
-    #                 ),
-    #                 token=token
-    #             )
-    # messaging.send(message)
\ No newline at end of file
+    # for user_id, title, message in notifications:
+    #     token = mobile_token_manager.get_mobile_token(user_id)
+    #     if not token:
+    #         logger.error(f"Failed to send notification to user {user_id}: No mobile token found")
+    #         continue
+    #     message = messaging.Message(
+    #                     notification=messaging.Notification(
+    #                         title=title,
+    #                         body=message,
+    #                     ),
+    #                     token=token
+    #                 )
+    #     messaging.send(message)
@@ -0,0 +1,194 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Tuple
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+import logging as logger
+import os
+
+from mobile_token_nosql import MobileToken, send_notifications
+from lib.utils import get_actual_time, get_mongo_client, time_to_string
+from lib.indexes import Index, ensure_indexes
+
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 100))  # Notifications delivered per write
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', 4))  # Batches delivered at the same time
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 1))  # seconds
+OUTBOX_LEASE_TIME = 60  # seconds, a claimed batch not delivered by then is claimed again
+OUTBOX_MAX_ATTEMPTS = 5  # Then the notification is dead-lettered
+OUTBOX_RETRY_DELAY = 5  # seconds, doubled on each attempt
+
+PENDING = "PENDING"
+PROCESSING = "PROCESSING"
+DEAD = "DEAD"
+
+# TODO: (General) -> Create tests for each method && add the required checks in each method
+
+class NotificationsOutbox:
+    """
+    Outbox of the notifications to deliver: the API only inserts them, and
+    the outbox sender delivers them in batches, retrying the failed ones.
+    Fields:
+    - user_id, title, message: The notification
+    - status: str: PENDING, PROCESSING (claimed by a worker) or DEAD (out of attempts)
+    - attempts: int: The failed deliveries
+    - available_at: float: The timestamp from which it can be claimed (after a retry delay or a lease)
+    - claim_id: str: The uuid of the batch that claimed it
+    - last_error: str: The error of the last failed delivery
+    - created_at: str
+    """
+
+    INDEXES = {
+        'notifications_outbox': [
+            Index([('status', ASCENDING), ('available_at', ASCENDING)]),
+            Index([('claim_id', ASCENDING)])
+        ]
+    }
+
+    def __init__(self, test_client=None):
+        self.client = test_client or get_mongo_client()
+        if not self._check_connection():
+            raise Exception("Failed to connect to MongoDB")
+        if test_client:
+            self.db = self.client[os.getenv('MONGO_TEST_DB')]
+        else:
+            self.db = self.client[os.getenv('MONGO_DB')]
+        self.collection = self.db['notifications_outbox']
+        self._create_collection()
+
+    def _check_connection(self):
+        try:
+            self.client.admin.command('ping')
+        except Exception as e:
+            logger.error(e)
+            return False
+        return True
+
+    def _create_collection(self):
+        for collection, indexes in self.INDEXES.items():
+            ensure_indexes(self.db[collection], indexes)
+
+    def enqueue(self, notifications: List[Tuple[str, str, str]]) -> bool:
+        """
+        Adds the (user_id, title, message) notifications with a single insert.
+        """
+        if not notifications:
+            return True
+        actual_time = get_actual_time()
+        now = time.time()
+        try:
+            self.collection.insert_many([{
+                'user_id': user_id,
+                'title': title,
+                'message': message,
+                'status': PENDING,
+                'attempts': 0,
+                'available_at': now,
+                'created_at': actual_time
+            } for user_id, title, message in notifications])
+        except PyMongoError as e:
+            logger.error(e)
+            return False
+        return True
+
+    def claim(self, batch_size: int = OUTBOX_BATCH_SIZE, lease_time: float = OUTBOX_LEASE_TIME) -> List[Dict]:
+        """
+        Claims up to batch_size available notifications, oldest first. The pending
+        ones and the claimed ones whose lease expired (e.g. the worker died) are available.
+        """
+        now = time.time()
+        available = {'status': {'$in': [PENDING, PROCESSING]}, 'available_at': {'$lte': now}}
+        ids = [notification['_id'] for notification in
+               self.collection.find(available, {'_id': 1}).sort('available_at', ASCENDING).limit(batch_size)]
+        if not ids:
+            return []
+        claim_id = str(uuid.uuid4())
+        # Other workers may claim some of them in between, those are left out
+        self.collection.update_many({'_id': {'$in': ids}, **available}, {
+            '$set': {'status': PROCESSING, 'available_at': now + lease_time, 'claim_id': claim_id}
+        })
+        return list(self.collection.find({'claim_id': claim_id}))
+
+    def complete(self, notifications: List[Dict]) -> int:
+        result = self.collection.delete_many({'_id': {'$in': [notification['_id'] for notification in notifications]}})
+        return result.deleted_count
+
+    def fail(self, notifications: List[Dict], error: str, max_attempts: int = OUTBOX_MAX_ATTEMPTS, retry_delay: float = OUTBOX_RETRY_DELAY) -> int:
+        """
+        Releases the notifications for a retry with exponential backoff, or moves
+        them to DEAD once out of attempts. Returns the number of dead ones.
+        """
+        now = time.time()
+        dead = 0
+        for notification in notifications:
+            attempts = notification['attempts'] + 1
+            update = {'attempts': attempts, 'last_error': error}
+            if attempts >= max_attempts:
+                update['status'] = DEAD
+                dead += 1
+            else:
+                update.update({'status': PENDING, 'available_at': now + retry_delay * 2 ** (attempts - 1)})
+            self.collection.update_one({'_id': notification['_id'], 'claim_id': notification['claim_id']},
+                                       {'$set': update, '$unset': {'claim_id': ''}})
+        return dead
+
+    def requeue_dead(self) -> int:
+        result = self.collection.update_many({'status': DEAD}, {
+            '$set': {'status': PENDING, 'attempts': 0, 'available_at': time.time()}
+        })
+        return result.modified_count
+
+    def stats(self) -> Dict:
+        """
+        Queue depth by status, and the notifications available right now.
+        """
+        counts = {status: 0 for status in (PENDING, PROCESSING, DEAD)}
+        for group in self.collection.aggregate([{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]):
+            counts[group['_id']] = group['count']
+        counts['available'] = self.collection.count_documents({
+            'status': {'$in': [PENDING, PROCESSING]}, 'available_at': {'$lte': time.time()}})
+        oldest = self.collection.find_one({'status': {'$ne': DEAD}}, {'created_at': 1}, sort=[('created_at', ASCENDING)])
+        counts['oldest'] = oldest['created_at'] if oldest else None
+        return counts
+
+def _deliver_batch(outbox: NotificationsOutbox, mobile_token_manager: MobileToken, batch: List[Dict]) -> int:
+    """
+    Delivers a claimed batch, returns the number of delivered notifications.
+    """
+    try:
+        send_notifications(mobile_token_manager,
+                           [(notification['user_id'], notification['title'], notification['message']) for notification in batch])
+    except Exception as e:
+        dead = outbox.fail(batch, str(e))
+        logger.error(f"Error delivering {len(batch)} notifications ({dead} dead-lettered): {e}")
+        return 0
+    outbox.complete(batch)
+    return len(batch)
+
+def drain_outbox(outbox: NotificationsOutbox, mobile_token_manager: MobileToken, workers: int = OUTBOX_WORKERS, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    Delivers the available notifications, up to `workers` batches at the same time,
+    until there are none left. Returns the number of delivered notifications.
+    The batches of a round are claimed at once, so the workers get disjoint ones.
+    """
+    delivered = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            claimed = outbox.claim(workers * batch_size)
+            if not claimed:
+                return delivered
+            batches = [claimed[start:start + batch_size] for start in range(0, len(claimed), batch_size)]
+            delivered += sum(executor.map(lambda batch: _deliver_batch(outbox, mobile_token_manager, batch), batches))
+
+def notifications_outbox_sender():
+    outbox = NotificationsOutbox()
+    mobile_token_manager = MobileToken()
+    while True:
+        start = time.time()
+        try:
+            delivered = drain_outbox(outbox, mobile_token_manager)
+            if delivered:
+                logger.info(f"{delivered} notifications delivered in {time_to_string(time.time() - start)}")
+        except Exception as e:
+            logger.error(f"Error delivering notifications: {e}")
+        time.sleep(OUTBOX_POLL_INTERVAL)
@@ -8,11 +8,14 @@ import os
 import sys
 import uuid
 from lib.utils import get_actual_time, get_mongo_client, get_time_past_days
+from lib.indexes import Index, ensure_indexes
 
 HOUR = 60 * 60
 MINUTE = 60
 MILLISECOND = 1_000
 
+RECENT_MIN_RATING = 2.9
+
 # TODO: (General) -> Create tests for each method && add the required checks in each method
 
 class Ratings:
@@ -27,6 +30,18 @@ class Ratings:
     - user_uuid (str): The uuid of the user that rated the service
     """
 
+    INDEXES = {
+        'ratings': [
+            Index([('uuid', ASCENDING)], unique=True),
+            # get and get_all; also rejects a second review of the same user (insert returns None)
+            Index([('service_uuid', ASCENDING), ('user_uuid', ASCENDING)], unique=True),
+            # get_recent
+            Index([('updated_at', ASCENDING), ('service_uuid', ASCENDING)]),
+            # get_recent_of_services and get_recent_comments_by_service
+            Index([('service_uuid', ASCENDING), ('updated_at', ASCENDING)])
+        ]
+    }
+
     def __init__(self, test_client=None):
         self.client = test_client or get_mongo_client()
         if not self._check_connection():
@@ -47,7 +62,8 @@ class Ratings:
         return True
 
     def _create_collection(self):
-        self.collection.create_index([('uuid', ASCENDING)], unique=True)
+        for collection, indexes in self.INDEXES.items():
+            ensure_indexes(self.db[collection], indexes)
     
     def insert(self, service_uuid: str, rating: int, comment: Optional[str], user_uuid: str) -> Optional[str]:
         try:
@@ -95,7 +111,7 @@ class Ratings:
     def get_recent(self, max_delta_days: int, available_services: List[str]) -> Optional[list[dict]]:
         query = {'updated_at': {'$gte': get_time_past_days(max_delta_days)},
              'service_uuid': {'$in': available_services},
-             'rating': {'$gte': 2.9}}
+             'rating': {'$gte': RECENT_MIN_RATING}}
         projection = {'user_uuid': 1, 'service_uuid': 1, 'rating': 1}
         
         result = self.collection.find(query, projection)
@@ -104,12 +120,40 @@ class Ratings:
         
         return [dict(rating) for rating in result]
     
+    def get_recent_of_services(self, max_delta_days: int, services_pipeline: List[dict], service_fields: List[str] = ()) -> List[dict]:
+        """
+        Recent ratings of the services returned by services_pipeline (an aggregation on
+        the services collection that outputs their 'uuid'), joined in the database
+        instead of sending every uuid back in an $in. The service_fields of each
+        service are added to its ratings.
+        The $match right after the $unwind is merged into the $lookup by MongoDB, so
+        each service only reads its recent ratings from the (service_uuid, updated_at) index.
+        """
+        pipeline = services_pipeline + [
+            {'$lookup': {'from': self.collection.name, 'localField': 'uuid', 'foreignField': 'service_uuid', 'as': 'rating'}},
+            {'$unwind': '$rating'},
+            {'$match': {'rating.updated_at': {'$gte': get_time_past_days(max_delta_days)},
+                        'rating.rating': {'$gte': RECENT_MIN_RATING}}},
+            {'$project': {
+                '_id': 0,
+                'user_uuid': '$rating.user_uuid',
+                'service_uuid': '$rating.service_uuid',
+                'rating': '$rating.rating',
+                **{field: 1 for field in service_fields}
+            }}
+        ]
+        return [dict(rating) for rating in self.db['services'].aggregate(pipeline)]
+
     def get_recent_comments_by_service(self, max_delta_days: int, service_uuid: str) -> Optional[list[str]]:
+        """
+        Oldest first, so that new or edited reviews go at the end (and the chunks
+        of the older ones keep their cached summaries).
+        """
         query = {'updated_at': {'$gte': get_time_past_days(max_delta_days)},
                  'service_uuid': service_uuid}
         projection = {'comment': 1}
         
-        result = self.collection.find(query, projection)
+        result = self.collection.find(query, projection).sort('updated_at', ASCENDING)
         if not result:
             return None
         
@@ -1,5 +1,7 @@
 import datetime
+import itertools
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Dict, Tuple
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
@@ -10,21 +12,27 @@ import os
 import sys
 import uuid
 
-from mobile_token_nosql import MobileToken, send_notification
-from lib.utils import get_mongo_client
+from mobile_token_nosql import MobileToken, send_notifications
+from lib.utils import get_mongo_client, bulk_upsert, run_in_transaction, time_to_string
+from lib.indexes import Index, ensure_indexes, drop_indexes
 
 HOUR = 60 * 60
 MINUTE = 60
 MILLISECOND = 1_000
 
+REMINDERS_BUCKET_SIZE = 1_000  # Max reminders per document
+DISPATCH_WORKERS = 4  # Buckets of reminders sent at the same time
+
 # TODO: (General) -> Create tests for each method && add the required checks in each method
 
 class Reminders:
     """
     Reminders class that stores data in a MongoDB collection.
+    The reminders of a date are split in buckets of up to REMINDERS_BUCKET_SIZE reminders.
     Reminders:
-    - date: str (unique) [pk] The date that the reminders are set for
-    - reminders (List[Dict]): The list of reminders for the date
+    - date: str The date that the reminders are set for
+    - reminders (List[Dict]): The list of reminders of the bucket
+    - count (int): The number of reminders pushed to the bucket
 
     reminder structure:
     - rental_id (str): The uuid of the reminder
@@ -33,6 +41,16 @@ class Reminders:
     - description (str): The description of the reminder
     """
 
+    INDEXES = {
+        'reminders': [
+            Index([('date', ASCENDING), ('count', ASCENDING)]),
+            # Multikey, delete_rental_reminders only touches the buckets of the rental
+            Index([('reminders.rental_id', ASCENDING)])
+        ]
+    }
+    # A single document per date is no longer enforced
+    DROPPED_INDEXES = ['date_1']
+
     def __init__(self, test_client=None):
         self.client = test_client or get_mongo_client()
         if not self._check_connection():
@@ -53,64 +71,145 @@ class Reminders:
         return True
 
     def _create_collection(self):
-        self.collection.create_index([('date', ASCENDING)], unique=True)
+        drop_indexes(self.collection, self.DROPPED_INDEXES)
+        for collection, indexes in self.INDEXES.items():
+            ensure_indexes(self.db[collection], indexes)
 
-    def get_reminders(self, date: str) -> Optional[Dict]:
-        doc = self.collection.find_one({'date': date})
-        return (doc['reminders'] or None) if doc else None
+    def get_reminders(self, date: str) -> Optional[List[Dict]]:
+        reminders = [reminder for bucket in self.collection.find({'date': date}) for reminder in bucket['reminders']]
+        return reminders or None
     
     def _create_date(self, date: str):
-        self.collection.insert_one({'date': date, 'reminders': []})
+        self.collection.insert_one({'date': date, 'reminders': [], 'count': 0})
     
     def add_reminder(self, date: str, user_id: str, title: str, description: str, rental_id: str) -> bool:
-        if not self.collection.find_one({'date': date}):
-            self._create_date(date)
         reminder = {
             'rental_id': rental_id,
             'user_id': user_id,
             'title': title,
             'description': description
         }
+        return self.add_reminders([(date, reminder)])
+
+    def add_reminders(self, reminders: List[Tuple[str, Dict]], session=None) -> bool:
+        """
+        Adds the (date, reminder) pairs in a single bulk write. Each date (or chunk of
+        REMINDERS_BUCKET_SIZE reminders of a date) is one upsert that pushes them to a
+        bucket of the date with room left, or creates a new bucket.
+        """
+        by_date = {}
+        for date, reminder in reminders:
+            by_date.setdefault(date, []).append(reminder)
+        upserts = []
+        for date, date_reminders in by_date.items():
+            for start in range(0, len(date_reminders), REMINDERS_BUCKET_SIZE):
+                chunk = date_reminders[start:start + REMINDERS_BUCKET_SIZE]
+                upserts.append(({'date': date, 'count': {'$lte': REMINDERS_BUCKET_SIZE - len(chunk)}},
+                                {'$push': {'reminders': {'$each': chunk}}, '$inc': {'count': len(chunk)}}))
         try:
-            self.collection.update_one({'date': date}, {'$push': {'reminders': reminder}})
+            bulk_upsert(self.collection, upserts, session)
             return True
-        except Exception as e:
+        except OperationFailure as e:
             logger.error(e)
+            if session is not None:
+                raise
             return False
-        
+
     def delete_rental_reminders(self, rental_id: str) -> bool:
-        result = self.collection.update_many({}, {'$pull': {'reminders': {'rental_id': rental_id}}})
+        result = self.collection.update_many({'reminders.rental_id': rental_id}, [
+            {'$set': {'reminders': {'$filter': {
+                'input': '$reminders',
+                'as': 'reminder',
+                'cond': {'$ne': ['$$reminder.rental_id', rental_id]}
+            }}}},
+            # Frees the room of the deleted reminders in the bucket
+            {'$set': {'count': {'$size': '$reminders'}}}
+        ])
         return result.modified_count > 0
     
+    def get_due_buckets(self, date: str):
+        """
+        Cursor over the buckets of the date and of the previous ones (not sent yet), oldest first.
+        """
+        return self.collection.find({'date': {'$lte': date}}, {'date': 1, 'reminders': 1}).sort('date', ASCENDING)
+
+    def delete_bucket(self, bucket_id, session=None) -> bool:
+        result = self.collection.delete_one({'_id': bucket_id}, session=session)
+        return result.deleted_count > 0
+
     def delete_date(self, date: str) -> bool:
-        result = self.collection.delete_one({'date': date})
+        result = self.collection.delete_many({'date': date})
         return result.deleted_count > 0
     
-def save_reminders(reminders_manager: Reminders, rental_date: str, user_id: str, service_name: str, rental_id: str):
+def build_reminders(rental_date: str, user_id: str, service_name: str, rental_id: str) -> List[Tuple[str, Dict]]:
+    """
+    (date, reminder) pairs of a rental: a week before, a day before (if those are
+    still to come) and on the day of the rental.
+    """
     today = datetime.datetime.now().strftime('%Y-%m-%d')
     week_before = datetime.datetime.strptime(rental_date, '%Y-%m-%d') - datetime.timedelta(days=7)
     week_before = week_before.strftime('%Y-%m-%d')
     day_before = datetime.datetime.strptime(rental_date, '%Y-%m-%d') - datetime.timedelta(days=1)
     day_before = day_before.strftime('%Y-%m-%d')
     title = f"Upcoming rental: {service_name}"
+
+    def reminder(body: str) -> Dict:
+        return {'rental_id': rental_id, 'user_id': user_id, 'title': title, 'description': body}
+
+    reminders = []
     if week_before > today:
-        body = f"Your rental of {service_name} is in a week"
-        reminders_manager.add_reminder(week_before, user_id, title, body, rental_id)
+        reminders.append((week_before, reminder(f"Your rental of {service_name} is in a week")))
     if day_before > today:
-        body = f"Your rental of {service_name} is tomorrow"
-        reminders_manager.add_reminder(day_before, user_id, title, body, rental_id)
-    body = f"Your rental of {service_name} is today"
-    reminders_manager.add_reminder(rental_date, user_id, title, body, rental_id)
+        reminders.append((day_before, reminder(f"Your rental of {service_name} is tomorrow")))
+    reminders.append((rental_date, reminder(f"Your rental of {service_name} is today")))
+    return reminders
+
+def save_reminders(reminders_manager: Reminders, rental_date: str, user_id: str, service_name: str, rental_id: str):
+    reminders_manager.add_reminders(build_reminders(rental_date, user_id, service_name, rental_id))
+
+def _dispatch_bucket(reminders_manager: Reminders, mobile_token_manager: MobileToken, bucket: Dict, date: str) -> int:
+    if bucket['date'] < date:
+        # Their wording ("...is tomorrow", "...is today") is wrong after their date, they are dropped
+        logger.warning(f"Dropping {len(bucket['reminders'])} reminders of {bucket['date']}, not sent on their date")
+        notifications = []
+    else:
+        notifications = [(reminder['user_id'], reminder['title'], reminder['description']) for reminder in bucket['reminders']]
+
+    def dispatch(session):
+        # Deleting the bucket is the checkpoint: in a transaction it is saved exactly once
+        send_notifications(mobile_token_manager, notifications, session)
+        reminders_manager.delete_bucket(bucket['_id'], session)
+
+    try:
+        run_in_transaction(reminders_manager.client, dispatch)
+        return len(notifications)
+    except Exception as e:
+        logger.error(f"Error sending the reminders of {bucket['date']}, retrying in the next run: {e}")
+        return 0
+
+def dispatch_due_reminders(reminders_manager: Reminders, mobile_token_manager: MobileToken, date: str, workers: int = DISPATCH_WORKERS) -> int:
+    """
+    Sends the reminders of the date, up to `workers` buckets at the same time, and
+    drops the ones of the previous dates not sent yet (e.g. the process was down).
+    Returns the number of reminders sent.
+    """
+    sent = 0
+    buckets = reminders_manager.get_due_buckets(date)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            batch = list(itertools.islice(buckets, workers))
+            if not batch:
+                break
+            sent += sum(executor.map(lambda bucket: _dispatch_bucket(reminders_manager, mobile_token_manager, bucket, date), batch))
+    return sent
 
 def daily_notification_sender():
     reminders_manager = Reminders()
     mobile_token_manager = MobileToken()
     while True:
         today = datetime.datetime.now().strftime('%Y-%m-%d')
-        reminders = reminders_manager.get_reminders(today)
-        if reminders:
-            for reminder in reminders:
-                send_notification(mobile_token_manager, reminder['user_id'], reminder['title'], reminder['description'])
-            reminders_manager.delete_date(today)
+        start = time.time()
+        sent = dispatch_due_reminders(reminders_manager, mobile_token_manager, today)
+        logger.info(f"{sent} reminders sent in {time_to_string(time.time() - start)}")
         time_until_midnight = (datetime.datetime.strptime(today, '%Y-%m-%d') + datetime.timedelta(days=1) - datetime.datetime.now()).total_seconds()
-        time.sleep(time_until_midnight)
\ No newline at end of file
+        time.sleep(max(time_until_midnight, 0))
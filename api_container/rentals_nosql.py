@@ -2,19 +2,23 @@ import datetime
 from typing import Optional, List, Dict, Tuple
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
-from pymongo import ASCENDING
+from pymongo import ASCENDING, ReturnDocument
 from pymongo.errors import DuplicateKeyError, OperationFailure
 import logging as logger
 import os
 import time
 import uuid
 import random
-from lib.utils import get_actual_time, get_mongo_client
+from lib.utils import get_actual_time, get_mongo_client, bulk_upsert
+from lib.indexes import Index, ensure_indexes, drop_indexes
 
 HOUR = 60 * 60
 MINUTE = 60
 MILLISECOND = 1_000
 
+RENTAL_STATUSES = ['PENDING', 'ACCEPTED', 'REJECTED', 'CANCELLED', 'FINISHED']
+HIRING_REPORT_MONTHS = 12
+
 # TODO: (General) -> Create tests for each method && add the required checks in each method
 
 
@@ -34,8 +38,28 @@ class Rentals:
     - status (str): The status of the rental (PENDING, ACCEPTED, REJECTED, CANCELLED, FINISHED)
     - created_at (datetime): The date when the rental was created
     - updated_at (datetime): The date when the rental was updated
+
+    Rental stats (rollup kept up to date by insert, update_status and delete, seeded on start when empty):
+    - provider_id (str): The uuid of the provider user [pk]
+    - month (str): The 'YYYY-MM' of the date of the rentals [pk]
+    - total (int): The number of rentals
+    - by_status (Dict[str, int]): The number of rentals of each status
     """
 
+    INDEXES = {
+        'rentals': [
+            Index([('uuid', ASCENDING)], unique=True),
+            # total_rentals, finished_rentals and get_hiring_report
+            Index([('provider_id', ASCENDING), ('date', ASCENDING)]),
+            Index([('client_id', ASCENDING)])
+        ],
+        'rental_stats': [
+            Index([('provider_id', ASCENDING), ('month', ASCENDING)], unique=True)
+        ]
+    }
+    # Prefix of the (provider_id, date) index
+    DROPPED_INDEXES = ['provider_id_1']
+
     def __init__(self, test_client=None):
         self.client = test_client or get_mongo_client()
         if not self._check_connection():
@@ -45,7 +69,10 @@ class Rentals:
         else:
             self.db = self.client[os.getenv('MONGO_DB')]
         self.collection = self.db['rentals']
+        self.stats = self.db['rental_stats']
         self._create_collection()
+        self.stats_seeded = False
+        self._seed_stats()
 
     def _check_connection(self):
         try:
@@ -56,28 +83,32 @@ class Rentals:
         return True
 
     def _create_collection(self):
-        self.collection.create_index([('uuid', ASCENDING)], unique=True)
-        self.collection.create_index([('provider_id', ASCENDING)])
-        self.collection.create_index([('client_id', ASCENDING)])
+        drop_indexes(self.collection, self.DROPPED_INDEXES)
+        for collection, indexes in self.INDEXES.items():
+            ensure_indexes(self.db[collection], indexes)
+
+    def _new_rental(self, service_id: str, provider_id: str, client_id: str, date: str, estimated_duration: int, location: Dict, status: str, additionals: List[str]) -> Dict:
+        return {
+            'uuid': str(uuid.uuid4()),
+            'service_id': service_id,
+            'additionals': additionals,
+            'estimated_duration': estimated_duration,
+            'verification_code': None,
+            'provider_id': provider_id,
+            'client_id': client_id,
+            'date': date,
+            'location': location,
+            'status': status,
+            'created_at': get_actual_time(),
+            'updated_at': get_actual_time()
+        }
 
     def insert(self, service_id: str, provider_id: str, client_id: str, date: str, estimated_duration: int, location: Dict, status: str, additionals: List[str] = []) -> Optional[str]:
         try:
-            str_uuid = str(uuid.uuid4())
-            self.collection.insert_one({
-                'uuid': str_uuid,
-                'service_id': service_id,
-                'additionals': additionals,
-                'estimated_duration': estimated_duration,
-                'verification_code': None,
-                'provider_id': provider_id,
-                'client_id': client_id,
-                'date': date,
-                'location': location,
-                'status': status,
-                'created_at': get_actual_time(),
-                'updated_at': get_actual_time()
-            })
-            return str_uuid
+            rental = self._new_rental(service_id, provider_id, client_id, date, estimated_duration, location, status, additionals)
+            self.collection.insert_one(rental)
+            self._inc_stats(provider_id, date, {'total': 1, f'by_status.{status}': 1})
+            return rental['uuid']
         except DuplicateKeyError as e:
             logger.error(f"DuplicateKeyError: {e}")
             return None
@@ -85,6 +116,37 @@ class Rentals:
             logger.error(f"OperationFailure: {e}")
             return None
 
+    def insert_many(self, service_id: str, provider_id: str, client_id: str, dates: List[str], estimated_duration: int, location: Dict, status: str, additionals: List[str] = [], session=None) -> Optional[List[str]]:
+        """
+        Inserts one rental per date with a single insert_many, returns their uuids in
+        the same order. On error none of them is kept: inside a transaction (session)
+        it is aborted, otherwise the inserted ones are deleted.
+        """
+        rentals = [self._new_rental(service_id, provider_id, client_id, date, estimated_duration, location, status, additionals)
+                   for date in dates]
+        uuids = [rental['uuid'] for rental in rentals]
+        try:
+            self.collection.insert_many(rentals, session=session)
+        except OperationFailure as e:
+            logger.error(f"Error inserting rentals: {e}")
+            if session is not None:
+                raise
+            self.collection.delete_many({'uuid': {'$in': uuids}})
+            return None
+
+        months = {}
+        for date in dates:
+            months[date[:7]] = months.get(date[:7], 0) + 1
+        try:
+            bulk_upsert(self.stats, [({'provider_id': provider_id, 'month': month},
+                                      {'$inc': {'total': count, f'by_status.{status}': count}})
+                                     for month, count in months.items()], session)
+        except OperationFailure as e:
+            if session is not None:
+                raise
+            logger.error(f"Error updating rental stats of provider '{provider_id}': {e}")
+        return uuids
+
     def get(self, uuid: str) -> Optional[Dict]:
         result = self.collection.find_one({'uuid': uuid})
         if result:
@@ -124,14 +186,23 @@ class Rentals:
             print(rental)
 
     def delete(self, uuid: str) -> bool:
-        result = self.collection.delete_one({'uuid': uuid})
-        return result.deleted_count > 0
+        rental = self.collection.find_one_and_delete({'uuid': uuid}, projection=self._STATS_PROJECTION)
+        if not rental:
+            return False
+        self._inc_stats(rental['provider_id'], rental['date'], {'total': -1, f"by_status.{rental['status']}": -1})
+        return True
 
     def update_status(self, uuid: str, status: str) -> bool:
         try:
-            result = self.collection.update_one(
-                {'uuid': uuid}, {'$set': {'status': status, 'updated_at': get_actual_time()}})
-            return result.modified_count > 0
+            rental = self.collection.find_one_and_update(
+                {'uuid': uuid}, {'$set': {'status': status, 'updated_at': get_actual_time()}},
+                projection=self._STATS_PROJECTION, return_document=ReturnDocument.BEFORE)
+            if not rental:
+                return False
+            if rental['status'] != status:
+                self._inc_stats(rental['provider_id'], rental['date'],
+                                {f"by_status.{rental['status']}": -1, f'by_status.{status}': 1})
+            return True
         except Exception as e:
             logger.error(f"Error updating rental with uuid '{uuid}': {e}")
             return False
@@ -145,11 +216,89 @@ class Rentals:
             logger.error(f"Error updating rental with uuid '{uuid}': {e}")
             return False
 
+    _STATS_PROJECTION = {'_id': 0, 'provider_id': 1, 'date': 1, 'status': 1}
+
+    def _inc_stats(self, provider_id: str, date: str, increments: Dict[str, int]):
+        try:
+            self.stats.update_one({'provider_id': provider_id, 'month': date[:7]}, {'$inc': increments}, upsert=True)
+        except Exception as e:
+            # The rollup is fixed by rebuild_stats, see check_stats
+            logger.error(f"Error updating rental stats of provider '{provider_id}': {e}")
+
+    def _get_stats(self, provider_id: str) -> List[Dict]:
+        return list(self.stats.find({'provider_id': provider_id}, {'_id': 0}))
+
+    def _compute_stats(self, provider_id: str = None) -> List[Dict]:
+        """
+        The rental stats computed from the rentals, as stored in the rollup.
+        """
+        pipeline = [{'$match': {'provider_id': provider_id}}] if provider_id else []
+        pipeline.append({'$group': {
+            '_id': {'provider_id': '$provider_id', 'month': {'$substr': ['$date', 0, 7]}, 'status': '$status'},
+            'count': {'$sum': 1}
+        }})
+        stats = {}
+        for result in self.collection.aggregate(pipeline):
+            key = (result['_id']['provider_id'], result['_id']['month'])
+            month_stats = stats.setdefault(key, {'provider_id': key[0], 'month': key[1], 'total': 0, 'by_status': {}})
+            month_stats['total'] += result['count']
+            month_stats['by_status'][result['_id']['status']] = result['count']
+        return list(stats.values())
+
+    def _seed_stats(self):
+        """
+        Builds the rollup of the existing rentals when it is empty (the first start
+        after deploying it). Later writes keep it up to date.
+        """
+        try:
+            if self.stats.find_one({}, {'_id': 1}) is None and self.collection.find_one({}, {'_id': 1}) is not None:
+                entries = self.rebuild_stats()
+                logger.info(f"Rental stats seeded with {entries} entries")
+            self.stats_seeded = True
+        except Exception as e:
+            logger.error(f"Error seeding the rental stats: {e}")
+
+    def rebuild_stats(self) -> int:
+        """
+        Recomputes the whole rollup from the rentals, returns the number of (provider, month) entries.
+        The entries are overwritten in place (and the ones without rentals deleted), so the
+        $inc upserts of concurrent writes do not conflict with them.
+        """
+        stats = self._compute_stats()
+        bulk_upsert(self.stats, [({'provider_id': entry['provider_id'], 'month': entry['month']},
+                                  {'$set': {'total': entry['total'], 'by_status': entry['by_status']}}) for entry in stats])
+        keys = {(entry['provider_id'], entry['month']) for entry in stats}
+        stale = [entry['_id'] for entry in self.stats.find({}, {'provider_id': 1, 'month': 1})
+                 if (entry['provider_id'], entry['month']) not in keys]
+        if stale:
+            self.stats.delete_many({'_id': {'$in': stale}})
+        self.stats_seeded = True
+        return len(stats)
+
+    def check_stats(self, provider_id: str = None) -> List[Dict]:
+        """
+        Returns the (provider, month) entries of the rollup that differ from the rentals,
+        with the expected and the stored values.
+        """
+        def normalized(stats: Dict) -> Dict:
+            return {'total': stats['total'], 'by_status': {status: count for status, count in stats['by_status'].items() if count}}
+
+        expected = {(stats['provider_id'], stats['month']): normalized(stats) for stats in self._compute_stats(provider_id)}
+        stored = {(stats['provider_id'], stats['month']): normalized(stats)
+                  for stats in self.stats.find({'provider_id': provider_id} if provider_id else {}, {'_id': 0})}
+        empty = {'total': 0, 'by_status': {}}
+        return [{'provider_id': key[0], 'month': key[1], 'expected': expected.get(key, empty), 'stored': stored.get(key, empty)}
+                for key in sorted(expected.keys() | stored.keys()) if expected.get(key, empty) != stored.get(key, empty)]
+
     def total_rentals(self, provider_id: str) -> int:
-        return self.collection.count_documents({'provider_id': provider_id})
+        if not self.stats_seeded:
+            return self.collection.count_documents({'provider_id': provider_id})
+        return sum(stats['total'] for stats in self._get_stats(provider_id))
 
     def finished_rentals(self, provider_id: str) -> int:
-        return self.collection.count_documents({'provider_id': provider_id, 'status': 'FINISHED'})
+        if not self.stats_seeded:
+            return self.collection.count_documents({'provider_id': provider_id, 'status': 'FINISHED'})
+        return sum(stats['by_status'].get('FINISHED', 0) for stats in self._get_stats(provider_id))
 
     def create_verification_code(self, uuid: str) -> Optional[str]:
         rental = self.get(uuid)
@@ -167,60 +316,99 @@ class Rentals:
                 f"Error creating verification code for rental with uuid '{uuid}': {e}")
             return None
 
-    def get_hiring_report(self, provider_id: str) -> Dict:
+    def get_hiring_report(self, provider_id: str) -> Optional[Dict]:
         """
         Data to obtain:
         - Total rentals
         - Breackdown of rentals by status
         - Total rentals per month (last 12 months) and the percentage of finished rentals
         - Total rentals per year and the percentage of finished rentals
+        Read from the rental stats rollup (one entry per month), or computed from the
+        rentals while the rollup is not seeded. None if the provider has no rentals.
+        """
+        months = self._last_months(get_actual_time(), HIRING_REPORT_MONTHS)
+        if not self.stats_seeded:
+            return self._aggregate_hiring_report(provider_id, months)
+
+        by_month = {stats['month']: stats for stats in self._get_stats(provider_id) if stats['total'] > 0}
+        if not by_month:
+            return None
+
+        by_status = {}
+        by_year = {}
+        for month, stats in by_month.items():
+            for status, count in stats['by_status'].items():
+                by_status[status] = by_status.get(status, 0) + count
+            year_stats = by_year.setdefault(month[:4], {'total': 0, 'by_status': {}})
+            year_stats['total'] += stats['total']
+            year_stats['by_status']['FINISHED'] = year_stats['by_status'].get('FINISHED', 0) + stats['by_status'].get('FINISHED', 0)
+        return self._hiring_report(months, by_status, by_month, by_year)
+
+    def _aggregate_hiring_report(self, provider_id: str, months: List[str]) -> Optional[Dict]:
+        """
+        The hiring report computed in a single aggregation over the rentals of the
+        provider, grouping by the 'YYYY-MM' and 'YYYY' prefixes of the date.
+        """
+        finished = {'$cond': [{'$eq': ['$status', 'FINISHED']}, 1, 0]}
+        pipeline = [
+            {'$match': {'provider_id': provider_id}},
+            {'$project': {
+                '_id': 0,
+                'status': 1,
+                'month': {'$substr': ['$date', 0, 7]},
+                'year': {'$substr': ['$date', 0, 4]}
+            }},
+            {'$facet': {
+                'by_status': [{'$group': {'_id': '$status', 'total': {'$sum': 1}}}],
+                'by_month': [
+                    {'$match': {'month': {'$gte': months[-1], '$lte': months[0]}}},
+                    {'$group': {'_id': '$month', 'total': {'$sum': 1}, 'finished': {'$sum': finished}}}
+                ],
+                'by_year': [{'$group': {'_id': '$year', 'total': {'$sum': 1}, 'finished': {'$sum': finished}}}]
+            }}
+        ]
+        report = next(iter(self.collection.aggregate(pipeline)), None)
+        if not report or not report['by_status']:
+            return None
+
+        def stats(result: Dict) -> Dict:
+            return {'total': result['total'], 'by_status': {'FINISHED': result['finished']}}
+
+        return self._hiring_report(months,
+                                   {result['_id']: result['total'] for result in report['by_status']},
+                                   {result['_id']: stats(result) for result in report['by_month']},
+                                   {result['_id']: stats(result) for result in report['by_year']})
+
+    def _hiring_report(self, months: List[str], by_status: Dict[str, int], by_month: Dict[str, Dict], by_year: Dict[str, Dict]) -> Dict:
+        years = range(int(min(by_year)), max(int(max(by_year)), int(months[0][:4])) + 1)
+        return {
+            'total_rentals': sum(by_status.values()),
+            'finished_rentals': by_status.get('FINISHED', 0),
+            'breakdown_by_status': {status: by_status.get(status, 0) for status in RENTAL_STATUSES},
+            'breakdown_by_month': {month: self._breakdown(by_month.get(month)) for month in months},
+            'breakdown_by_year': {str(year): self._breakdown(by_year.get(str(year))) for year in years}
+        }
+
+    @staticmethod
+    def _last_months(date: str, count: int) -> List[str]:
+        """
+        'YYYY-MM' of the month of the date and the count - 1 previous ones, newest first.
         """
-        total_rentals = self.total_rentals(provider_id)
-        finished_rentals = self.finished_rentals(provider_id)
-
-        breakdown_by_status = {}
-        for status in ['PENDING', 'ACCEPTED', 'REJECTED', 'CANCELLED', 'FINISHED']:
-            breakdown_by_status[status] = self.collection.count_documents(
-                {'provider_id': provider_id, 'status': status})
-
-        breakdown_by_month = {}
-        actual_month = (time.now().year, time.now().month)
-        for i in range(12):
-            month_str = f"{actual_month[0]}-{actual_month[1]}"
-            month_total = self.collection.count_documents(
-                {'provider_id': provider_id, 'date': {'$regex': f'^{month_str}.*'}})
-            month_finished = self.collection.count_documents({'provider_id': provider_id, 'date': {
-                                                             '$regex': f'^{month_str}.*'}, 'status': 'FINISHED'})
-            percentage_finished = 0 if month_total == 0 else month_finished / month_total * 100
-            breakdown_by_month[month_str] = {
-                'total': month_total,
-                'percentage_finished': f"{percentage_finished:.2f}%"
-            }
-            actual_month = (actual_month[0] - 1, 12) if actual_month[1] == 1 else (
-                actual_month[0], actual_month[1] - 1)
-
-        breakdown_by_year = {}
-        fisrt_year = self.collection.find_one(
-            sort=[('date', ASCENDING)])['date'].year
-        actual_year = time.now().year
-        for year in range(fisrt_year, actual_year + 1):
-            year_str = str(year)
-            year_total = self.collection.count_documents(
-                {'provider_id': provider_id, 'date': {'$regex': f'^{year_str}.*'}})
-            year_finished = self.collection.count_documents({'provider_id': provider_id, 'date': {
-                                                            '$regex': f'^{year_str}.*'}, 'status': 'FINISHED'})
-            percentage_finished = 0 if year_total == 0 else year_finished / year_total * 100
-            breakdown_by_year[year_str] = {
-                'total': year_total,
-                'percentage_finished': f"{percentage_finished:.2f}%"
-            }
+        year, month = int(date[:4]), int(date[5:7])
+        months = []
+        for _ in range(count):
+            months.append(f"{year}-{month:02d}")
+            year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+        return months
 
+    @staticmethod
+    def _breakdown(stats: Optional[Dict]) -> Dict:
+        # stats: rental stats entry of a month (or the sum of the ones of a year)
+        total = stats['total'] if stats else 0
+        percentage_finished = 0 if total == 0 else stats['by_status'].get('FINISHED', 0) / total * 100
         return {
-            'total_rentals': total_rentals,
-            'finished_rentals': finished_rentals,
-            'breakdown_by_status': breakdown_by_status,
-            'breakdown_by_month': breakdown_by_month,
-            'breakdown_by_year': breakdown_by_year
+            'total': total,
+            'percentage_finished': f"{percentage_finished:.2f}%"
         }
 
     def get_stats_by_status_last_month(self) -> dict:
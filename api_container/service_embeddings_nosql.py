@@ -0,0 +1,140 @@
+from collections import OrderedDict
+import hashlib
+from typing import Dict, Iterator, List, Optional, Tuple
+import threading
+from pymongo import ASCENDING
+import logging as logger
+import numpy as np
+import os
+
+from lib.utils import get_actual_time, get_mongo_client, bulk_upsert
+from lib.indexes import Index, ensure_indexes
+
+EMBEDDINGS_CACHE_SIZE = int(os.getenv('EMBEDDINGS_CACHE_SIZE', 50_000))  # Embeddings kept in memory
+
+# TODO: (General) -> Create tests for each method && add the required checks in each method
+
+class ServiceEmbeddings:
+    """
+    Embeddings of the service names, computed when the service is created or renamed.
+    The last used ones are kept in memory (LRU). Each embedding keeps the hash of
+    the name it was computed from, and is only returned for that name: a service
+    renamed through another process is not served from a stale entry.
+    Fields:
+    - uuid: str (unique) [pk]: The uuid of the service
+    - model: str: The model that computed the embedding, the ones of other models are ignored
+    - name_hash: str: The sha256 of the embedded name
+    - embedding: bytes: The normalized embedding as float32
+    - updated_at: str
+    """
+
+    INDEXES = {
+        'service_embeddings': [
+            Index([('uuid', ASCENDING)], unique=True)
+        ]
+    }
+
+    def __init__(self, model: str, test_client=None, max_entries: int = EMBEDDINGS_CACHE_SIZE):
+        self.model = model
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Tuple[str, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.client = test_client or get_mongo_client()
+        if not self._check_connection():
+            raise Exception("Failed to connect to MongoDB")
+        if test_client:
+            self.db = self.client[os.getenv('MONGO_TEST_DB')]
+        else:
+            self.db = self.client[os.getenv('MONGO_DB')]
+        self.collection = self.db['service_embeddings']
+        self._create_collection()
+
+    def _check_connection(self):
+        try:
+            self.client.admin.command('ping')
+        except Exception as e:
+            logger.error(e)
+            return False
+        return True
+
+    def _create_collection(self):
+        for collection, indexes in self.INDEXES.items():
+            ensure_indexes(self.db[collection], indexes)
+
+    def _cache_put(self, uuid: str, name_hash: str, embedding: np.ndarray):
+        self._cache[uuid] = (name_hash, embedding)
+        self._cache.move_to_end(uuid)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def get_many(self, names: Dict[str, str]) -> Dict[str, np.ndarray]:
+        """
+        Embeddings of the given services (uuid -> current name), from memory or else
+        with a single query. Services without an embedding of their current name are
+        left out.
+        """
+        hashes = {uuid: name_hash(name) for uuid, name in names.items()}
+        embeddings = {}
+        with self._lock:
+            for uuid, current_hash in hashes.items():
+                entry = self._cache.get(uuid)
+                if entry is not None and entry[0] == current_hash:
+                    self._cache.move_to_end(uuid)
+                    embeddings[uuid] = entry[1]
+            self.hits += len(embeddings)
+        missing = [uuid for uuid in hashes if uuid not in embeddings]
+        if not missing:
+            return embeddings
+        found = {document['uuid']: (document.get('name_hash'), np.frombuffer(document['embedding'], dtype=np.float32))
+                 for document in self.collection.find({'uuid': {'$in': missing}, 'model': self.model},
+                                                      {'uuid': 1, 'name_hash': 1, 'embedding': 1})}
+        with self._lock:
+            self.misses += len(missing)
+            for uuid, (stored_hash, embedding) in found.items():
+                self._cache_put(uuid, stored_hash, embedding)
+                if stored_hash == hashes[uuid]:
+                    embeddings[uuid] = embedding
+        return embeddings
+
+    def get_all(self) -> Iterator[Tuple[str, Optional[str], np.ndarray]]:
+        """
+        (uuid, name_hash, embedding) of every service, without going through the LRU.
+        """
+        for document in self.collection.find({'model': self.model}, {'uuid': 1, 'name_hash': 1, 'embedding': 1}):
+            yield document['uuid'], document.get('name_hash'), np.frombuffer(document['embedding'], dtype=np.float32)
+
+    def save_many(self, embeddings: Dict[str, np.ndarray], names: Dict[str, str]):
+        """
+        Saves the embeddings (uuid -> embedding) of the given names (uuid -> name).
+        """
+        actual_time = get_actual_time()
+        entries = {uuid: (name_hash(names[uuid]), np.asarray(embedding, dtype=np.float32)) for uuid, embedding in embeddings.items()}
+        bulk_upsert(self.collection, [({'uuid': uuid}, {'$set': {
+            'model': self.model,
+            'name_hash': entry_hash,
+            'embedding': embedding.tobytes(),
+            'updated_at': actual_time
+        }}) for uuid, (entry_hash, embedding) in entries.items()])
+        with self._lock:
+            for uuid, (entry_hash, embedding) in entries.items():
+                self._cache_put(uuid, entry_hash, embedding)
+
+    def delete(self, uuid: str) -> bool:
+        with self._lock:
+            self._cache.pop(uuid, None)
+        result = self.collection.delete_one({'uuid': uuid})
+        return result.deleted_count > 0
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._cache),
+            'max_entries': self.max_entries
+        }
+
+
+def name_hash(name: str) -> str:
+    return hashlib.sha256(name.encode()).hexdigest()
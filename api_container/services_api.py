@@ -1,12 +1,18 @@
 import datetime
+import itertools
 import random
 from networkx import NodeNotFound
-from mobile_token_nosql import MobileToken, send_notification
+from mobile_token_nosql import MobileToken
+from notifications_outbox_nosql import NotificationsOutbox, notifications_outbox_sender
 from lib.price_recommender import PriceRecommender
-from lib.review_summarizer import ReviewSummarizer
+from lib.review_summarizer import ReviewSummarizer, summary_scheduler
 from lib.interest_prediction import InterestPredictor
 from lib.trending import TrendingAnaliser
-from lib.utils import sentry_init, time_to_string, validate_location, verify_fields, create_repetitions_list, validate_date, get_actual_time
+from lib.suspended_providers_cache import SuspendedProvidersCache
+from lib.region_cache import RegionCache, ServicesUpdatesFeed
+from lib.ratings_table import RatingsTable
+from lib.indexes import report_indexes
+from lib.utils import sentry_init, time_to_string, validate_location, verify_fields, create_repetitions_list, validate_date, get_actual_time, run_in_transaction, encode_cursor, decode_cursor, location_cell, cell_center
 import operator
 import re
 from typing import Optional, Tuple
@@ -14,10 +20,13 @@ from services_nosql import Services
 from rentals_nosql import Rentals
 from ratings_nosql import Ratings
 from additionals_nosql import Additionals
-from reminders_nosql import Reminders, save_reminders, daily_notification_sender
+from summary_chunks_nosql import SummaryChunks
+from reminders_nosql import Reminders, build_reminders, daily_notification_sender
+from trending_nosql import Trending, compute_trending, trending_updater, TRENDING_CELL_SIZE
 import mongomock
 import logging as logger
 import time
+from pymongo.errors import OperationFailure
 from fastapi import FastAPI, File, UploadFile, BackgroundTasks, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from imported_lib.SupportService.support_lib import SupportLib
@@ -51,6 +60,13 @@ if not os.getenv('TESTING'):
     daily_notification_sender_process = Process(
         target=daily_notification_sender)
     daily_notification_sender_process.start()
+    trending_updater_process = Process(target=trending_updater)
+    trending_updater_process.start()
+    notifications_outbox_sender_process = Process(
+        target=notifications_outbox_sender)
+    notifications_outbox_sender_process.start()
+    summary_scheduler_process = Process(target=summary_scheduler)
+    summary_scheduler_process.start()
 
 app.add_middleware(
     CORSMiddleware,
@@ -60,6 +76,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+SUSPENDED_PROVIDERS_CACHE_TTL = float(
+    os.getenv("SUSPENDED_PROVIDERS_CACHE_TTL", 30))  # seconds
+REGION_CACHE_TTL = float(os.getenv("REGION_CACHE_TTL", 10 * 60))  # seconds
+REGION_CACHE_MAX_ENTRIES = int(os.getenv("REGION_CACHE_MAX_ENTRIES", 1_000))
+# seconds, services reviewed through other workers are invalidated after at most this time
+REGION_CACHE_SYNC_INTERVAL = float(os.getenv("REGION_CACHE_SYNC_INTERVAL", 5))
+ratings_graph_generations = itertools.count()
+
 if os.getenv('TESTING'):
     client = mongomock.MongoClient()
     services_manager = Services(test_client=client)
@@ -71,6 +95,14 @@ if os.getenv('TESTING'):
     support_lib = SupportLib(test_client=client)
     reminders_manager = Reminders(test_client=client)
     mobile_token_manager = MobileToken(test_client=client)
+    notifications_outbox = NotificationsOutbox(test_client=client)
+    trending_manager = Trending(test_client=client)
+    suspended_providers_cache = SuspendedProvidersCache(
+        support_lib.get_all_users_suspended, ttl=0)
+    ratings_graph_cache = RegionCache(ttl=0)
+    recommendations_cache = RegionCache(ttl=0)
+    region_updates = ServicesUpdatesFeed(
+        [ratings_graph_cache], services_manager.updated_since, get_actual_time(), interval=0)
 else:
     services_manager = Services()
     ratings_manager = Ratings()
@@ -81,6 +113,16 @@ else:
     support_lib = SupportLib()
     reminders_manager = Reminders()
     mobile_token_manager = MobileToken()
+    notifications_outbox = NotificationsOutbox()
+    trending_manager = Trending()
+    suspended_providers_cache = SuspendedProvidersCache(
+        support_lib.get_all_users_suspended, ttl=SUSPENDED_PROVIDERS_CACHE_TTL)
+    ratings_graph_cache = RegionCache(
+        max_entries=REGION_CACHE_MAX_ENTRIES, ttl=REGION_CACHE_TTL)
+    recommendations_cache = RegionCache(
+        max_entries=REGION_CACHE_MAX_ENTRIES, ttl=REGION_CACHE_TTL)
+    region_updates = ServicesUpdatesFeed(
+        [ratings_graph_cache], services_manager.updated_since, get_actual_time(), interval=REGION_CACHE_SYNC_INTERVAL)
 
 REQUIRED_CREATE_FIELDS = {"service_name", "provider_id",
                           "category", "price", "location", "max_distance"}
@@ -106,12 +148,16 @@ MAX_RATING = 5  # stars
 
 VALID_REPETITIONS = {"DAILY", "WEEKLY", "MONTHLY", "YEARLY"}
 
-TRENDING_TIME = 30  # days
-TRENDING_MIN_REVIEWS = 0.1  # 10% of the average reviews
-TRENDING_SERVICES = "trending_services"
-TRENDING_LAST_UPDATE = "last_update"
+VALID_SEARCH_MODES = {"text", "regex"}
+DEFAULT_SEARCH_MODE = "text"
+DEFAULT_SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 200
 
 PERSONALIZED_TIME = 30 * 3  # days (3 months)
+PERSONALIZED_CELL_SIZE = 0.1  # degrees (~11km)
+
+DEFAULT_SIMILAR_SERVICES = 10
+MAX_SIMILAR_SERVICES = 100
 
 AVAILABLE_OCCUPATIONS = {"LOW", "MEDIUM", "HIGH"}
 
@@ -155,6 +201,7 @@ def create(body: dict):
                                    data["category"], data["price"], location, data["max_distance"], data["estimated_duration"], data["images"])
     if not uuid:
         raise HTTPException(status_code=400, detail="Error creating service")
+    _index_service(uuid)
     return {"status": "ok", "service_id": uuid}
 
 
@@ -208,13 +255,17 @@ def get_certification(service_id: str):
 def delete(id: str):
     if not services_manager.delete(id):
         raise HTTPException(status_code=404, detail="Service not found")
+    price_recommender.remove_service(id)
     return {"status": "ok"}
 
 
 @app.delete("/delete_all/{provider_id}")
 def delete_all(provider_id: str):
-    if not services_manager.delete_all(provider_id):
+    service_ids = services_manager.delete_provider_services(provider_id)
+    if not service_ids:
         raise HTTPException(status_code=404, detail="Services not found")
+    for service_id in service_ids:
+        price_recommender.remove_service(service_id)
     return {"status": "ok"}
 
 
@@ -250,6 +301,8 @@ def update(id: str, body: dict):
 
     if not services_manager.update(id, update):
         raise HTTPException(status_code=400, detail="Error updating service")
+    if "service_name" in update or "category" in update:
+        _index_service(id)
     return {"status": "ok"}
 
 
@@ -271,34 +324,49 @@ def search(
     hidden: Optional[bool] = Query(None),
     uuid: Optional[str] = Query(None),
     min_avg_rating: Optional[float] = Query(0.0),
-    category: Optional[str] = Query(None)
+    category: Optional[str] = Query(None),
+    search_mode: Optional[str] = Query(DEFAULT_SEARCH_MODE),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT),
+    cursor: Optional[str] = Query(None)
 ):
     if keywords:
         keywords = keywords.split(",")
 
+    if search_mode not in VALID_SEARCH_MODES:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid search mode, must be one of: {', '.join(VALID_SEARCH_MODES)}")
+    if not 0 < limit <= MAX_SEARCH_LIMIT:
+        raise HTTPException(
+            status_code=400, detail=f"Limit must be between 1 and {MAX_SEARCH_LIMIT}")
+    after = decode_cursor(cursor, search_mode) if cursor else None
+
     if not client_location:
         raise HTTPException(
             status_code=400, detail="Client location is required")
     client_location = validate_location(
         client_location, REQUIRED_LOCATION_FIELDS)
 
-    suspended_providers = support_lib.get_all_users_suspended()
-    results = services_manager.search(
+    suspended_providers = suspended_providers_cache.get()
+    results, remaining_services = services_manager.search_page(
         suspended_providers=suspended_providers,
         client_location=client_location,
+        limit=limit,
+        after=after,
         keywords=keywords,
         provider_id=provider_id,
         min_price=min_price,
         max_price=max_price,
         uuid=uuid,
         hidden=hidden,
-        min_avg_rating=min_avg_rating,
-        max_avg_rating=MAX_RATING,
-        category=category
+        min_avg_rating=min_avg_rating if min_avg_rating and min_avg_rating > 0 else None,
+        category=category,
+        text_search=search_mode == "text"
     )
     if not results:
         raise HTTPException(status_code=404, detail="No results found")
-    return {"status": "ok", "results": results}
+    next_cursor = encode_cursor(services_manager.search_sort_key(
+        results[-1]), search_mode) if remaining_services else None
+    return {"status": "ok", "results": results, "next_cursor": next_cursor, "remaining_services": remaining_services}
 
 
 @app.put("/{id}/reviews")
@@ -333,8 +401,8 @@ def review(id: str, body: dict):
             raise HTTPException(
                 status_code=400, detail="Error updating service rating")
 
-        if not os.getenv('TESTING'):
-            review_summarizer.add_service(id)
+        _sync_region_caches(id)
+        review_summarizer.add_service(id)
         return {"status": "ok", "review_id": older_review_uuid}
 
     review_uuid = ratings_manager.insert(
@@ -348,13 +416,13 @@ def review(id: str, body: dict):
         raise HTTPException(
             status_code=400, detail="Error updating service rating")
 
-    if not os.getenv('TESTING'):
-        review_summarizer.add_service(id)
+    _sync_region_caches(id)
+    review_summarizer.add_service(id)
 
     service_name = service["service_name"]
     provider_id = service["provider_id"]
-    send_notification(mobile_token_manager, provider_id, f"New review!",
-                      f"Go and check your service {service_name} to see the new review!")
+    _notify([(provider_id, "New review!",
+              f"Go and check your service {service_name} to see the new review!")])
 
     return {"status": "ok", "review_id": review_uuid}
 
@@ -379,8 +447,8 @@ def delete_review(id: str, user_uuid: str):
         raise HTTPException(status_code=400, detail="Error deleting review")
 
     services_manager.update_rating(id, review["rating"], False)
-    if not os.getenv('TESTING'):
-        review_summarizer.add_service(id)
+    _sync_region_caches(id)
+    review_summarizer.add_service(id)
     return {"status": "ok"}
 
 
@@ -430,29 +498,34 @@ def book(id: str, body: dict):
         repetitions = [date]
         info_key = "rental_id"
 
-    rental_uuids = []
     estimated_duration = service["estimated_duration"]
-    for repetition_date in repetitions:
-        rental_uuid = rentals_manager.insert(
-            id, data["provider_id"], data["client_id"], repetition_date, estimated_duration, client_location, DEFAULT_RENTAL_STATUS, additionals)
-        if not rental_uuid:
-            for uuid in rental_uuids:
-                rentals_manager.delete(uuid)
+    service_name = service["service_name"]
+
+    def write_booking(session):
+        # Inside a transaction when available, so a failure keeps none of the writes
+        rental_uuids = rentals_manager.insert_many(
+            id, data["provider_id"], data["client_id"], repetitions, estimated_duration, client_location, DEFAULT_RENTAL_STATUS, additionals, session=session)
+        if not rental_uuids:
             raise HTTPException(
                 status_code=400, detail="Error creating rentals")
-        rental_uuids.append(rental_uuid)
+        reminders = []
+        for rental_uuid, repetition_date in zip(rental_uuids, repetitions):
+            rental_date = repetition_date.split(" ")[0]
+            for user_id in (data["provider_id"], data["client_id"]):
+                reminders.extend(build_reminders(
+                    rental_date, user_id, service_name, rental_uuid))
+        if not reminders_manager.add_reminders(reminders, session=session):
+            logger.error(f"Error saving the reminders of rentals {rental_uuids}")
+        return rental_uuids
 
-        rental_date = repetition_date.split(" ")[0]
-        service_name = service["service_name"]
-        save_reminders(reminders_manager, rental_date,
-                       data["provider_id"], service_name, rental_uuid)
-        save_reminders(reminders_manager, rental_date,
-                       data["client_id"], service_name, rental_uuid)
+    try:
+        rental_uuids = run_in_transaction(rentals_manager.client, write_booking)
+    except OperationFailure as e:
+        logger.error(f"Error booking service '{id}': {e}")
+        raise HTTPException(status_code=400, detail="Error creating rentals")
 
-    provider_id = services_manager.get(id)["provider_id"]
-    service_name = services_manager.get(id)["service_name"]
-    send_notification(mobile_token_manager, provider_id, f"New booking!",
-                      f"Go and check your calendar to see the new booking for your service {service_name}!")
+    _notify([(service["provider_id"], "New booking!",
+              f"Go and check your calendar to see the new booking for your service {service_name}!")])
 
     return {"status": "ok", info_key: rental_uuids if len(rental_uuids) > 1 else rental_uuids[0]}
 
@@ -469,25 +542,27 @@ def update_booking(id: str, rental_id: str, body: dict):
         raise HTTPException(
             status_code=400, detail="Status must be different from the default")
 
-    if not services_manager.get(id):
+    service = services_manager.get(id)
+    if not service:
         raise HTTPException(status_code=404, detail="Service not found")
 
-    if not rentals_manager.get(rental_id):
+    rental = rentals_manager.get(rental_id)
+    if not rental:
         raise HTTPException(status_code=404, detail="Rental not found")
 
     if not rentals_manager.update_status(rental_id, new_status):
         raise HTTPException(status_code=400, detail="Error updating rental")
 
-    service_name = services_manager.get(id)["service_name"]
-    provider_id = services_manager.get(id)["provider_id"]
-    client_id = rentals_manager.get(rental_id)["client_id"]
-    send_notification(mobile_token_manager, client_id, f"Booking status update!",
-                      f"The status of your booking for the service {service_name} has been updated to {new_status}!")
-    send_notification(mobile_token_manager, provider_id, f"Booking status update!",
-                      f"The status of the booking for your service {service_name} has been updated to {new_status}!")
-
-    if new_status in {"rejected", "cancelled"}:
-        rentals_manager.delete_rental_reminders(rental_id)
+    service_name = service["service_name"]
+    _notify([
+        (rental["client_id"], "Booking status update!",
+         f"The status of your booking for the service {service_name} has been updated to {new_status}!"),
+        (service["provider_id"], "Booking status update!",
+         f"The status of the booking for your service {service_name} has been updated to {new_status}!")
+    ])
+
+    if new_status in {"REJECTED", "CANCELLED"}:
+        reminders_manager.delete_rental_reminders(rental_id)
     return {"status": "ok"}
 
 
@@ -679,14 +754,26 @@ def get_trending_services(
             status_code=400, detail="Client location is required")
     client_location = validate_location(
         client_location, REQUIRED_LOCATION_FIELDS)
-    recent_ratings = _fetch_recent_ratings(client_location, TRENDING_TIME)
-    ratings_list = [(f"U{r['user_uuid']}", f"S{r['service_uuid']}", float(
-        r['rating'])) for r in recent_ratings]
 
-    trending_data = _get_trending_data(ratings_list)
-    trending_services = trending_data[offset:offset+max_services]
-    remaining_services = max(len(trending_data) - (offset + max_services), 0)
-    return {"status": "ok", "results": trending_services, "remaining_services": remaining_services}
+    cell = location_cell(client_location, TRENDING_CELL_SIZE)
+    suspended_providers = suspended_providers_cache.get()
+    trending_page = trending_manager.get_page(
+        cell, offset, max_services, suspended_providers)
+    if trending_page is None:
+        # Cell not computed by the trending updater yet
+        trending_manager.save(cell, compute_trending(services_manager, ratings_manager,
+                              suspended_providers, cell_center(cell, TRENDING_CELL_SIZE)))
+        trending_page = trending_manager.get_page(
+            cell, offset, max_services, suspended_providers)
+    if not trending_page["services_count"]:
+        raise HTTPException(
+            status_code=404, detail="No trending services found")
+
+    trending_services = [(service["service"], {"TRENDING_SCORE": service["trending_score"], "REVIEWS_COUNT": service["reviews_count"]})
+                         for service in trending_page["services"]]
+    remaining_services = max(
+        trending_page["services_count"] - (offset + max_services), 0)
+    return {"status": "ok", "results": trending_services, "remaining_services": remaining_services, "updated_at": trending_page["updated_at"]}
 
 
 @app.get("/recommendations/{user_id}")
@@ -714,19 +801,24 @@ def get_personalized_recommendations(
             status_code=400, detail="Client location is required")
     client_location = validate_location(
         client_location, REQUIRED_LOCATION_FIELDS)
-    recent_ratings = _fetch_recent_ratings(client_location, PERSONALIZED_TIME)
-    ratings_list = [(f"U{r['user_uuid']}", f"S{r['service_uuid']}")
-                    for r in recent_ratings]
-    logger.info(f"ratings_list: {ratings_list}")
-
-    predictor = InterestPredictor(ratings_list, f"U{user_id}")
-    try:
-        predictions = predictor.get_interest_prediction()
-    except NodeNotFound:
-        raise HTTPException(
-            status_code=404, detail="Not enough data to make a prediction based on the user reviews")
-    predictions = sorted(predictions.items(),
-                         key=operator.itemgetter(1), reverse=True)
+    # Every user of the cell shares the ratings graph, pages after the first one are served from memory
+    cell = location_cell(client_location, PERSONALIZED_CELL_SIZE)
+    suspended_providers = suspended_providers_cache.get()
+    ratings_table, generation = _get_ratings_graph(
+        cell, PERSONALIZED_TIME, suspended_providers)
+    # The predictions of a graph are dropped with it, a rebuilt graph has another generation
+    cache_key = (cell, PERSONALIZED_TIME, generation, user_id)
+    predictions = recommendations_cache.get(cache_key)
+    if predictions is None:
+        predictor = InterestPredictor(ratings_table, f"U{user_id}")
+        try:
+            predictions = predictor.get_interest_prediction()
+        except NodeNotFound:
+            raise HTTPException(
+                status_code=404, detail="Not enough data to make a prediction based on the user reviews")
+        predictions = sorted(predictions.items(),
+                             key=operator.itemgetter(1), reverse=True)
+        recommendations_cache.set(cache_key, predictions, ())
     recommendations = predictions[offset:offset+max_services]
     remaining_services = max(len(predictions) - (offset + max_services), 0)
     return {"status": "ok", "results": recommendations, "remaining_services": remaining_services}
@@ -740,7 +832,7 @@ def get_price_recommendation(service_id: str, cost: float, occupation: str):
         raise HTTPException(
             status_code=400, detail="Invalid occupation, must be one of: " + ", ".join(AVAILABLE_OCCUPATIONS))
 
-    suspended_providers = support_lib.get_all_users_suspended()
+    suspended_providers = suspended_providers_cache.get()
     return price_recommender.get_recommendation(service_id, cost, occupation, suspended_providers)
 
 
@@ -776,12 +868,85 @@ def get_stats_by_rating():
     return {"status": "ok", "results": {"negative": negative_count, "neutral": neutral_count, "positive": positive_count}}
 
 
+@app.get("/similar/{service_id}")
+def get_similar_services(service_id: str, k: int = Query(DEFAULT_SIMILAR_SERVICES, gt=0, le=MAX_SIMILAR_SERVICES)):
+    similar_services = price_recommender.get_similar_services(
+        service_id, suspended_providers_cache.get(), k)
+    if similar_services is None:
+        raise HTTPException(status_code=404, detail="Service not found")
+    return {"status": "ok", "results": [{"service_id": uuid, "similarity": similarity} for uuid, similarity in similar_services]}
+
+
+@app.get("/stats/cache")
+def get_cache_stats():
+    return {"status": "ok", "results": {
+        "suspended_providers": suspended_providers_cache.stats(),
+        "ratings_graph": ratings_graph_cache.stats(),
+        "recommendations": recommendations_cache.stats(),
+        "region_updates": region_updates.stats(),
+        "service_embeddings": price_recommender.embeddings_manager.stats()
+    }}
+
+
+@app.get("/stats/summarizer")
+def get_summarizer_stats():
+    return {"status": "ok", "results": review_summarizer.stats()}
+
+
+@app.get("/stats/notifications")
+def get_notifications_stats():
+    return {"status": "ok", "results": notifications_outbox.stats()}
+
+
+@app.get("/stats/indexes")
+def get_index_stats():
+    managers = [services_manager, ratings_manager, rentals_manager, additionals_manager,
+                reminders_manager, mobile_token_manager, notifications_outbox, trending_manager,
+                review_summarizer.jobs_manager, price_recommender.embeddings_manager]
+    results = {}
+    for manager in managers:
+        results.update(report_indexes(manager.db, manager.INDEXES))
+    # The chunks manager only lives in the summary scheduler process, same database
+    results.update(report_indexes(services_manager.db, SummaryChunks.INDEXES))
+    return {"status": "ok", "results": results}
+
+
 @app.get("/correct/data")
 def correct_data():
     erroneous_services = services_manager.correct_data()
     return {"status": "ok", "erroneous_services": str(erroneous_services)}
 
 
+@app.get("/correct/avg_rating")
+def correct_avg_rating():
+    updated_services = services_manager.backfill_avg_rating()
+    return {"status": "ok", "updated_services": updated_services}
+
+
+@app.get("/correct/similarity_index")
+def rebuild_similarity_index():
+    services = price_recommender.rebuild_similarity_index()
+    return {"status": "ok", "services": services}
+
+
+@app.get("/correct/notifications")
+def requeue_dead_notifications():
+    requeued = notifications_outbox.requeue_dead()
+    return {"status": "ok", "requeued": requeued}
+
+
+@app.get("/correct/rental_stats")
+def correct_rental_stats():
+    entries = rentals_manager.rebuild_stats()
+    return {"status": "ok", "rebuilt_entries": entries}
+
+
+@app.get("/check/rental_stats")
+def check_rental_stats(provider_id: Optional[str] = None):
+    mismatches = rentals_manager.check_stats(provider_id)
+    return {"status": "ok", "consistent": not mismatches, "mismatches": mismatches}
+
+
 @app.get("/basic/info/{id}")
 def get_basic_info(id: str):
     service = services_manager.get(id)
@@ -794,27 +959,51 @@ def get_basic_info(id: str):
     return {"status": "ok", "data": data}
 
 
-def _fetch_recent_ratings(client_location, max_time):
-    suspended_providers = support_lib.get_all_users_suspended()
-    all_available_services = [service["uuid"] for service in services_manager.search(
-        suspended_providers, client_location, hidden=False)]
+def _get_ratings_graph(cell, max_time, suspended_providers) -> Tuple[RatingsTable, int]:
+    """
+    Recent ratings of the services available around the cell center and the
+    generation of the graph, cached by cell, time window and suspended providers
+    version. The table keeps its matrices, so they are built once per graph.
+    """
+    region_updates.sync()
+    cache_key = (cell, max_time, suspended_providers_cache.version)
+    cached = ratings_graph_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    location = cell_center(cell, PERSONALIZED_CELL_SIZE)
+    # Only the uuids, to invalidate the cached graph when one of them is reviewed
+    all_available_services = services_manager.search_uuids(
+        suspended_providers, location, hidden=False)
     if not all_available_services:
         raise HTTPException(status_code=404, detail="No services found")
 
-    return ratings_manager.get_recent(max_time, all_available_services)
+    recent_ratings = ratings_manager.get_recent_of_services(max_time, services_manager.search_fields_pipeline(
+        suspended_providers, location, ['uuid'], hidden=False))
+    ratings_table = RatingsTable([(f"U{r['user_uuid']}", f"S{r['service_uuid']}")
+                                  for r in recent_ratings])
+    graph = (ratings_table, next(ratings_graph_generations))
+    ratings_graph_cache.set(cache_key, graph, all_available_services)
+    return graph
 
 
-def _get_trending_data(reviews_list):
-    trending_services = TrendingAnaliser(reviews_list).get_services_rank()
-    avg_reviews = sum([service["REVIEWS_COUNT"]
-                      for service in trending_services.values()]) / len(trending_services)
-    min_reviews = avg_reviews * TRENDING_MIN_REVIEWS
+def _index_service(service_id: str):
+    # Otherwise the embedding is computed by the first recommendation that needs it
+    try:
+        service = services_manager.get(service_id)
+        price_recommender.index_service(service_id, service["service_name"], service["category"])
+    except Exception as e:
+        logger.error(f"Error computing the name embedding of service '{service_id}': {e}")
 
-    filtered_services = {service: data for service, data in trending_services.items(
-    ) if data["REVIEWS_COUNT"] >= min_reviews}
-    trending_data = sorted(filtered_services.items(),
-                           key=lambda x: x[1]["TRENDING_SCORE"], reverse=True)
-    if not trending_data:
-        raise HTTPException(
-            status_code=404, detail="No trending services found")
-    return trending_data
+
+def _notify(notifications):
+    # Delivered by the outbox sender, the request does not wait for it
+    if not notifications_outbox.enqueue(notifications):
+        logger.error(f"Error enqueuing notifications for {[user_id for user_id, _, _ in notifications]}")
+
+
+def _sync_region_caches(service_id: str):
+    # The updated_at of the reviewed service was just written, so the graphs that
+    # include it are dropped now in this worker and within the sync interval in the rest.
+    # It is invalidated here too, the feed skips a service updated twice in the same second
+    ratings_graph_cache.invalidate_service(service_id)
+    region_updates.sync(force=True)
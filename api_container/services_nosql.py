@@ -1,5 +1,5 @@
 import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 from pymongo import ASCENDING
@@ -7,13 +7,21 @@ from pymongo.errors import DuplicateKeyError, OperationFailure
 import logging as logger
 import os
 import sys
+import time
 import uuid
 from lib.utils import get_actual_time, get_mongo_client
+from lib.indexes import Index, ensure_indexes, drop_indexes
+from lib.text_index import TextIndex
 
 HOUR = 60 * 60
 MINUTE = 60
 MILLISECOND = 1_000
 
+TEXT_FIELD_WEIGHTS = {'service_name': 2.0, 'description': 1.0}
+TEXT_INDEX_REFRESH_TIME = 30  # seconds
+SEARCH_REMAINING_ESTIMATE_CAP = 1_000  # Max services counted after a search page
+AVG_RATING_EXPRESSION = {'$cond': [{'$eq': ['$num_ratings', 0]}, 0, {'$divide': ['$sum_rating', '$num_ratings']}]}
+
 # TODO: (General) -> Create tests for each method && add the required checks in each method
 class Services:
     """
@@ -32,6 +40,7 @@ class Services:
     - hidden (bool): If the service is hidden or not
     - sum_rating (int): The sum of all ratings
     - num_ratings (int): The number of ratings
+    - avg_rating (float): sum_rating / num_ratings (0 without ratings), kept by update_rating
     - reviews_summary (str): The summary of the reviews
     - reviews_summary_updated_at (datetime): The date when the reviews summary was updated
     - location (longitude and latitude): The address of the service
@@ -41,6 +50,22 @@ class Services:
     - updated_at (datetime): The date when the service was updated
     """
 
+    INDEXES = {
+        'services': [
+            Index([('uuid', ASCENDING)], unique=True),
+            # $geoNear always scans a 2dsphere index, so the filters of its query (see
+            # _search_filter) only use an index when they follow the location in it.
+            # To check: explain() of a search by category and rating should show an
+            # IXSCAN of this index with bounds on the three fields
+            Index([('location', '2dsphere'), ('category', ASCENDING), ('avg_rating', ASCENDING)]),
+            Index([('provider_id', ASCENDING)]),
+            Index([('category', ASCENDING)]),
+            Index([('updated_at', ASCENDING)])
+        ]
+    }
+    # Replaced by the compound location index ($geoNear fails with two 2dsphere indexes)
+    DROPPED_INDEXES = ['location_2dsphere', 'category_1_avg_rating_1']
+
     def __init__(self, test_client=None, test_db=None):
         self.client = test_client or get_mongo_client()
         if not self._check_connection():
@@ -51,6 +76,10 @@ class Services:
             self.db = self.client[test_db or os.getenv('MONGO_DB')]
         self.collection = self.db['services']
         self._create_collection()
+        self.text_index = TextIndex(TEXT_FIELD_WEIGHTS)
+        self._text_index_loaded = False
+        self._text_index_synced_at = 0.0
+        self._text_index_updated_at = None
     
     def _check_connection(self):
         try:
@@ -61,10 +90,9 @@ class Services:
         return True
 
     def _create_collection(self):
-        self.collection.create_index([('uuid', ASCENDING)], unique=True)
-        self.collection.create_index([('location', '2dsphere')])
-        self.collection.create_index([('provider_id', ASCENDING)])
-        self.collection.create_index([('category', ASCENDING)])
+        drop_indexes(self.collection, self.DROPPED_INDEXES)
+        for collection, indexes in self.INDEXES.items():
+            ensure_indexes(self.db[collection], indexes)
     
     def insert(self, service_name: str, provider_id: str, description: Optional[str], category: str, price: float, location: dict, max_distance: float, estimated_duration: Optional[int] = None, images: Optional[List[str]] = None) -> Optional[str]:
         try:
@@ -81,6 +109,7 @@ class Services:
                 'hidden': False,
                 'sum_rating': 0,
                 'num_ratings': 0,
+                'avg_rating': 0,
                 'images': images or [],
                 'reviews_summary': '',
                 'reviews_summary_updated_at': get_actual_time(),
@@ -90,6 +119,8 @@ class Services:
                 'created_at': get_actual_time(),
                 'updated_at': get_actual_time()
             })
+            if self._text_index_loaded:
+                self.text_index.add(str_uuid, {'service_name': service_name, 'description': description})
             return str_uuid
         except DuplicateKeyError as e:
             logger.error(f"DuplicateKeyError: {e}")
@@ -207,22 +238,138 @@ class Services:
     
     def delete(self, uuid: str) -> bool:
         result = self.collection.delete_one({'uuid': uuid})
+        self.text_index.remove(uuid)
         return result.deleted_count > 0
     
-    def delete_provider_services(self, provider_id: str) -> bool:
-        result = self.collection.delete_many({'provider_id': provider_id})
-        return result.deleted_count > 0
+    def delete_provider_services(self, provider_id: str) -> List[str]:
+        """
+        Returns the uuids of the deleted services.
+        """
+        service_uuids = [service['uuid'] for service in self.collection.find({'provider_id': provider_id}, {'_id': 0, 'uuid': 1})]
+        if not service_uuids:
+            return []
+        self.collection.delete_many({'uuid': {'$in': service_uuids}})
+        for service_uuid in service_uuids:
+            self.text_index.remove(service_uuid)
+        return service_uuids
     
     def update(self, uuid: str, data: dict) -> bool:
         data['updated_at'] = get_actual_time()
         try:
             result = self.collection.update_one({'uuid': uuid}, {'$set': data})
-            return result.modified_count > 0
         except Exception as e:
             logger.error(f"Error updating service with uuid '{uuid}': {e}")
             return False
+        if self._text_index_loaded and TEXT_FIELD_WEIGHTS.keys() & data.keys():
+            service = self.collection.find_one({'uuid': uuid}, {field: 1 for field in TEXT_FIELD_WEIGHTS})
+            if service:
+                self.text_index.add(uuid, service)
+        return result.modified_count > 0
+
+    def _sync_text_index(self):
+        """
+        Loads the text index on first use and then, at most every TEXT_INDEX_REFRESH_TIME
+        seconds, re-indexes the services updated since the last sync (including the
+        ones written by other processes). Deleted services are left in the index,
+        search results are always checked against the collection.
+        """
+        if self._text_index_loaded and time.monotonic() - self._text_index_synced_at < TEXT_INDEX_REFRESH_TIME:
+            return
+        query = {}
+        if self._text_index_updated_at:
+            query['updated_at'] = {'$gte': self._text_index_updated_at}
+        projection = {'uuid': 1, 'updated_at': 1, **{field: 1 for field in TEXT_FIELD_WEIGHTS}}
+        for service in self.collection.find(query, projection):
+            self.text_index.add(service['uuid'], service)
+            updated_at = service.get('updated_at')
+            if isinstance(updated_at, str) and (not self._text_index_updated_at or updated_at > self._text_index_updated_at):
+                self._text_index_updated_at = updated_at
+        self._text_index_loaded = True
+        self._text_index_synced_at = time.monotonic()
+
+    def updated_since(self, updated_at: str) -> List[Tuple[str, str]]:
+        """
+        (uuid, updated_at) of the services updated at or after the given time.
+        """
+        return [(service['uuid'], service['updated_at'])
+                for service in self.collection.find({'updated_at': {'$gte': updated_at}}, {'_id': 0, 'uuid': 1, 'updated_at': 1})]
+
+    def text_search(self, keywords: List[str], candidates: Optional[set] = None) -> List[tuple]:
+        self._sync_text_index()
+        return self.text_index.search(keywords, candidates=candidates)
+
+    def _text_search_ranking(self, suspended_providers: set[str], client_location: dict, keywords: List[str], provider_id: str = None, min_price: float = None, max_price: float = None, uuid: str = None, hidden: bool = None, min_avg_rating: float = None, max_avg_rating: float = None, category: str = None) -> List[tuple]:
+        """
+        (uuid, text score) of the services that pass the distance and filters of the
+        search, sorted by descending score. The filters run first (only fetching the
+        uuids), so matches ranked low overall are not lost when the filters are selective.
+        """
+        pipeline = self._build_search_pipeline(suspended_providers, client_location, None, provider_id, min_price,
+                                               max_price, uuid, hidden, min_avg_rating, max_avg_rating, category,
+                                               projection={'_id': 0, 'uuid': 1})
+        if pipeline is None:
+            return []
+        candidates = {result['uuid'] for result in self.collection.aggregate(pipeline)}
+        if not candidates:
+            return []
+        return self.text_search(keywords, candidates)
+
+    def _search_filter(self, suspended_providers: set[str], provider_id: str = None, min_price: float = None, max_price: float = None, uuid: str = None, hidden: bool = None, category: str = None, candidate_uuids: List[str] = None, min_avg_rating: float = None, max_avg_rating: float = None) -> Optional[dict]:
+        """
+        Equality and range filters of a search, so they can be applied by the
+        $geoNear query (and its indexes) instead of after the distance checks.
+        Returns None when the filters cannot match anything.
+        """
+        query = {}
+        if category:
+            query['category'] = category
+
+        if provider_id:
+            if provider_id in suspended_providers:
+                return None
+            query['provider_id'] = provider_id
+        elif suspended_providers:
+            query['provider_id'] = {'$nin': list(suspended_providers)}
+
+        if min_price or max_price:
+            price_query = {}
+            if min_price:
+                price_query['$gte'] = min_price
+            if max_price:
+                price_query['$lte'] = max_price
+            query['price'] = price_query
+
+        if uuid:
+            if candidate_uuids is not None and uuid not in candidate_uuids:
+                return None
+            query['uuid'] = uuid
+        elif candidate_uuids is not None:
+            query['uuid'] = {'$in': candidate_uuids}
+
+        if hidden is not None:
+            query['hidden'] = hidden
+
+        if min_avg_rating or max_avg_rating:
+            rating_query = {}
+            if min_avg_rating:
+                rating_query['$gte'] = min_avg_rating
+            if max_avg_rating:
+                rating_query['$lte'] = max_avg_rating
+            query['avg_rating'] = rating_query
+        return query
+
+    def _build_search_pipeline(self, suspended_providers: set[str], client_location: dict, keywords: List[str] = None, provider_id: str = None, min_price: float = None, max_price: float = None, uuid: str = None, hidden: bool = None, min_avg_rating: float = None, max_avg_rating: float = None, category: str = None, candidate_uuids: List[str] = None, limit: int = None, after: list = None, projection: dict = None) -> Optional[List[dict]]:
+        """
+        With a limit, the services are sorted by (distance, uuid) and only the ones after
+        the `after` key are returned, as a $facet with the page ('results') and the
+        count of the following services ('remaining', up to SEARCH_REMAINING_ESTIMATE_CAP).
+        The projection replaces the default one (every field but the images).
+        """
+        query = self._search_filter(suspended_providers, provider_id, min_price, max_price, uuid, hidden, category, candidate_uuids,
+                                    min_avg_rating, max_avg_rating)
+        if query is None:
+            return None
 
-    def search(self, suspended_providers: set[str], client_location: dict, keywords: List[str] = None, provider_id: str = None, min_price: float = None, max_price: float = None, uuid: str = None, hidden: bool = None, min_avg_rating: float = None, max_avg_rating: float = None, category: str = None) -> Optional[List[dict]]:
         pipeline = []
 
         if not os.environ.get('MONGOMOCK'):
@@ -233,9 +380,12 @@ class Services:
                         'coordinates': [client_location['longitude'], client_location['latitude']]
                     },
                     'distanceField': 'distance',
-                    'spherical': True
+                    'spherical': True,
+                    'query': query
                 }
             }
+            if limit is not None and after:
+                geo_near_stage['$geoNear']['minDistance'] = after[0]
             pipeline.append(geo_near_stage)
 
             match_stage = {
@@ -249,8 +399,18 @@ class Services:
                 }
             }
             pipeline.append(match_stage)
+        else:
+            if query:
+                pipeline.append({'$match': query})
+            if limit is not None:
+                pipeline.append({'$addFields': {'distance': 0}})
 
-        if keywords and len(keywords) > 0:
+        if limit is not None and after:
+            last_distance, last_uuid = after
+            pipeline.append({'$match': {'$or': [{'distance': {'$gt': last_distance}},
+                                                {'distance': last_distance, 'uuid': {'$gt': last_uuid}}]}})
+
+        if keywords and len(keywords) > 0 and candidate_uuids is None:
             keyword_stage = {
             '$match': {
                 '$or': [
@@ -261,51 +421,133 @@ class Services:
             }
             pipeline.append(keyword_stage)
 
-        if category:
-            pipeline.append({'$match': {'category': category}})
+        if limit is not None:
+            pipeline.append({'$sort': {'distance': ASCENDING, 'uuid': ASCENDING}})
+            pipeline.append({'$limit': limit + SEARCH_REMAINING_ESTIMATE_CAP})
 
-        if provider_id:
-            pipeline.append({'$match': {'provider_id': provider_id}})
+        pipeline.append({'$project': projection or {'images': 0}})
 
-        if min_price or max_price:
-            price_query = {}
-            if min_price:
-                price_query['$gte'] = min_price
-            if max_price:
-                price_query['$lte'] = max_price
-            pipeline.append({'$match': {'price': price_query}})
+        if limit is not None:
+            pipeline.append({'$facet': {
+                'results': [{'$limit': limit}],
+                'remaining': [{'$skip': limit}, {'$count': 'count'}]
+            }})
+        return pipeline
 
-        if uuid:
-            pipeline.append({'$match': {'uuid': uuid}})
+    def search(self, suspended_providers: set[str], client_location: dict, keywords: List[str] = None, provider_id: str = None, min_price: float = None, max_price: float = None, uuid: str = None, hidden: bool = None, min_avg_rating: float = None, max_avg_rating: float = None, category: str = None, text_search: bool = False) -> Optional[List[dict]]:
+        """
+        With text_search the keywords are matched against the text index (ranked,
+        stemmed and prefix matched) and the results are sorted by 'text_score';
+        otherwise they are matched as case insensitive regexes.
+        """
+        text_scores = None
+        if text_search and keywords:
+            text_scores = dict(self._text_search_ranking(suspended_providers, client_location, keywords, provider_id, min_price,
+                                                         max_price, uuid, hidden, min_avg_rating, max_avg_rating, category))
+            if not text_scores:
+                return None
 
-        if hidden is not None:
-            pipeline.append({'$match': {'hidden': hidden}})
+        pipeline = self._build_search_pipeline(suspended_providers, client_location, keywords, provider_id, min_price,
+                                               max_price, uuid, hidden, min_avg_rating, max_avg_rating, category,
+                                               list(text_scores) if text_scores is not None else None)
+        if pipeline is None:
+            return None
 
-        if min_avg_rating:
-            # query['$expr'] = {'$gte': [{'$cond': [{'$eq': ['$num_ratings', 0]}, 0, {'$divide': ['$sum_rating', '$num_ratings']}]}, min_avg_rating]}
-            pipeline.append({'$match': {'$expr': {'$gte': [{'$cond': [{'$eq': ['$num_ratings', 0]}, 0, {'$divide': ['$sum_rating', '$num_ratings']}]}, min_avg_rating]}}})
+        results = [dict(result) for result in self.collection.aggregate(pipeline)]
 
-        if max_avg_rating:
-            pipeline.append({'$match': {'$expr': {'$lte': [{'$cond': [{'$eq': ['$num_ratings', 0]}, 0, {'$divide': ['$sum_rating', '$num_ratings']}]}, max_avg_rating]}}})
+        for result in results:
+            if '_id' in result:
+                result['_id'] = str(result['_id'])
+        if text_scores is not None:
+            for result in results:
+                result['text_score'] = text_scores[result['uuid']]
+            results.sort(key=lambda result: result['text_score'], reverse=True)
+        return results or None
 
-        pipeline.append({'$match': {'provider_id': {'$nin': list(suspended_providers)}}})
-        
-        pipeline.append({'$project': {'images': 0}})
+    def search_fields_pipeline(self, suspended_providers: set[str], client_location: dict, fields: List[str], hidden: bool = None) -> Optional[List[dict]]:
+        """
+        Search pipeline that only returns the given fields of the services, to be run
+        as is or extended with more stages (e.g. joined with their ratings).
+        """
+        projection = {'_id': 0, **{field: 1 for field in fields}}
+        return self._build_search_pipeline(suspended_providers, client_location, hidden=hidden, projection=projection)
 
-        results = [dict(result) for result in self.collection.aggregate(pipeline)]
+    def search_uuids(self, suspended_providers: set[str], client_location: dict, hidden: bool = None) -> List[str]:
+        pipeline = self.search_fields_pipeline(suspended_providers, client_location, ['uuid'], hidden)
+        if pipeline is None:
+            return []
+        return [result['uuid'] for result in self.collection.aggregate(pipeline)]
+
+    def search_page(self, suspended_providers: set[str], client_location: dict, limit: int, after: list = None, keywords: List[str] = None, provider_id: str = None, min_price: float = None, max_price: float = None, uuid: str = None, hidden: bool = None, min_avg_rating: float = None, max_avg_rating: float = None, category: str = None, text_search: bool = False) -> Tuple[List[dict], int]:
+        """
+        Returns up to `limit` services that come after the sort key `after` (see
+        search_sort_key) and an estimate of how many services remain after them.
+        Services are sorted by distance, or by text score when text_search is used.
+        """
+        if text_search and keywords:
+            ranking = self._text_search_ranking(suspended_providers, client_location, keywords, provider_id, min_price,
+                                                max_price, uuid, hidden, min_avg_rating, max_avg_rating, category)
+            if after:
+                ranking = [(uuid, score) for uuid, score in ranking if [-score, uuid] > list(after)]
+            if not ranking:
+                return [], 0
+            remaining = max(len(ranking) - limit, 0)
+            text_scores = dict(ranking[:limit])
+            # Only the services of the page are fetched
+            pipeline = self._build_search_pipeline(suspended_providers, client_location, None, provider_id, min_price,
+                                                   max_price, uuid, hidden, min_avg_rating, max_avg_rating, category,
+                                                   list(text_scores))
+            if pipeline is None:
+                return [], 0
+            results = [dict(result) for result in self.collection.aggregate(pipeline)]
+            for result in results:
+                result['text_score'] = text_scores[result['uuid']]
+            results.sort(key=self.search_sort_key)
+        else:
+            pipeline = self._build_search_pipeline(suspended_providers, client_location, keywords, provider_id, min_price,
+                                                   max_price, uuid, hidden, min_avg_rating, max_avg_rating, category,
+                                                   limit=limit, after=after)
+            if pipeline is None:
+                return [], 0
+            page = next(iter(self.collection.aggregate(pipeline)), None)
+            results = page['results'] if page else []
+            remaining = page['remaining'][0]['count'] if page and page['remaining'] else 0
 
         for result in results:
             if '_id' in result:
                 result['_id'] = str(result['_id'])
-        return results or None
+        return results, remaining
+
+    @staticmethod
+    def search_sort_key(result: dict) -> list:
+        if 'text_score' in result:
+            return [-result['text_score'], result['uuid']]
+        return [result.get('distance', 0), result['uuid']]
 
     def update_rating(self, service_uuid: str, rating: int, sum: bool) -> bool:
-        service = self.get(service_uuid)
-        if not service:
+        sign = 1 if sum else -1
+        try:
+            result = self.collection.update_one({'uuid': service_uuid}, [
+                {'$set': {
+                    'sum_rating': {'$add': ['$sum_rating', rating * sign]},
+                    'num_ratings': {'$add': ['$num_ratings', sign]},
+                    'updated_at': get_actual_time()
+                }},
+                {'$set': {'avg_rating': AVG_RATING_EXPRESSION}}
+            ])
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error updating rating of service with uuid '{service_uuid}': {e}")
             return False
-        sum_rating = service['sum_rating'] + rating * (1 if sum else -1)
-        num_ratings = service['num_ratings'] + (1 if sum else -1)
-        return self.update(service_uuid, {'sum_rating': sum_rating, 'num_ratings': num_ratings, 'updated_at': get_actual_time()})
+
+    def backfill_avg_rating(self) -> int:
+        """
+        Migration: stores avg_rating in the services created before it existed.
+        """
+        result = self.collection.update_many({'avg_rating': {'$exists': False}}, [
+            {'$set': {'avg_rating': AVG_RATING_EXPRESSION}}
+        ])
+        return result.modified_count
             
     def get_additionals(self, service_uuid: str) -> List[str]:
         service = self.get(service_uuid)
@@ -390,6 +632,28 @@ class Services:
                 result['_id'] = str(result['_id'])
         return results or None
     
+    def get_location_cells(self, cell_size: float) -> List[str]:
+        """
+        Ids of the grid cells (see lib.utils.location_cell) with at least one visible service.
+        """
+        results = self.collection.aggregate([
+            {'$match': {'hidden': False}},
+            {'$group': {'_id': {
+                'longitude': {'$floor': {'$divide': [{'$arrayElemAt': ['$location.coordinates', 0]}, cell_size]}},
+                'latitude': {'$floor': {'$divide': [{'$arrayElemAt': ['$location.coordinates', 1]}, cell_size]}}
+            }}}
+        ])
+        return [f"{int(result['_id']['longitude'])}:{int(result['_id']['latitude'])}" for result in results]
+
+    def get_names_and_categories(self, updated_since: str = None) -> Dict[str, Tuple[str, str]]:
+        """
+        uuid -> (service_name, category) of every service, or only of the ones updated
+        at or after updated_since.
+        """
+        query = {'updated_at': {'$gte': updated_since}} if updated_since else {}
+        return {service['uuid']: (service['service_name'], service['category'])
+                for service in self.collection.find(query, {'_id': 0, 'uuid': 1, 'service_name': 1, 'category': 1})}
+
     def get_provider_categories(self, provider_id: str) -> List[str]:
         results = self.collection.aggregate([
             {'$match': {'provider_id': provider_id}},
@@ -0,0 +1,64 @@
+from typing import Dict
+from pymongo import ASCENDING
+import logging as logger
+import os
+
+from lib.utils import get_actual_time, get_mongo_client
+from lib.indexes import Index, ensure_indexes
+
+# TODO: (General) -> Create tests for each method && add the required checks in each method
+
+class SummaryChunks:
+    """
+    Summaries of the chunks of reviews (and of the chunks of summaries) of the last
+    summary of each service, so that the next one only summarizes the changed chunks.
+    Fields:
+    - service_id: str (unique) [pk]
+    - chunks (Dict[str, str]): The summary of each chunk, by sha256 of the chunk text
+    - updated_at: str
+    """
+
+    INDEXES = {
+        'summary_chunks': [
+            Index([('service_id', ASCENDING)], unique=True)
+        ]
+    }
+
+    def __init__(self, test_client=None):
+        self.client = test_client or get_mongo_client()
+        if not self._check_connection():
+            raise Exception("Failed to connect to MongoDB")
+        if test_client:
+            self.db = self.client[os.getenv('MONGO_TEST_DB')]
+        else:
+            self.db = self.client[os.getenv('MONGO_DB')]
+        self.collection = self.db['summary_chunks']
+        self._create_collection()
+
+    def _check_connection(self):
+        try:
+            self.client.admin.command('ping')
+        except Exception as e:
+            logger.error(e)
+            return False
+        return True
+
+    def _create_collection(self):
+        for collection, indexes in self.INDEXES.items():
+            ensure_indexes(self.db[collection], indexes)
+
+    def get(self, service_id: str) -> Dict[str, str]:
+        document = self.collection.find_one({'service_id': service_id}, {'chunks': 1})
+        return document['chunks'] if document else {}
+
+    def replace(self, service_id: str, chunks: Dict[str, str]):
+        """
+        Keeps only the given chunks, the ones no longer used are dropped.
+        """
+        self.collection.update_one({'service_id': service_id}, {
+            '$set': {'chunks': chunks, 'updated_at': get_actual_time()}
+        }, upsert=True)
+
+    def delete(self, service_id: str) -> bool:
+        result = self.collection.delete_one({'service_id': service_id})
+        return result.deleted_count > 0
@@ -0,0 +1,138 @@
+import datetime
+import time
+import uuid
+from typing import Optional, Dict
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import logging as logger
+import os
+
+from lib.utils import get_actual_time, get_mongo_client
+from lib.indexes import Index, ensure_indexes
+
+SUMMARY_JOB_LEASE_TIME = 30 * 60  # seconds, a claimed job not finished by then is claimed again
+SUMMARY_JOB_MAX_ATTEMPTS = 3  # Then the job is left as DEAD
+SUMMARY_JOB_RETRY_DELAY = 10 * 60  # seconds, doubled on each attempt
+
+PENDING = "PENDING"
+PROCESSING = "PROCESSING"
+DONE = "DONE"
+DEAD = "DEAD"
+
+# TODO: (General) -> Create tests for each method && add the required checks in each method
+
+class SummaryJobs:
+    """
+    Queue of the reviews summaries to compute, one job per service and due date:
+    the reviews of a service during a day are summarized once, when the day ends.
+    Fields:
+    - service_id: str
+    - due_date: str: The date (YYYY-MM-DD) from which the job can be run
+    - status: str: PENDING, PROCESSING (leased by a worker), DONE or DEAD (out of attempts)
+    - available_at: float: The timestamp from which it can be claimed (due date, retry delay or lease)
+    - attempts: int: The failed runs
+    - claim_id: str: The uuid of the worker run that claimed it
+    - last_error: str
+    - created_at, updated_at: str
+    Done jobs are kept until their due date has passed, so that later reviews
+    of the same day do not enqueue the service again.
+    """
+
+    INDEXES = {
+        'summary_jobs': [
+            Index([('service_id', ASCENDING), ('due_date', ASCENDING)], unique=True),
+            Index([('status', ASCENDING), ('available_at', ASCENDING)])
+        ]
+    }
+
+    def __init__(self, test_client=None):
+        self.client = test_client or get_mongo_client()
+        if not self._check_connection():
+            raise Exception("Failed to connect to MongoDB")
+        if test_client:
+            self.db = self.client[os.getenv('MONGO_TEST_DB')]
+        else:
+            self.db = self.client[os.getenv('MONGO_DB')]
+        self.collection = self.db['summary_jobs']
+        self._create_collection()
+
+    def _check_connection(self):
+        try:
+            self.client.admin.command('ping')
+        except Exception as e:
+            logger.error(e)
+            return False
+        return True
+
+    def _create_collection(self):
+        for collection, indexes in self.INDEXES.items():
+            ensure_indexes(self.db[collection], indexes)
+
+    def add(self, service_id: str, due_date: datetime.date) -> bool:
+        """
+        Enqueues the service for the due date, unless it is already. Returns
+        whether a new job was created.
+        """
+        actual_time = get_actual_time()
+        available_at = datetime.datetime.combine(due_date, datetime.time.min).timestamp()
+        try:
+            result = self.collection.update_one({'service_id': service_id, 'due_date': due_date.isoformat()}, {
+                '$setOnInsert': {
+                    'status': PENDING,
+                    'available_at': available_at,
+                    'attempts': 0,
+                    'created_at': actual_time,
+                    'updated_at': actual_time
+                }
+            }, upsert=True)
+        except DuplicateKeyError:
+            # Enqueued by a concurrent request
+            return False
+        return result.upserted_id is not None
+
+    def claim(self, lease_time: float = SUMMARY_JOB_LEASE_TIME) -> Optional[Dict]:
+        """
+        Claims the oldest available job: a pending one that is due, or a leased one
+        whose lease expired (e.g. the worker died).
+        """
+        now = time.time()
+        return self.collection.find_one_and_update(
+            {'status': {'$in': [PENDING, PROCESSING]}, 'available_at': {'$lte': now}},
+            {'$set': {'status': PROCESSING, 'available_at': now + lease_time,
+                      'claim_id': str(uuid.uuid4()), 'updated_at': get_actual_time()}},
+            sort=[('available_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER)
+
+    def complete(self, job: Dict) -> bool:
+        result = self.collection.update_one({'_id': job['_id'], 'claim_id': job['claim_id']}, {
+            '$set': {'status': DONE, 'updated_at': get_actual_time()},
+            '$unset': {'claim_id': ''}
+        })
+        return result.modified_count > 0
+
+    def fail(self, job: Dict, error: str, max_attempts: int = SUMMARY_JOB_MAX_ATTEMPTS, retry_delay: float = SUMMARY_JOB_RETRY_DELAY) -> bool:
+        """
+        Releases the job for a retry with exponential backoff, or leaves it as DEAD
+        once out of attempts. Returns whether it is dead.
+        """
+        attempts = job['attempts'] + 1
+        update = {'attempts': attempts, 'last_error': error, 'updated_at': get_actual_time()}
+        if attempts >= max_attempts:
+            update['status'] = DEAD
+        else:
+            update.update({'status': PENDING, 'available_at': time.time() + retry_delay * 2 ** (attempts - 1)})
+        self.collection.update_one({'_id': job['_id'], 'claim_id': job['claim_id']},
+                                   {'$set': update, '$unset': {'claim_id': ''}})
+        return attempts >= max_attempts
+
+    def delete_finished_before(self, date: datetime.date) -> int:
+        result = self.collection.delete_many({'status': {'$in': [DONE, DEAD]}, 'due_date': {'$lt': date.isoformat()}})
+        return result.deleted_count
+
+    def stats(self) -> Dict:
+        counts = {status: 0 for status in (PENDING, PROCESSING, DONE, DEAD)}
+        for group in self.collection.aggregate([{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]):
+            counts[group['_id']] = group['count']
+        counts['available'] = self.collection.count_documents({
+            'status': {'$in': [PENDING, PROCESSING]}, 'available_at': {'$lte': time.time()}})
+        return counts
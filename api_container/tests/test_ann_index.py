@@ -0,0 +1,152 @@
+import pytest
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
+from lib.ann_index import IVFIndex, PartitionedIndex, MIN_TRAIN_SIZE
+
+# Run with the following command:
+# pytest ServicesService/api_container/tests/test_ann_index.py
+
+DIM = 16
+
+
+def _vectors(count, seed=0, clusters=20):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, DIM))
+    vectors = centers[rng.integers(0, clusters, count)] + 0.3 * rng.normal(size=(count, DIM))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _exact(ids, vectors, query, k, candidates=None):
+    scores = vectors @ query
+    order = [i for i in np.argsort(-scores) if candidates is None or ids[i] in candidates]
+    return [ids[i] for i in order[:k]]
+
+
+@pytest.fixture(scope='module')
+def data():
+    vectors = _vectors(4 * MIN_TRAIN_SIZE)
+    return [f"S{i}" for i in range(len(vectors))], vectors
+
+
+@pytest.fixture(scope='function')
+def index(data):
+    ids, vectors = data
+    index = IVFIndex(DIM)
+    for id, vector in zip(ids, vectors):
+        index.add(id, vector)
+    return index
+
+
+def test_small_index_is_exact():
+    vectors = _vectors(50)
+    ids = [f"S{i}" for i in range(50)]
+    index = IVFIndex(DIM)
+    for id, vector in zip(ids, vectors):
+        index.add(id, vector)
+    assert not len(index.centroids)
+    assert [id for id, _ in index.search(vectors[3], 5)] == _exact(ids, vectors, vectors[3], 5)
+
+
+def test_trained_on_growth(index, data):
+    ids, _ = data
+    assert len(index.centroids) == int(np.sqrt(len(ids)))
+    assert len(index) == len(ids)
+
+
+def test_recall(index, data):
+    ids, vectors = data
+    found = sum(len({id for id, _ in index.search(vectors[i], 10)} & set(_exact(ids, vectors, vectors[i], 10)))
+                for i in range(50))
+    assert found / (50 * 10) >= 0.9
+
+
+def test_delete(index, data):
+    ids, vectors = data
+    assert index.delete("S7")
+    assert not index.delete("S7")
+    assert "S7" not in [id for id, _ in index.search(vectors[7], 10)]
+    index.add("S7", vectors[7])
+    assert index.search(vectors[7], 1)[0][0] == "S7"
+
+
+def test_candidates(index, data):
+    ids, vectors = data
+    small = {ids[i] for i in range(0, len(ids), 40)}
+    assert [id for id, _ in index.search(vectors[0], 5, small)] == _exact(ids, vectors, vectors[0], 5, small)
+    large = set(ids[:len(ids) // 2])
+    results = index.search(vectors[1], 10, large)
+    assert len(results) == 10
+    assert all(id in large for id, _ in results)
+
+
+@pytest.mark.parametrize("ratio", [0.05, 0.2, 0.5, 0.75])
+def test_candidates_recall(index, data, ratio):
+    ids, vectors = data
+    rng = np.random.default_rng(1)
+    candidates = {ids[i] for i in rng.choice(len(ids), int(ratio * len(ids)), replace=False)}
+    # Ids of other partitions are ignored
+    candidates |= {f"other_{i}" for i in range(len(ids))}
+    found = sum(len({id for id, _ in index.search(vectors[i], 10, candidates)} & set(_exact(ids, vectors, vectors[i], 10, candidates)))
+                for i in range(50))
+    assert found / (50 * 10) >= 0.9
+
+
+def test_save_and_load(index, data, tmp_path):
+    ids, vectors = data
+    partitioned = PartitionedIndex(DIM)
+    partitioned.partitions["Repair"] = index
+    partitioned._partition_of.update((id, "Repair") for id in ids)
+    partitioned.delete("S3")
+    partitioned.save(str(tmp_path / "index"))
+
+    loaded = PartitionedIndex.load(str(tmp_path / "index"))
+    assert isinstance(loaded.partitions["Repair"]._vectors, np.memmap)
+    assert len(loaded) == len(ids) - 1
+    assert loaded.search("Repair", vectors[5], 5) == partitioned.search("Repair", vectors[5], 5)
+    loaded.add("new", "Repair", vectors[5])
+    assert {id for id, _ in loaded.search("Repair", vectors[5], 2)} == {"S5", "new"}
+
+
+def test_save_and_load_empty(tmp_path):
+    PartitionedIndex.build(8, []).save(str(tmp_path / "index"))
+    loaded = PartitionedIndex.load(str(tmp_path / "index"))
+    assert len(loaded) == 0
+    assert loaded.search("Repair", np.ones(8, dtype=np.float32), 5) == []
+    # Saved again over the existing one
+    loaded.add("new", "Repair", np.ones(8, dtype=np.float32))
+    loaded.metadata["synced_at"] = "2024-01-01 00:00:00"
+    loaded.save(str(tmp_path / "index"))
+    reloaded = PartitionedIndex.load(str(tmp_path / "index"))
+    assert len(reloaded) == 1
+    assert reloaded.metadata == {"synced_at": "2024-01-01 00:00:00"}
+
+
+def test_partitions():
+    vectors = _vectors(30)
+    index = PartitionedIndex.build(DIM, ((f"S{i}", "Repair" if i % 2 else "Cleaning", vector)
+                                         for i, vector in enumerate(vectors)))
+    assert all(int(id[1:]) % 2 for id, _ in index.search("Repair", vectors[0], 10))
+    assert index.search("Cooking", vectors[0], 10) == []
+    # Moving to another category
+    index.add("S1", "Cleaning", vectors[1])
+    assert index.get_partition("S1") == "Cleaning"
+    assert "S1" not in [id for id, _ in index.search("Repair", vectors[1], 30)]
+    assert index.search("Cleaning", vectors[1], 1)[0][0] == "S1"
+    assert index.delete("S1")
+    assert index.get_partition("S1") is None
+
+
+def test_add_unchanged_is_a_no_op(index, data):
+    ids, vectors = data
+    partitioned = PartitionedIndex(DIM)
+    partitioned.add("S1", "Repair", vectors[1])
+    size = partitioned.partitions["Repair"]._size
+    partitioned.add("S1", "Repair", vectors[1])
+    assert partitioned.partitions["Repair"]._size == size
+    partitioned.add("S1", "Repair", vectors[2])
+    assert partitioned.partitions["Repair"]._size == size + 1
+    assert partitioned.search("Repair", vectors[2], 1)[0][0] == "S1"
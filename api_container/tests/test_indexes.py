@@ -0,0 +1,50 @@
+import pytest
+import mongomock
+from pymongo import ASCENDING
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
+from lib.indexes import Index, ensure_indexes, index_report, report_indexes
+
+# Run with the following command:
+# pytest ServicesService/api_container/tests/test_indexes.py
+
+@pytest.fixture(scope='function')
+def collection():
+    client = mongomock.MongoClient()
+    yield client['test_db']['items']
+    client.close()
+
+INDEXES = [
+    Index([('uuid', ASCENDING)], unique=True),
+    Index([('owner', ASCENDING), ('date', ASCENDING)])
+]
+
+def test_index_name_matches_mongo(collection):
+    assert collection.create_index([('owner', ASCENDING), ('date', ASCENDING)]) == INDEXES[1].name
+
+def test_ensure_indexes_is_idempotent(collection):
+    assert ensure_indexes(collection, INDEXES) == ['uuid_1', 'owner_1_date_1']
+    assert ensure_indexes(collection, INDEXES) == ['uuid_1', 'owner_1_date_1']
+    assert set(collection.index_information()) == {'_id_', 'uuid_1', 'owner_1_date_1'}
+
+def test_unique_index_over_duplicates_is_reported_missing(collection):
+    collection.insert_many([{'uuid': 'a'}, {'uuid': 'a'}])
+    assert ensure_indexes(collection, INDEXES) == ['owner_1_date_1']
+    assert index_report(collection, INDEXES)['missing'] == ['uuid_1']
+
+def test_index_report(collection):
+    collection.create_index([('uuid', ASCENDING)])
+    collection.create_index([('legacy', ASCENDING)])
+    report = index_report(collection, INDEXES)
+    assert report['missing'] == ['owner_1_date_1']
+    assert report['mismatched'] == ['uuid_1']
+    assert report['undeclared'] == ['legacy_1']
+    assert report['unused'] is None  # $indexStats is not available in mongomock
+
+def test_report_indexes(collection):
+    ensure_indexes(collection, INDEXES)
+    report = report_indexes(collection.database, {'items': INDEXES})
+    assert report['items']['missing'] == []
@@ -0,0 +1,43 @@
+import pytest
+import random
+import networkx as nx
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
+from lib.interest_prediction import InterestPredictor, SPARSE_ENGINE, NETWORKX_ENGINE
+
+# Run with the following command:
+# pytest ServicesService/api_container/tests/test_interest_prediction.py
+
+@pytest.fixture(scope='function')
+def reviews():
+    rng = random.Random(0)
+    reviews = [(f"U{rng.randrange(40)}", f"S{rng.randrange(60)}") for _ in range(120)]
+    # Services only reachable far away from the users and an unreachable component
+    return reviews + [("U0", "S0"), ("U_far", "S0"), ("U_far", "S_far"), ("U_alone", "S_alone")]
+
+@pytest.mark.parametrize("user_id", ["U0", "U1", "U_far", "U_alone"])
+def test_sparse_engine_matches_networkx(reviews, user_id):
+    sparse_predictions = InterestPredictor(reviews, user_id, engine=SPARSE_ENGINE).get_interest_prediction()
+    networkx_predictions = InterestPredictor(reviews, user_id, engine=NETWORKX_ENGINE).get_interest_prediction()
+    assert list(sparse_predictions) == list(networkx_predictions)
+    for service, score in networkx_predictions.items():
+        assert sparse_predictions[service] == pytest.approx(score)
+
+def test_excludes_reviewed_services(reviews):
+    predictions = InterestPredictor(reviews, "U_far").get_interest_prediction()
+    assert "S0" not in predictions and "S_far" not in predictions
+
+@pytest.mark.parametrize("engine", [SPARSE_ENGINE, NETWORKX_ENGINE])
+def test_unknown_user(reviews, engine):
+    with pytest.raises(nx.NodeNotFound):
+        InterestPredictor(reviews, "U_unknown", engine=engine).get_interest_prediction()
+
+def test_empty_reviews():
+    assert InterestPredictor([], "U0").get_interest_prediction() == {}
+
+def test_invalid_engine():
+    with pytest.raises(ValueError):
+        InterestPredictor([], "U0", engine="invalid")
@@ -0,0 +1,58 @@
+import pytest
+import mongomock
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
+from mobile_token_nosql import MobileToken, send_notifications
+
+# Run with the following command:
+# pytest ServicesService/api_container/tests/test_mobile_token_nosql.py
+
+# Set the TESTING environment variable
+os.environ['TESTING'] = '1'
+os.environ['MONGOMOCK'] = '1'
+
+# Set a default MONGO_TEST_DB for testing
+os.environ['MONGO_TEST_DB'] = 'test_db'
+
+@pytest.fixture(scope='function')
+def mongo_client():
+    client = mongomock.MongoClient()
+    yield client
+    client.drop_database(os.getenv('MONGO_TEST_DB'))
+    client.close()
+
+@pytest.fixture(scope='function')
+def mobile_tokens(mongo_client):
+    return MobileToken(test_client=mongo_client)
+
+def test_send_notification_creates_user(mobile_tokens):
+    send_notifications(mobile_tokens, [('user_1', 'Title', 'Message')])
+    doc = mobile_tokens.notifications.find_one({'user_id': 'user_1'})
+    assert [(n['title'], n['message']) for n in doc['notifications']] == [('Title', 'Message')]
+    assert doc['created_at'] == doc['notifications'][0]['created_at']
+
+def test_send_notification_appends(mobile_tokens):
+    send_notifications(mobile_tokens, [('user_1', 'Title 1', 'Message 1')])
+    created_at = mobile_tokens.notifications.find_one({'user_id': 'user_1'})['created_at']
+    send_notifications(mobile_tokens, [('user_1', 'Title 2', 'Message 2')])
+    doc = mobile_tokens.notifications.find_one({'user_id': 'user_1'})
+    assert [n['title'] for n in doc['notifications']] == ['Title 1', 'Title 2']
+    assert doc['created_at'] == created_at
+    assert mobile_tokens.notifications.count_documents({}) == 1
+
+def test_send_notification_keeps_newest(mongo_client):
+    mobile_tokens = MobileToken(test_client=mongo_client, max_notifications=2)
+    for i in range(3):
+        send_notifications(mobile_tokens, [('user_1', f'Title {i}', 'Message')])
+    doc = mobile_tokens.notifications.find_one({'user_id': 'user_1'})
+    assert [n['title'] for n in doc['notifications']] == ['Title 1', 'Title 2']
+
+def test_save_notifications_keeps_newest(mongo_client):
+    mobile_tokens = MobileToken(test_client=mongo_client, max_notifications=2)
+    send_notifications(mobile_tokens, [('user_1', 'Title 0', 'Message')])
+    mobile_tokens.save_notifications([('user_1', 'Title 1', 'Message'), ('user_2', 'Title 2', 'Message'), ('user_1', 'Title 3', 'Message')])
+    assert [n['title'] for n in mobile_tokens.notifications.find_one({'user_id': 'user_1'})['notifications']] == ['Title 1', 'Title 3']
+    assert [n['title'] for n in mobile_tokens.notifications.find_one({'user_id': 'user_2'})['notifications']] == ['Title 2']
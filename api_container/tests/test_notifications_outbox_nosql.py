@@ -0,0 +1,118 @@
+import pytest
+import mongomock
+import threading
+import time
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
+from notifications_outbox_nosql import NotificationsOutbox, drain_outbox, PENDING, PROCESSING, DEAD
+from mobile_token_nosql import MobileToken
+
+# Run with the following command:
+# pytest ServicesService/api_container/tests/test_notifications_outbox_nosql.py
+
+# Set the TESTING environment variable
+os.environ['TESTING'] = '1'
+os.environ['MONGOMOCK'] = '1'
+
+# Set a default MONGO_TEST_DB for testing
+os.environ['MONGO_TEST_DB'] = 'test_db'
+
+@pytest.fixture(scope='function')
+def mongo_client():
+    client = mongomock.MongoClient()
+    yield client
+    client.drop_database(os.getenv('MONGO_TEST_DB'))
+    client.close()
+
+@pytest.fixture(scope='function')
+def outbox(mongo_client):
+    return NotificationsOutbox(test_client=mongo_client)
+
+@pytest.fixture(scope='function')
+def mobile_tokens(mongo_client):
+    return MobileToken(test_client=mongo_client)
+
+def _titles(mobile_tokens, user_id):
+    doc = mobile_tokens.notifications.find_one({'user_id': user_id}) or {'notifications': []}
+    return [notification['title'] for notification in doc['notifications']]
+
+def test_enqueue(outbox):
+    assert outbox.enqueue([('user_1', 'Title 1', 'Message'), ('user_2', 'Title 2', 'Message')])
+    assert outbox.collection.count_documents({'status': PENDING, 'attempts': 0}) == 2
+    assert outbox.enqueue([])
+
+def test_claim_leases_the_batch(outbox):
+    outbox.enqueue([(f'user_{i}', 'Title', 'Message') for i in range(3)])
+    batch = outbox.claim(batch_size=2)
+    assert len(batch) == 2
+    assert all(notification['status'] == PROCESSING for notification in batch)
+    assert len(outbox.claim(batch_size=2)) == 1
+    assert outbox.claim(batch_size=2) == []
+
+def test_claim_expired_lease(outbox):
+    outbox.enqueue([('user_1', 'Title', 'Message')])
+    first = outbox.claim(lease_time=0)
+    second = outbox.claim()
+    assert [notification['_id'] for notification in second] == [first[0]['_id']]
+    assert second[0]['claim_id'] != first[0]['claim_id']
+
+def test_fail_retries_later(outbox):
+    outbox.enqueue([('user_1', 'Title', 'Message')])
+    assert outbox.fail(outbox.claim(), 'Error') == 0
+    notification = outbox.collection.find_one({})
+    assert notification['status'] == PENDING
+    assert notification['attempts'] == 1
+    assert notification['available_at'] > time.time()
+    assert outbox.claim() == []
+
+def test_fail_dead_letters(outbox):
+    outbox.enqueue([('user_1', 'Title', 'Message')])
+    for _ in range(2):
+        dead = outbox.fail(outbox.claim(), 'Error', max_attempts=2, retry_delay=0)
+    assert dead == 1
+    assert outbox.collection.find_one({})['status'] == DEAD
+    assert outbox.claim() == []
+    assert outbox.requeue_dead() == 1
+    assert len(outbox.claim()) == 1
+
+def test_stats(outbox):
+    outbox.enqueue([(f'user_{i}', 'Title', 'Message') for i in range(3)])
+    outbox.claim(batch_size=1)
+    stats = outbox.stats()
+    assert (stats[PENDING], stats[PROCESSING], stats[DEAD], stats['available']) == (2, 1, 0, 2)
+    assert stats['oldest'] is not None
+
+def test_drain_outbox(outbox, mobile_tokens):
+    outbox.enqueue([('user_1', f'Title {i}', 'Message') for i in range(5)] + [('user_2', 'Title', 'Message')])
+    assert drain_outbox(outbox, mobile_tokens, workers=2, batch_size=2) == 6
+    assert sorted(_titles(mobile_tokens, 'user_1')) == [f'Title {i}' for i in range(5)]
+    assert _titles(mobile_tokens, 'user_2') == ['Title']
+    assert outbox.collection.count_documents({}) == 0
+
+def test_drain_outbox_delivers_batches_at_the_same_time(outbox, mobile_tokens, mocker):
+    outbox.enqueue([(f'user_{i}', 'Title', 'Message') for i in range(6)])
+    # Every delivery waits for the other two batches of the round
+    barrier = threading.Barrier(3)
+    save_notifications = mobile_tokens.save_notifications
+
+    def save_together(*args, **kwargs):
+        barrier.wait(timeout=5)
+        return save_notifications(*args, **kwargs)
+
+    mocker.patch.object(mobile_tokens, 'save_notifications', side_effect=save_together)
+    claim = mocker.spy(outbox, 'claim')
+    assert drain_outbox(outbox, mobile_tokens, workers=3, batch_size=2) == 6
+    assert mobile_tokens.save_notifications.call_count == 3
+    assert claim.call_count == 2
+    assert outbox.collection.count_documents({}) == 0
+
+def test_drain_outbox_keeps_failed(outbox, mobile_tokens, mocker):
+    outbox.enqueue([('user_1', 'Title', 'Message')])
+    mocker.patch.object(mobile_tokens, 'save_notifications', side_effect=Exception("Notifications unavailable"))
+    assert drain_outbox(outbox, mobile_tokens) == 0
+    notification = outbox.collection.find_one({})
+    assert (notification['status'], notification['attempts']) == (PENDING, 1)
+    assert notification['last_error'] == "Notifications unavailable"
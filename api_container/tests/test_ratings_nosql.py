@@ -8,6 +8,7 @@ from dotenv import load_dotenv
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
 from ratings_nosql import Ratings
+from lib.utils import get_time_past_days
 
 # Run with the following command:
 # pytest ServicesService/api_container/tests/test_ratings_nosql.py
@@ -96,4 +97,24 @@ def test_update_rating(ratings, mocker):
     rating = ratings.get('service-uuid', 'user-uuid')
     assert rating['rating'] == 4
     assert rating['comment'] == 'Good service!'
-    assert rating['service_uuid'] == 'service-uuid'
\ No newline at end of file
+    assert rating['service_uuid'] == 'service-uuid'
+
+def test_get_recent_of_services(ratings, mongo_client):
+    services = mongo_client[os.getenv('MONGO_TEST_DB')]['services']
+    services.insert_many([{'uuid': 'service-1', 'provider_id': 'provider-1'},
+                          {'uuid': 'service-2', 'provider_id': 'provider-2'},
+                          {'uuid': 'service-3', 'provider_id': 'provider-3'}])
+    ratings.insert('service-1', 5, None, 'user-1')
+    ratings.insert('service-1', 1, None, 'user-2')
+    old_rating = ratings.insert('service-2', 4, None, 'user-1')
+    ratings.collection.update_one({'uuid': old_rating}, {'$set': {'updated_at': get_time_past_days(100)}})
+    ratings.insert('service-3', 4, None, 'user-3')
+
+    services_pipeline = [{'$match': {'uuid': {'$in': ['service-1', 'service-2']}}}, {'$project': {'_id': 0, 'uuid': 1, 'provider_id': 1}}]
+    recent = ratings.get_recent_of_services(30, services_pipeline, ['provider_id'])
+    assert recent == [{'user_uuid': 'user-1', 'service_uuid': 'service-1', 'rating': 5, 'provider_id': 'provider-1'}]
+
+def test_insert_second_rating_of_user(ratings):
+    assert ratings.insert('service-uuid', 5, None, 'user-uuid') is not None
+    assert ratings.insert('service-uuid', 3, None, 'user-uuid') is None
+    assert ratings.insert('other-service-uuid', 3, None, 'user-uuid') is not None
@@ -0,0 +1,93 @@
+import pytest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
+from lib.region_cache import RegionCache, ServicesUpdatesFeed
+
+# Run with the following command:
+# pytest ServicesService/api_container/tests/test_region_cache.py
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture(scope='function')
+def clock():
+    return FakeClock()
+
+@pytest.fixture(scope='function')
+def cache(clock):
+    return RegionCache(max_entries=2, ttl=60, clock=clock)
+
+def test_get_after_set(cache):
+    assert cache.get(('1:1', 90, 0)) is None
+    cache.set(('1:1', 90, 0), 'graph', ['S1', 'S2'])
+    assert cache.get(('1:1', 90, 0)) == 'graph'
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+def test_keys_do_not_collide(cache):
+    cache.set(('1:1', 90, 0), 'graph', ['S1'])
+    assert cache.get(('1:1', 90, 1)) is None
+    assert cache.get(('1:2', 90, 0)) is None
+
+def test_entries_expire(cache, clock):
+    cache.set('key', 'graph', ['S1'])
+    clock.now = 60
+    assert cache.get('key') is None
+    assert cache.stats()['size'] == 0
+
+def test_invalidate_service_only_removes_entries_with_the_service(cache):
+    cache.set('key_1', 'graph_1', ['S1', 'S2'])
+    cache.set('key_2', 'graph_2', ['S3'])
+    assert cache.invalidate_service('S2') == 1
+    assert cache.get('key_1') is None
+    assert cache.get('key_2') == 'graph_2'
+    assert cache.invalidate_service('S2') == 0
+
+def test_least_recently_used_is_evicted(cache):
+    cache.set('key_1', 'graph_1', ['S1'])
+    cache.set('key_2', 'graph_2', ['S1'])
+    cache.get('key_1')
+    cache.set('key_3', 'graph_3', ['S1'])
+    assert cache.get('key_2') is None
+    assert cache.get('key_1') == 'graph_1'
+    assert cache.invalidate_service('S1') == 2
+
+def test_set_replaces_services(cache):
+    cache.set('key', 'graph', ['S1'])
+    cache.set('key', 'new_graph', ['S2'])
+    assert cache.invalidate_service('S1') == 0
+    assert cache.get('key') == 'new_graph'
+
+def test_updates_feed_invalidates_services_updated_elsewhere(cache, clock):
+    updates = []
+    feed = ServicesUpdatesFeed([cache], lambda since: [update for update in updates if update[1] >= since], '2023-01-01 00:00:00', interval=5, clock=clock)
+    cache.set('key_1', 'graph_1', ['S1'])
+    cache.set('key_2', 'graph_2', ['S2'])
+    updates.append(('S1', '2023-01-01 00:00:01'))
+    assert feed.sync() == 1
+    assert cache.get('key_1') is None
+    assert cache.get('key_2') == 'graph_2'
+
+    # Polled at most every interval seconds, unless forced
+    updates.append(('S2', '2023-01-01 00:00:01'))
+    assert feed.sync() == 0
+    assert feed.sync(force=True) == 1
+    assert cache.get('key_2') is None
+
+def test_updates_feed_skips_services_already_seen(cache, clock):
+    updates = [('S1', '2023-01-01 00:00:01')]
+    feed = ServicesUpdatesFeed([cache], lambda since: [update for update in updates if update[1] >= since], '2023-01-01 00:00:00', interval=0, clock=clock)
+    assert feed.sync() == 1
+    cache.set('key', 'graph', ['S1'])
+    assert feed.sync() == 0
+    assert cache.get('key') == 'graph'
+    updates.append(('S1', '2023-01-01 00:00:02'))
+    assert feed.sync() == 1
+    assert cache.get('key') is None
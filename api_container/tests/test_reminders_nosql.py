@@ -7,7 +7,8 @@ from dotenv import load_dotenv
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
-from reminders_nosql import Reminders
+from reminders_nosql import Reminders, build_reminders, dispatch_due_reminders
+from mobile_token_nosql import MobileToken
 
 # Run with the following command:
 # pytest ServicesService/api_container/tests/test_reminders_nosql.py
@@ -74,4 +75,86 @@ def test_delete_rental_reminders(reminders):
     assert len(reminders.get_reminders('2021-01-02')) == 1
     reminders.delete_rental_reminders('rental_3')
     assert len(reminders.get_reminders('2021-01-01')) == 1
-    assert reminders.get_reminders('2021-01-02') is None
\ No newline at end of file
+    assert reminders.get_reminders('2021-01-02') is None
+
+def test_add_reminders(reminders):
+    reminders.add_reminder('2021-01-01', 'user_1', 'Test Title', 'Test Description', 'rental_1')
+    assert reminders.add_reminders([
+        ('2021-01-01', {'rental_id': 'rental_2', 'user_id': 'user_2', 'title': 'Title 2', 'description': 'Description 2'}),
+        ('2021-01-02', {'rental_id': 'rental_2', 'user_id': 'user_2', 'title': 'Title 3', 'description': 'Description 3'}),
+        ('2021-01-01', {'rental_id': 'rental_3', 'user_id': 'user_3', 'title': 'Title 4', 'description': 'Description 4'})
+    ])
+    assert [reminder['rental_id'] for reminder in reminders.get_reminders('2021-01-01')] == ['rental_1', 'rental_2', 'rental_3']
+    assert len(reminders.get_reminders('2021-01-02')) == 1
+    assert reminders.add_reminders([])
+
+def test_build_reminders():
+    reminders = build_reminders('2999-01-10', 'user_1', 'Cleaning', 'rental_1')
+    assert [date for date, _ in reminders] == ['2999-01-03', '2999-01-09', '2999-01-10']
+    assert all(reminder['rental_id'] == 'rental_1' and reminder['user_id'] == 'user_1' for _, reminder in reminders)
+    assert reminders[2][1]['description'] == "Your rental of Cleaning is today"
+    assert [date for date, _ in build_reminders('2000-01-10', 'user_1', 'Cleaning', 'rental_1')] == ['2000-01-10']
+
+def _reminder(rental_id):
+    return {'rental_id': rental_id, 'user_id': 'user_1', 'title': 'Title', 'description': 'Description'}
+
+def test_reminders_are_split_in_buckets(reminders, mocker):
+    mocker.patch('reminders_nosql.REMINDERS_BUCKET_SIZE', 3)
+    for i in range(4):
+        assert reminders.add_reminder('2021-01-01', 'user_1', 'Title', 'Description', f'rental_{i}')
+    assert reminders.add_reminders([('2021-01-01', _reminder(f'rental_{i}')) for i in range(4, 9)])
+    buckets = list(reminders.collection.find({'date': '2021-01-01'}))
+    assert all(len(bucket['reminders']) <= 3 and bucket['count'] == len(bucket['reminders']) for bucket in buckets)
+    assert sorted(reminder['rental_id'] for reminder in reminders.get_reminders('2021-01-01')) == [f'rental_{i}' for i in range(9)]
+    assert reminders.delete_date('2021-01-01')
+    assert reminders.get_reminders('2021-01-01') is None
+
+def test_legacy_unique_date_index_is_dropped(mongo_client):
+    mongo_client[os.getenv('MONGO_TEST_DB')]['reminders'].create_index('date', unique=True)
+    reminders = Reminders(test_client=mongo_client)
+    assert 'date_1' not in reminders.collection.index_information()
+
+def test_delete_rental_reminders_frees_bucket_room(reminders, mocker):
+    mocker.patch('reminders_nosql.REMINDERS_BUCKET_SIZE', 2)
+    reminders.add_reminders([('2021-01-01', _reminder('rental_1')), ('2021-01-01', _reminder('rental_2'))])
+    reminders.add_reminder('2021-01-02', 'user_1', 'Title', 'Description', 'rental_2')
+    assert reminders.delete_rental_reminders('rental_1')
+    assert reminders.collection.find_one({'date': '2021-01-01'})['count'] == 1
+    reminders.add_reminder('2021-01-01', 'user_1', 'Title', 'Description', 'rental_3')
+    assert reminders.collection.count_documents({'date': '2021-01-01'}) == 1
+    assert not reminders.delete_rental_reminders('rental_unknown')
+
+@pytest.fixture(scope='function')
+def mobile_tokens(mongo_client):
+    return MobileToken(test_client=mongo_client)
+
+def test_dispatch_due_reminders(reminders, mobile_tokens, mocker):
+    mocker.patch('reminders_nosql.REMINDERS_BUCKET_SIZE', 2)
+    reminders.add_reminders([('2021-01-01', _reminder('rental_1')), ('2021-01-01', _reminder('rental_2')),
+                             ('2021-01-01', {**_reminder('rental_3'), 'user_id': 'user_2'})])
+    # Missed day and future day
+    reminders.add_reminder('2020-12-31', 'user_2', 'Title', 'Description', 'rental_4')
+    reminders.add_reminder('2021-01-02', 'user_1', 'Title', 'Description', 'rental_5')
+
+    assert dispatch_due_reminders(reminders, mobile_tokens, '2021-01-01', workers=2) == 3
+    assert len(mobile_tokens.notifications.find_one({'user_id': 'user_1'})['notifications']) == 2
+    assert len(mobile_tokens.notifications.find_one({'user_id': 'user_2'})['notifications']) == 1
+    assert reminders.get_reminders('2021-01-01') is None and reminders.get_reminders('2020-12-31') is None
+    assert len(reminders.get_reminders('2021-01-02')) == 1
+
+    # Already sent reminders are not sent again
+    assert dispatch_due_reminders(reminders, mobile_tokens, '2021-01-01') == 0
+    assert len(mobile_tokens.notifications.find_one({'user_id': 'user_1'})['notifications']) == 2
+
+def test_dispatch_keeps_failed_buckets(reminders, mobile_tokens, mocker):
+    reminders.add_reminder('2021-01-01', 'user_1', 'Title', 'Description', 'rental_1')
+    mocker.patch.object(mobile_tokens, 'save_notifications', side_effect=Exception("Notifications unavailable"))
+    assert dispatch_due_reminders(reminders, mobile_tokens, '2021-01-01') == 0
+    assert len(reminders.get_reminders('2021-01-01')) == 1
+
+def test_dispatch_drops_past_reminders(reminders, mobile_tokens):
+    # e.g. a same day rental booked after the run of its day, or the process was down
+    reminders.add_reminders(build_reminders('2021-01-01', 'user_1', 'Cleaning', 'rental_1'))
+    assert dispatch_due_reminders(reminders, mobile_tokens, '2021-01-02') == 0
+    assert mobile_tokens.notifications.find_one({'user_id': 'user_1'}) is None
+    assert reminders.collection.count_documents({}) == 0
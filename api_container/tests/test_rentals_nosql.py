@@ -1,5 +1,6 @@
 import pytest
 import mongomock
+import random
 from unittest.mock import patch
 import sys
 import os
@@ -324,4 +325,121 @@ def test_finished_rentals(rentals, mocker):
         status='PENDING'
     )
     finished = rentals.finished_rentals(provider_id='test_provider')
-    assert finished == 1
\ No newline at end of file
+    assert finished == 1
+
+def _expected_hiring_report(rentals, months, years):
+    def breakdown(selected):
+        finished = sum(1 for rental in selected if rental['status'] == 'FINISHED')
+        percentage = finished / len(selected) * 100 if selected else 0
+        return {'total': len(selected), 'percentage_finished': f"{percentage:.2f}%"}
+    return {
+        'total_rentals': len(rentals),
+        'finished_rentals': sum(1 for rental in rentals if rental['status'] == 'FINISHED'),
+        'breakdown_by_status': {status: sum(1 for rental in rentals if rental['status'] == status)
+                                for status in ['PENDING', 'ACCEPTED', 'REJECTED', 'CANCELLED', 'FINISHED']},
+        'breakdown_by_month': {month: breakdown([rental for rental in rentals if rental['date'].startswith(month)]) for month in months},
+        'breakdown_by_year': {year: breakdown([rental for rental in rentals if rental['date'].startswith(year)]) for year in years}
+    }
+
+def test_get_hiring_report(rentals, mocker):
+    mocker.patch('rentals_nosql.get_actual_time', return_value='2024-03-15 12:00:00')
+    rng = random.Random(0)
+    inserted = []
+    for _ in range(200):
+        rental = {
+            'date': f"{rng.choice([2021, 2022, 2023, 2024])}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 10:00:00",
+            'status': rng.choice(['PENDING', 'ACCEPTED', 'REJECTED', 'CANCELLED', 'FINISHED'])
+        }
+        inserted.append(rental)
+        rentals.insert(service_id='test_service', provider_id='test_provider', client_id='test_client', date=rental['date'],
+                       estimated_duration=None, location={'latitude': 0, 'longitude': 0}, status=rental['status'])
+    rentals.insert(service_id='other_service', provider_id='other_provider', client_id='test_client', date='2019-01-01 10:00:00',
+                   estimated_duration=None, location={'latitude': 0, 'longitude': 0}, status='FINISHED')
+
+    months = ['2024-03', '2024-02', '2024-01'] + [f"2023-{month:02d}" for month in range(12, 3, -1)]
+    report = rentals.get_hiring_report('test_provider')
+    assert report == _expected_hiring_report(inserted, months, ['2021', '2022', '2023', '2024'])
+    assert list(report['breakdown_by_month']) == months
+    # Computed from the rentals while the rollup is not seeded
+    rentals.stats_seeded = False
+    assert rentals.get_hiring_report('test_provider') == report
+    assert rentals.total_rentals('test_provider') == 200
+
+def test_get_hiring_report_without_rentals(rentals):
+    assert rentals.get_hiring_report('test_provider') is None
+    rentals.stats_seeded = False
+    assert rentals.get_hiring_report('test_provider') is None
+
+def _insert_rental(rentals, date, status, provider_id='test_provider'):
+    return rentals.insert(service_id='test_service', provider_id=provider_id, client_id='test_client', date=date,
+                          estimated_duration=None, location={'latitude': 0, 'longitude': 0}, status=status)
+
+def test_rental_stats_follow_writes(rentals):
+    first = _insert_rental(rentals, '2024-01-10 10:00:00', 'PENDING')
+    second = _insert_rental(rentals, '2024-01-20 10:00:00', 'PENDING')
+    _insert_rental(rentals, '2024-02-01 10:00:00', 'FINISHED')
+    rentals.update_status(first, 'FINISHED')
+    rentals.update_status(first, 'FINISHED')
+    rentals.delete(second)
+
+    stats = {entry['month']: entry for entry in rentals.stats.find({'provider_id': 'test_provider'})}
+    assert stats['2024-01']['total'] == 1
+    assert stats['2024-01']['by_status'] == {'PENDING': 0, 'FINISHED': 1}
+    assert stats['2024-02']['total'] == 1
+    assert rentals.total_rentals('test_provider') == 2
+    assert rentals.finished_rentals('test_provider') == 2
+    assert rentals.check_stats() == []
+
+def test_rental_stats_rebuild(rentals):
+    _insert_rental(rentals, '2024-01-10 10:00:00', 'PENDING')
+    _insert_rental(rentals, '2024-01-11 10:00:00', 'FINISHED', provider_id='other_provider')
+    rentals.collection.insert_one({'uuid': 'untracked', 'provider_id': 'test_provider', 'date': '2024-03-01 10:00:00', 'status': 'ACCEPTED'})
+    rentals.stats.update_one({'provider_id': 'other_provider'}, {'$inc': {'total': 5}})
+
+    mismatches = rentals.check_stats()
+    assert [(mismatch['provider_id'], mismatch['month']) for mismatch in mismatches] == [('other_provider', '2024-01'), ('test_provider', '2024-03')]
+    assert mismatches[1]['expected'] == {'total': 1, 'by_status': {'ACCEPTED': 1}}
+    assert len(rentals.check_stats('test_provider')) == 1
+
+    assert rentals.rebuild_stats() == 3
+    assert rentals.check_stats() == []
+    assert rentals.total_rentals('test_provider') == 2
+
+def test_rental_stats_rebuild_keeps_existing_entries(rentals):
+    _insert_rental(rentals, '2024-01-10 10:00:00', 'PENDING')
+    rentals.stats.insert_one({'provider_id': 'gone_provider', 'month': '2023-12', 'total': 1, 'by_status': {'PENDING': 1}})
+    rentals.stats.update_one({'provider_id': 'test_provider'}, {'$set': {'total': 7}})
+    assert rentals.rebuild_stats() == 1
+    assert rentals.check_stats() == []
+    assert rentals.stats.count_documents({}) == 1
+    # A rental written after the rebuild is added to the same entry
+    _insert_rental(rentals, '2024-01-11 10:00:00', 'PENDING')
+    assert rentals.total_rentals('test_provider') == 2
+
+def test_rental_stats_seeded_on_start(mongo_client):
+    collection = mongo_client[os.getenv('MONGO_TEST_DB')]['rentals']
+    collection.create_index([('provider_id', 1)])
+    collection.insert_many([
+        {'uuid': 'first', 'provider_id': 'test_provider', 'date': '2024-01-10 10:00:00', 'status': 'FINISHED'},
+        {'uuid': 'second', 'provider_id': 'test_provider', 'date': '2024-02-10 10:00:00', 'status': 'PENDING'}
+    ])
+    rentals = Rentals(test_client=mongo_client)
+    assert rentals.stats_seeded
+    assert rentals.total_rentals('test_provider') == 2
+    assert rentals.finished_rentals('test_provider') == 1
+    assert 'provider_id_1' not in rentals.collection.index_information()
+
+def test_insert_many(rentals):
+    dates = ['2024-01-10 10:00:00', '2024-01-17 10:00:00', '2024-02-01 10:00:00']
+    uuids = rentals.insert_many('test_service', 'test_provider', 'test_client', dates, 60, {'latitude': 0, 'longitude': 0}, 'PENDING')
+    assert len(uuids) == 3
+    assert [rentals.get(uuid)['date'] for uuid in uuids] == dates
+    assert rentals.total_rentals('test_provider') == 3
+    assert rentals.check_stats() == []
+
+def test_insert_many_error_keeps_no_rental(rentals, mocker):
+    mocker.patch('rentals_nosql.uuid.uuid4', return_value='same-uuid')
+    assert rentals.insert_many('test_service', 'test_provider', 'test_client', ['2024-01-10 10:00:00', '2024-01-17 10:00:00'],
+                               60, {'latitude': 0, 'longitude': 0}, 'PENDING') is None
+    assert rentals.collection.count_documents({}) == 0
+    assert rentals.total_rentals('test_provider') == 0
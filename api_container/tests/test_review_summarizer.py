@@ -0,0 +1,111 @@
+import pytest
+import random
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
+from lib.review_summarizer import sum_all, prepare_inputs, prepare_pairs, split_chunks, HEADER_TEXT, SPECIAL_TOKENS
+
+# Run with the following command:
+# pytest ServicesService/api_container/tests/test_review_summarizer.py
+
+class WordsSummarizer:
+    """
+    Counts a token per word, summarizes a text to its first words.
+    """
+    def __init__(self, max_input_tokens=60):
+        self.max_input_tokens = max_input_tokens
+        self.summarized = []
+
+    def count_tokens(self, texts):
+        return [len(text.split()) for text in texts]
+
+    def summarize(self, texts):
+        self.summarized.extend(texts)
+        return [" ".join(text.split()[4:9]) for text in texts]
+
+class LongSummarizer(WordsSummarizer):
+    """
+    Summarizes a text to all its words but the header, two summaries never fit together.
+    """
+    def summarize(self, texts):
+        self.summarized.extend(texts)
+        return [" ".join(text.split()[4:]) for text in texts]
+
+@pytest.fixture(scope='function')
+def reviews():
+    rng = random.Random(0)
+    return [" ".join(f"r{i}w{rng.randrange(100)}" for _ in range(rng.randrange(3, 12))) for i in range(40)]
+
+def test_split_chunks_respects_max_tokens():
+    tokens = {"a": 3, "b": 3, "c": 3, "d": 3, "e": 10}
+    chunks = split_chunks(list(tokens), list(tokens.values()), max_tokens=8)
+    assert [text for chunk in chunks for text in chunk] == list(tokens)
+    # A text longer than the limit goes alone (it is truncated by the model)
+    assert all(sum(tokens[text] + 1 for text in chunk) <= 8 or len(chunk) == 1 for chunk in chunks)
+    assert ["e"] in chunks
+
+def test_prepare_inputs_counts_tokens(reviews):
+    summarizer = WordsSummarizer()
+    inputs = prepare_inputs(reviews, "Plumbing", summarizer)
+    header = HEADER_TEXT.replace("<NAME>", "Plumbing")
+    assert all(text.startswith(header) for text in inputs)
+    # Each review once, in order, no longer tripled or shuffled
+    assert [line for text in inputs for line in text[len(header):].splitlines()] == reviews
+    for text in inputs:
+        lines = text[len(header):].splitlines()
+        assert len(lines) == 1 or sum(len(line.split()) + 1 for line in lines) <= 60 - len(header.split()) - SPECIAL_TOKENS
+
+def test_sum_all_single_chunk():
+    summarizer = WordsSummarizer()
+    summary, chunks = sum_all(["good", "very good"], "Plumbing", summarizer)
+    assert len(summarizer.summarized) == 1
+    assert list(chunks.values()) == [summary]
+
+def test_sum_all_empty():
+    assert sum_all([], "Plumbing", WordsSummarizer()) == ("", {})
+
+def test_sum_all_reuses_cached_chunks(reviews):
+    summarizer = WordsSummarizer()
+    summary, chunks = sum_all(reviews, "Plumbing", summarizer)
+    assert len(summarizer.summarized) > 2
+    assert len(chunks) == len(summarizer.summarized)
+
+    again = WordsSummarizer()
+    assert sum_all(reviews, "Plumbing", again, chunks) == (summary, chunks)
+    assert again.summarized == []
+
+    # A new review only changes the last chunk of reviews (and the reduce levels above it)
+    added = WordsSummarizer()
+    _, added_chunks = sum_all(reviews + ["r40w1 r40w2 r40w3"], "Plumbing", added, chunks)
+    added_inputs = prepare_inputs(reviews + ["r40w1 r40w2 r40w3"], "Plumbing", added)
+    assert [text for text in added.summarized if text in added_inputs] == [added_inputs[-1]]
+    assert len(added.summarized) < len(summarizer.summarized)
+    assert len(added_chunks) == len(chunks)
+
+def test_sum_all_edit_resynchronizes(reviews):
+    summarizer = WordsSummarizer()
+    _, chunks = sum_all(reviews, "Plumbing", summarizer)
+    edited = reviews[:5] + ["r5w0 edited"] + reviews[6:]
+    again = WordsSummarizer()
+    sum_all(edited, "Plumbing", again, chunks)
+    map_inputs = prepare_inputs(reviews, "Plumbing", again)
+    edited_inputs = prepare_inputs(edited, "Plumbing", again)
+    # The chunks after the edited one are found again
+    assert len(set(map_inputs) & set(edited_inputs)) >= len(map_inputs) - 2
+    assert len([text for text in again.summarized if text in edited_inputs]) <= 2
+
+def test_sum_all_long_summaries_fit_the_model(reviews):
+    summarizer = LongSummarizer()
+    summary, _ = sum_all(reviews, "Plumbing", summarizer)
+    assert summary
+    # Nothing is truncated by the model
+    assert all(len(text.split()) <= 60 - SPECIAL_TOKENS for text in summarizer.summarized)
+
+def test_prepare_pairs_truncates_evenly():
+    summarizer = WordsSummarizer()
+    pairs = prepare_pairs([" ".join(["word"] * 40)] * 3, "Plumbing", summarizer)
+    assert len(pairs) == 2
+    assert all(len(text.split()) <= 60 - SPECIAL_TOKENS for text in pairs)
+    assert len(pairs[0].splitlines()[1].split()) == len(pairs[0].splitlines()[2].split())
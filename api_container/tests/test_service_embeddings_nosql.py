@@ -0,0 +1,91 @@
+import pytest
+import mongomock
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
+from service_embeddings_nosql import ServiceEmbeddings, name_hash
+
+# Run with the following command:
+# pytest ServicesService/api_container/tests/test_service_embeddings_nosql.py
+
+# Set the TESTING environment variable
+os.environ['TESTING'] = '1'
+os.environ['MONGOMOCK'] = '1'
+
+# Set a default MONGO_TEST_DB for testing
+os.environ['MONGO_TEST_DB'] = 'test_db'
+
+MODEL = 'test-model'
+
+@pytest.fixture(scope='function')
+def mongo_client():
+    client = mongomock.MongoClient()
+    yield client
+    client.drop_database(os.getenv('MONGO_TEST_DB'))
+    client.close()
+
+@pytest.fixture(scope='function')
+def embeddings(mongo_client):
+    return ServiceEmbeddings(MODEL, test_client=mongo_client, max_entries=2)
+
+def _vector(seed):
+    vector = np.random.default_rng(seed).normal(size=8)
+    return vector / np.linalg.norm(vector)
+
+NAMES = {f'service_{i}': f'Service {i}' for i in range(1, 4)}
+
+def test_save_and_get_many(embeddings):
+    embeddings.save_many({'service_1': _vector(1), 'service_2': _vector(2)}, NAMES)
+    found = embeddings.get_many(NAMES)
+    assert set(found) == {'service_1', 'service_2'}
+    assert found['service_1'].dtype == np.float32
+    np.testing.assert_allclose(found['service_1'], _vector(1), rtol=1e-6)
+
+def test_get_many_from_the_collection(mongo_client, embeddings):
+    embeddings.save_many({'service_1': _vector(1)}, NAMES)
+    other_process = ServiceEmbeddings(MODEL, test_client=mongo_client)
+    np.testing.assert_array_equal(other_process.get_many({'service_1': 'Service 1'})['service_1'], embeddings.get_many({'service_1': 'Service 1'})['service_1'])
+    assert other_process.stats()['misses'] == 1
+    assert other_process.get_many({'service_1': 'Service 1'})
+    assert other_process.stats()['hits'] == 1
+
+def test_other_model_is_ignored(mongo_client, embeddings):
+    embeddings.save_many({'service_1': _vector(1)}, NAMES)
+    assert ServiceEmbeddings('other-model', test_client=mongo_client).get_many({'service_1': 'Service 1'}) == {}
+
+def test_lru_keeps_the_last_used(embeddings):
+    embeddings.save_many({'service_1': _vector(1), 'service_2': _vector(2)}, NAMES)
+    embeddings.get_many({'service_1': 'Service 1'})
+    embeddings.save_many({'service_3': _vector(3)}, NAMES)
+    assert list(embeddings._cache) == ['service_1', 'service_3']
+    assert set(embeddings.get_many(NAMES)) == {'service_1', 'service_2', 'service_3'}
+
+def test_update_replaces(embeddings):
+    embeddings.save_many({'service_1': _vector(1)}, NAMES)
+    embeddings.save_many({'service_1': _vector(2)}, {'service_1': 'Renamed'})
+    assert embeddings.collection.count_documents({}) == 1
+    np.testing.assert_allclose(embeddings.get_many({'service_1': 'Renamed'})['service_1'], _vector(2), rtol=1e-6)
+
+def test_delete(embeddings):
+    embeddings.save_many({'service_1': _vector(1)}, NAMES)
+    assert embeddings.delete('service_1')
+    assert embeddings.get_many({'service_1': 'Service 1'}) == {}
+    assert not embeddings.delete('service_1')
+
+def test_renamed_through_other_process(mongo_client, embeddings):
+    embeddings.save_many({'service_1': _vector(1)}, NAMES)
+    assert embeddings.get_many({'service_1': 'Service 1'})
+    other_process = ServiceEmbeddings(MODEL, test_client=mongo_client)
+    other_process.save_many({'service_1': _vector(2)}, {'service_1': 'Renamed'})
+    # The cached entry is of the old name, so the stored one is read
+    np.testing.assert_allclose(embeddings.get_many({'service_1': 'Renamed'})['service_1'], _vector(2), rtol=1e-6)
+    assert embeddings.get_many({'service_1': 'Service 1'}) == {}
+
+def test_get_all_has_the_name_hash(embeddings):
+    embeddings.save_many({'service_1': _vector(1)}, NAMES)
+    [(uuid, stored_hash, embedding)] = list(embeddings.get_all())
+    assert (uuid, stored_hash) == ('service_1', name_hash('Service 1'))
+    np.testing.assert_allclose(embedding, _vector(1), rtol=1e-6)
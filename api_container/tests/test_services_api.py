@@ -18,6 +18,7 @@ os.environ['MONGO_TEST_DB'] = 'test_db'
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
 from services_api import app, services_manager, ratings_manager, rentals_manager, additionals_manager, create_repetitions_list, get_actual_time
+from lib.region_cache import RegionCache, ServicesUpdatesFeed
 
 @pytest.fixture(scope='function')
 def test_app():
@@ -214,6 +215,32 @@ def test_search_no_results(test_app, mocker):
     assert response.status_code == 404
     assert response.json()['detail'] == "No results found"
 
+def test_search_pagination(test_app, mocker):
+    mocker.patch('services_api.get_actual_time', return_value='2023-01-01 00:00:00')
+    for i in range(3):
+        services_manager.insert(
+            estimated_duration=None,
+            service_name=f'Test Service {i}',
+            provider_id=f'test_user_{i}',
+            description=f'Test Description {i}',
+            category='Test Category',
+            price=100,
+            location={'latitude': 0, 'longitude': 0},
+            max_distance=100
+        )
+    response = test_app.get("/search?client_location=0,0&limit=2")
+    assert response.status_code == 200
+    assert len(response.json()['results']) == 2
+    assert response.json()['remaining_services'] == 1
+    cursor = response.json()['next_cursor']
+    response = test_app.get(f"/search?client_location=0,0&limit=2&cursor={cursor}")
+    assert response.status_code == 200
+    assert len(response.json()['results']) == 1
+    assert response.json()['remaining_services'] == 0
+    assert response.json()['next_cursor'] is None
+    response = test_app.get(f"/search?client_location=0,0&limit=2&search_mode=regex&cursor={cursor}")
+    assert response.status_code == 400
+
 def test_search_by_min_rating(test_app, mocker):
     mocker.patch('services_api.get_actual_time', return_value='2023-01-01 00:00:00')
     service_id = services_manager.insert(
@@ -664,4 +691,44 @@ def test_create_repetitions_list_monthly(test_app, mocker):
         '2023-01-01 00:05:35',
         '2023-02-01 00:05:35'
     ]
-    assert interval == expected_interval
\ No newline at end of file
+    assert interval == expected_interval
+
+def test_recommendations_cached_until_a_review(test_app, mocker):
+    # The caches of the app never keep entries under TESTING
+    ratings_graph_cache = RegionCache(ttl=600)
+    recommendations_cache = RegionCache(ttl=600)
+    mocker.patch('services_api.ratings_graph_cache', ratings_graph_cache)
+    mocker.patch('services_api.recommendations_cache', recommendations_cache)
+    mocker.patch('services_api.region_updates', ServicesUpdatesFeed(
+        [ratings_graph_cache], services_manager.updated_since, get_actual_time(), interval=600))
+    service_ids = [services_manager.insert(
+        service_name=f'Test Service {i}',
+        provider_id='test_provider',
+        description=None,
+        category='Test Category',
+        price=100,
+        location={'latitude': 0, 'longitude': 0},
+        max_distance=100
+    ) for i in range(3)]
+    ratings_manager.insert(service_ids[0], 5, None, 'user_a')
+    ratings_manager.insert(service_ids[0], 5, None, 'user_b')
+    ratings_manager.insert(service_ids[1], 5, None, 'user_b')
+
+    def recommended():
+        response = test_app.get("/recommendations/user_a?max_services=10&client_location=0,0")
+        assert response.status_code == 200
+        return {service for service, _ in response.json()['results']}
+
+    assert recommended() == {f'S{service_ids[1]}'}
+    assert recommended() == {f'S{service_ids[1]}'}
+    assert ratings_graph_cache.stats()['hits'] == 1
+    assert recommendations_cache.stats()['hits'] == 1
+
+    response = test_app.put(f"/{service_ids[2]}/reviews", json={'rating': 5, 'user_uuid': 'user_b'})
+    assert response.status_code == 200
+    assert recommended() == {f'S{service_ids[1]}', f'S{service_ids[2]}'}
+
+def test_index_stats_include_every_collection(test_app):
+    response = test_app.get("/stats/indexes")
+    assert response.status_code == 200
+    assert {'services', 'ratings', 'summary_jobs', 'summary_chunks'} <= set(response.json()['results'])
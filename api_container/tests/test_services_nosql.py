@@ -83,6 +83,23 @@ def test_delete_service(services, mocker):
     services = services.search(set(), client_location={'latitude': 0, 'longitude': 0}, uuid=service_id)
     assert services is None
 
+def test_delete_provider_services(services, mocker):
+    mocker.patch('services_nosql.get_actual_time', return_value='2023-01-01 00:00:00')
+    service_ids = [services.insert(
+        service_name=f'Plumbing {i}',
+        provider_id=provider_id,
+        description=None,
+        category='Repair',
+        price=100,
+        location={'latitude': 0, 'longitude': 0},
+        max_distance=100
+    ) for i, provider_id in enumerate(['provider_1', 'provider_1', 'provider_2'])]
+    assert len(services.text_search(['plumbing'])) == 3
+    assert sorted(services.delete_provider_services('provider_1')) == sorted(service_ids[:2])
+    assert [service['uuid'] for service in services.collection.find({})] == [service_ids[2]]
+    assert [uuid for uuid, _ in services.text_search(['plumbing'])] == [service_ids[2]]
+    assert services.delete_provider_services('provider_1') == []
+
 def test_update_service(services, mocker):
     mocker.patch('services_nosql.get_actual_time', return_value='2023-01-01 00:00:00')
     service_id = services.insert(
@@ -314,4 +331,292 @@ def test_ratings_by_provider(services, mocker):
     results = services.ratings_by_provider('test_user_1')
     print(results)
     assert results["count"] == 2
-    assert results['provider_id'] == 'test_user_1'
\ No newline at end of file
+    assert results['provider_id'] == 'test_user_1'
+
+def test_search_excludes_suspended_providers(services, mocker):
+    mocker.patch('services_nosql.get_actual_time', return_value='2023-01-01 00:00:00')
+    services.insert(
+        estimated_duration=None,
+        service_name='Test Service 1',
+        provider_id='test_user_1',
+        description='Test Description 1',
+        category='Test Category 1',
+        price=100,
+        location={'latitude': 0, 'longitude': 0},
+        max_distance=100
+    )
+    services.insert(
+        estimated_duration=None,
+        service_name='Test Service 2',
+        provider_id='test_user_2',
+        description='Test Description 2',
+        category='Test Category 2',
+        price=200,
+        location={'latitude': 0, 'longitude': 0},
+        max_distance=100
+    )
+    results = services.search({'test_user_1'}, client_location={'latitude': 0, 'longitude': 0})
+    assert len(results) == 1
+    assert results[0]['provider_id'] == 'test_user_2'
+    assert services.search({'test_user_1'}, client_location={'latitude': 0, 'longitude': 0}, provider_id='test_user_1') is None
+
+def test_search_pipeline_filters_inside_geo_near(services, mocker):
+    mocker.patch.dict(os.environ, {'MONGOMOCK': ''})
+    pipeline = services._build_search_pipeline({'test_user_3'}, client_location={'latitude': 0, 'longitude': 0}, keywords=['Test'],
+                                                min_price=50, max_price=150, hidden=False, category='Test Category 1')
+    geo_near_query = pipeline[0]['$geoNear']['query']
+    assert geo_near_query == {
+        'category': 'Test Category 1',
+        'provider_id': {'$nin': ['test_user_3']},
+        'price': {'$gte': 50, '$lte': 150},
+        'hidden': False
+    }
+    assert '$expr' in pipeline[1]['$match']
+    assert '$or' in pipeline[2]['$match']
+
+def test_search_uuids(services, mocker):
+    mocker.patch('services_nosql.get_actual_time', return_value='2023-01-01 00:00:00')
+    uuids = [services.insert(
+        estimated_duration=None,
+        service_name=f'Test Service {i}',
+        provider_id=f'test_user_{i}',
+        description=None,
+        category='Test Category',
+        price=100,
+        location={'latitude': 0, 'longitude': 0},
+        max_distance=100
+    ) for i in range(3)]
+    assert sorted(services.search_uuids({'test_user_0'}, client_location={'latitude': 0, 'longitude': 0})) == sorted(uuids[1:])
+    pipeline = services.search_fields_pipeline(set(), {'latitude': 0, 'longitude': 0}, ['uuid'])
+    assert pipeline[-1] == {'$project': {'_id': 0, 'uuid': 1}}
+
+def test_text_search_ranks_by_relevance(services, mocker):
+    mocker.patch('services_nosql.get_actual_time', return_value='2023-01-01 00:00:00')
+    services.insert(
+        estimated_duration=None,
+        service_name='Garden cleaning',
+        provider_id='test_user_1',
+        description='We clean gardens and patios',
+        category='Gardening',
+        price=100,
+        location={'latitude': 0, 'longitude': 0},
+        max_distance=100
+    )
+    services.insert(
+        estimated_duration=None,
+        service_name='House cleaning',
+        provider_id='test_user_2',
+        description='Cleaning of houses and apartments, deep cleaning included',
+        category='Cleaning',
+        price=200,
+        location={'latitude': 0, 'longitude': 0},
+        max_distance=100
+    )
+    services.insert(
+        estimated_duration=None,
+        service_name='Plumber',
+        provider_id='test_user_3',
+        description='Pipes repair',
+        category='Repair',
+        price=300,
+        location={'latitude': 0, 'longitude': 0},
+        max_distance=100
+    )
+    results = services.search(set(), client_location={'latitude': 0, 'longitude': 0}, keywords=['cleaning'], text_search=True)
+    assert [result['service_name'] for result in results] == ['House cleaning', 'Garden cleaning']
+    assert results[0]['text_score'] >= results[1]['text_score']
+
+    results = services.search(set(), client_location={'latitude': 0, 'longitude': 0}, keywords=['plumb'], text_search=True)
+    assert [result['service_name'] for result in results] == ['Plumber']
+
+    results = services.search(set(), client_location={'latitude': 0, 'longitude': 0}, keywords=['gardens'], category='Cleaning', text_search=True)
+    assert results is None
+
+def test_text_search_follows_updates_and_deletes(services, mocker):
+    mocker.patch('services_nosql.get_actual_time', return_value='2023-01-01 00:00:00')
+    service_id = services.insert(
+        estimated_duration=None,
+        service_name='Dog walking',
+        provider_id='test_user_1',
+        description='Walks around the park',
+        category='Petcare',
+        price=100,
+        location={'latitude': 0, 'longitude': 0},
+        max_distance=100
+    )
+    assert len(services.search(set(), client_location={'latitude': 0, 'longitude': 0}, keywords=['dog'], text_search=True)) == 1
+
+    services.update(service_id, {'service_name': 'Cat sitting'})
+    assert services.search(set(), client_location={'latitude': 0, 'longitude': 0}, keywords=['dog'], text_search=True) is None
+    assert len(services.search(set(), client_location={'latitude': 0, 'longitude': 0}, keywords=['cat'], text_search=True)) == 1
+
+    services.delete(service_id)
+    assert services.search(set(), client_location={'latitude': 0, 'longitude': 0}, keywords=['cat'], text_search=True) is None
+
+def test_search_page_keyset_pagination(services, mocker):
+    mocker.patch('services_nosql.get_actual_time', return_value='2023-01-01 00:00:00')
+    for i in range(5):
+        services.insert(
+            estimated_duration=None,
+            service_name=f'Test Service {i}',
+            provider_id=f'test_user_{i}',
+            description=f'Test Description {i}',
+            category='Test Category',
+            price=100,
+            location={'latitude': 0, 'longitude': 0},
+            max_distance=100
+        )
+    seen = []
+    after = None
+    for expected_remaining in [3, 1, 0]:
+        results, remaining = services.search_page(set(), client_location={'latitude': 0, 'longitude': 0}, limit=2, after=after)
+        assert remaining == expected_remaining
+        seen += [result['uuid'] for result in results]
+        after = services.search_sort_key(results[-1])
+    assert len(seen) == 5
+    assert seen == sorted(seen)
+
+def test_search_page_text_search(services, mocker):
+    mocker.patch('services_nosql.get_actual_time', return_value='2023-01-01 00:00:00')
+    for name in ['Cleaning', 'Deep cleaning', 'Window cleaning', 'Plumber']:
+        services.insert(
+            estimated_duration=None,
+            service_name=name,
+            provider_id='test_user',
+            description=None,
+            category='Test Category',
+            price=100,
+            location={'latitude': 0, 'longitude': 0},
+            max_distance=100
+        )
+    first_page, remaining = services.search_page(set(), client_location={'latitude': 0, 'longitude': 0}, limit=2, keywords=['cleaning'], text_search=True)
+    assert len(first_page) == 2
+    assert remaining == 1
+    second_page, remaining = services.search_page(set(), client_location={'latitude': 0, 'longitude': 0}, limit=2, after=services.search_sort_key(first_page[-1]), keywords=['cleaning'], text_search=True)
+    assert len(second_page) == 1
+    assert remaining == 0
+    assert first_page[0]['service_name'] == 'Cleaning'
+    assert {result['service_name'] for result in first_page + second_page} == {'Cleaning', 'Deep cleaning', 'Window cleaning'}
+
+def test_text_search_filters_before_ranking(services, mocker):
+    mocker.patch('services_nosql.get_actual_time', return_value='2023-01-01 00:00:00')
+    services.collection.insert_many([{
+        'uuid': f'cleaning-{i}',
+        'service_name': 'Cleaning',
+        'provider_id': 'test_user_1',
+        'description': 'Cleaning cleaning',
+        'category': 'Other',
+        'price': 100,
+        'hidden': False,
+        'avg_rating': 0,
+        'location': {'type': 'Point', 'coordinates': [0, 0]},
+        'max_distance': 100,
+        'updated_at': '2023-01-01 00:00:00'
+    } for i in range(1_100)])
+    services.insert(
+        estimated_duration=None,
+        service_name='Garden',
+        provider_id='test_user_2',
+        description='Garden maintenance, cleaning of leaves',
+        category='Gardening',
+        price=100,
+        location={'latitude': 0, 'longitude': 0},
+        max_distance=100
+    )
+    results = services.search(set(), client_location={'latitude': 0, 'longitude': 0}, keywords=['cleaning'], category='Gardening', text_search=True)
+    assert [result['service_name'] for result in results] == ['Garden']
+    results, remaining = services.search_page(set(), client_location={'latitude': 0, 'longitude': 0}, limit=10, keywords=['cleaning'], category='Gardening', text_search=True)
+    assert [result['service_name'] for result in results] == ['Garden']
+    assert remaining == 0
+    results, remaining = services.search_page(set(), client_location={'latitude': 0, 'longitude': 0}, limit=10, keywords=['cleaning'], text_search=True)
+    assert len(results) == 10
+    assert remaining == 1_091
+
+def test_update_rating_maintains_avg_rating(services, mocker):
+    mocker.patch('services_nosql.get_actual_time', return_value='2023-01-01 00:00:00')
+    service_id = services.insert(
+        estimated_duration=None,
+        service_name='Test Service',
+        provider_id='test_user',
+        description='Test Description',
+        category='Test Category',
+        price=100,
+        location={'latitude': 0, 'longitude': 0},
+        max_distance=100
+    )
+    assert services.get(service_id)['avg_rating'] == 0
+    assert services.update_rating(service_id, 5, True)
+    assert services.update_rating(service_id, 2, True)
+    service = services.get(service_id)
+    assert service['sum_rating'] == 7
+    assert service['num_ratings'] == 2
+    assert service['avg_rating'] == 3.5
+    assert services.update_rating(service_id, 2, False)
+    assert services.get(service_id)['avg_rating'] == 5
+    assert not services.update_rating('nonexistent', 5, True)
+
+def test_search_by_avg_rating(services, mocker):
+    mocker.patch('services_nosql.get_actual_time', return_value='2023-01-01 00:00:00')
+    high_id = services.insert(
+        estimated_duration=None,
+        service_name='Test Service 1',
+        provider_id='test_user_1',
+        description='Test Description 1',
+        category='Test Category',
+        price=100,
+        location={'latitude': 0, 'longitude': 0},
+        max_distance=100
+    )
+    low_id = services.insert(
+        estimated_duration=None,
+        service_name='Test Service 2',
+        provider_id='test_user_2',
+        description='Test Description 2',
+        category='Test Category',
+        price=100,
+        location={'latitude': 0, 'longitude': 0},
+        max_distance=100
+    )
+    services.update_rating(high_id, 5, True)
+    services.update_rating(low_id, 2, True)
+    results = services.search(set(), client_location={'latitude': 0, 'longitude': 0}, min_avg_rating=4)
+    assert [result['uuid'] for result in results] == [high_id]
+    results = services.search(set(), client_location={'latitude': 0, 'longitude': 0}, max_avg_rating=3)
+    assert [result['uuid'] for result in results] == [low_id]
+
+def test_backfill_avg_rating(services, mocker):
+    services.collection.insert_many([
+        {'uuid': 'service_1', 'sum_rating': 9, 'num_ratings': 2},
+        {'uuid': 'service_2', 'sum_rating': 0, 'num_ratings': 0},
+        {'uuid': 'service_3', 'sum_rating': 4, 'num_ratings': 1, 'avg_rating': 4}
+    ])
+    assert services.backfill_avg_rating() == 2
+    assert services.get('service_1')['avg_rating'] == 4.5
+    assert services.get('service_2')['avg_rating'] == 0
+    assert services.backfill_avg_rating() == 0
+
+def test_geo_near_filters_share_the_location_index(mongo_client):
+    collection = mongo_client[os.getenv('MONGO_TEST_DB')]['services']
+    collection.create_index([('location', '2dsphere')])
+    collection.create_index([('category', 1), ('avg_rating', 1)])
+    services = Services(test_client=mongo_client)
+    indexes = services.collection.index_information()
+    assert indexes['location_2dsphere_category_1_avg_rating_1']['key'] == [('location', '2dsphere'), ('category', 1), ('avg_rating', 1)]
+    assert 'location_2dsphere' not in indexes
+    assert 'category_1_avg_rating_1' not in indexes
+
+def test_updated_since(services, mocker):
+    services.collection.insert_many([
+        {'uuid': 'service_1', 'updated_at': '2023-01-01 00:00:00'},
+        {'uuid': 'service_2', 'updated_at': '2023-01-01 00:00:01'},
+        {'uuid': 'service_3', 'updated_at': '2023-01-01 00:00:02'}
+    ])
+    assert sorted(services.updated_since('2023-01-01 00:00:01')) == [('service_2', '2023-01-01 00:00:01'), ('service_3', '2023-01-01 00:00:02')]
+
+def test_get_names_and_categories(services, mocker):
+    services.collection.insert_many([
+        {'uuid': 'service_1', 'service_name': 'Cleaning', 'category': 'Home', 'updated_at': '2023-01-01 00:00:00'},
+        {'uuid': 'service_2', 'service_name': 'Gardening', 'category': 'Garden', 'updated_at': '2023-01-01 00:00:01'}
+    ])
+    assert services.get_names_and_categories() == {'service_1': ('Cleaning', 'Home'), 'service_2': ('Gardening', 'Garden')}
+    assert services.get_names_and_categories('2023-01-01 00:00:01') == {'service_2': ('Gardening', 'Garden')}
@@ -0,0 +1,81 @@
+import pytest
+import queue
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
+from lib.summarization_server import Summarizer, _next_jobs
+
+# Run with the following command:
+# pytest ServicesService/api_container/tests/test_summarization_server.py
+
+VOCAB = ["<pad>", "<s>", "</s>", "<unk>"] + [f"w{i}" for i in range(60)]
+
+
+@pytest.fixture(scope='module')
+def tiny_summarizer():
+    # A local tiny seq2seq with random weights instead of the real model
+    pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    from tokenizers import Tokenizer, models, pre_tokenizers
+
+    word_level = Tokenizer(models.WordLevel({word: i for i, word in enumerate(VOCAB)}, unk_token="<unk>"))
+    word_level.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer = transformers.PreTrainedTokenizerFast(tokenizer_object=word_level, model_max_length=64,
+                                                     pad_token="<pad>", bos_token="<s>", eos_token="</s>", unk_token="<unk>")
+    config = transformers.BartConfig(vocab_size=len(VOCAB), d_model=16, encoder_layers=1, decoder_layers=1,
+                                     encoder_attention_heads=2, decoder_attention_heads=2, encoder_ffn_dim=32,
+                                     decoder_ffn_dim=32, max_position_embeddings=64, pad_token_id=0, bos_token_id=1,
+                                     eos_token_id=2, decoder_start_token_id=2, forced_eos_token_id=2)
+    transformers.set_seed(0)
+    return Summarizer(tokenizer, transformers.BartForConditionalGeneration(config).eval(), batch_size=2)
+
+
+class RecordingSummarizer(Summarizer):
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.batches = []
+
+    def _generate(self, texts, max_length, min_length):
+        self.batches.append(texts)
+        return [f"summary of {text}" for text in texts]
+
+
+def test_summarize_batches_by_length():
+    summarizer = RecordingSummarizer(batch_size=2)
+    texts = ["a" * 5, "b" * 50, "c" * 1, "d" * 30]
+    assert summarizer.summarize(texts) == [f"summary of {text}" for text in texts]
+    assert summarizer.batches == [["c", "a" * 5], ["d" * 30, "b" * 50]]
+
+
+def test_next_jobs_fills_the_batch():
+    requests = queue.Queue()
+    for i in range(3):
+        requests.put((f"job_{i}", ["text", "text"], 150, 50))
+    jobs, stop = _next_jobs(requests, batch_size=4, batch_wait_time=0)
+    assert [job[0] for job in jobs] == ["job_0", "job_1"]
+    assert not stop
+    jobs, stop = _next_jobs(requests, batch_size=4, batch_wait_time=0)
+    assert [job[0] for job in jobs] == ["job_2"]
+
+
+def test_next_jobs_stops():
+    requests = queue.Queue()
+    requests.put(("job_0", ["text"], 150, 50))
+    requests.put(None)
+    jobs, stop = _next_jobs(requests, batch_size=4, batch_wait_time=0)
+    assert [job[0] for job in jobs] == ["job_0"]
+    assert stop
+
+
+def test_tiny_model_summarizes_in_batches(tiny_summarizer):
+    texts = [" ".join(f"w{(i * j) % 60}" for j in range(length)) for i, length in enumerate([10, 40, 5])]
+    summaries = tiny_summarizer.summarize(texts, max_length=8, min_length=2)
+    assert len(summaries) == 3
+    assert all(isinstance(summary, str) for summary in summaries)
+    stats = tiny_summarizer.stats()
+    assert stats["batches"] == 2
+    assert stats["texts"] == 3
+    assert stats["input_tokens"] > 0
+    assert stats["tokens_per_second"] > 0
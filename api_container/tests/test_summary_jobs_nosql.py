@@ -0,0 +1,121 @@
+import pytest
+import mongomock
+import datetime
+import time
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
+from summary_jobs_nosql import SummaryJobs, PENDING, PROCESSING, DONE, DEAD
+from services_nosql import Services
+from ratings_nosql import Ratings
+from summary_chunks_nosql import SummaryChunks
+from lib.review_summarizer import ReviewSummarizer, run_due_jobs
+
+# Run with the following command:
+# pytest ServicesService/api_container/tests/test_summary_jobs_nosql.py
+
+# Set the TESTING environment variable
+os.environ['TESTING'] = '1'
+os.environ['MONGOMOCK'] = '1'
+
+# Set a default MONGO_TEST_DB for testing
+os.environ['MONGO_TEST_DB'] = 'test_db'
+
+TODAY = datetime.date.today()
+YESTERDAY = TODAY - datetime.timedelta(days=1)
+TOMORROW = TODAY + datetime.timedelta(days=1)
+
+@pytest.fixture(scope='function')
+def mongo_client():
+    client = mongomock.MongoClient()
+    yield client
+    client.drop_database(os.getenv('MONGO_TEST_DB'))
+    client.close()
+
+@pytest.fixture(scope='function')
+def jobs(mongo_client):
+    return SummaryJobs(test_client=mongo_client)
+
+class EchoSummarizer:
+    max_input_tokens = 1024
+
+    def __init__(self):
+        self.calls = 0
+
+    def count_tokens(self, texts):
+        return [len(text.split()) for text in texts]
+
+    def summarize(self, texts):
+        self.calls += 1
+        return [text.splitlines()[-1] for text in texts]
+
+def test_add_deduplicates(jobs):
+    assert jobs.add('service_1', TOMORROW)
+    for _ in range(500):
+        assert not jobs.add('service_1', TOMORROW)
+    assert jobs.add('service_2', TOMORROW)
+    assert jobs.add('service_1', TODAY)
+    assert jobs.collection.count_documents({}) == 3
+
+def test_add_service_enqueues_for_tomorrow(mongo_client):
+    review_summarizer = ReviewSummarizer(test_client=mongo_client)
+    review_summarizer.add_service('service_1')
+    review_summarizer.add_service('service_1')
+    assert review_summarizer.jobs_manager.collection.count_documents({'service_id': 'service_1', 'due_date': TOMORROW.isoformat()}) == 1
+    assert review_summarizer.stats()['available'] == 0
+
+def test_claim_only_due_jobs(jobs):
+    jobs.add('service_1', TOMORROW)
+    assert jobs.claim() is None
+    jobs.add('service_2', TODAY)
+    job = jobs.claim()
+    assert (job['service_id'], job['status']) == ('service_2', PROCESSING)
+    assert jobs.claim() is None
+
+def test_claim_expired_lease(jobs):
+    jobs.add('service_1', TODAY)
+    first = jobs.claim(lease_time=0)
+    second = jobs.claim()
+    assert second['_id'] == first['_id']
+    # The first worker lost the job
+    assert not jobs.complete(first)
+    assert jobs.complete(second)
+
+def test_complete_keeps_the_job(jobs):
+    jobs.add('service_1', TODAY)
+    assert jobs.complete(jobs.claim())
+    assert not jobs.add('service_1', TODAY)
+    assert jobs.claim() is None
+    assert jobs.delete_finished_before(TODAY) == 0
+    assert jobs.delete_finished_before(TOMORROW) == 1
+
+def test_fail_retries_and_dead_letters(jobs):
+    jobs.add('service_1', TODAY)
+    assert not jobs.fail(jobs.claim(), 'Error', max_attempts=2)
+    job = jobs.collection.find_one({})
+    assert (job['status'], job['attempts']) == (PENDING, 1)
+    assert job['available_at'] > time.time()
+    assert jobs.claim() is None
+    jobs.collection.update_one({}, {'$set': {'available_at': 0}})
+    assert jobs.fail(jobs.claim(), 'Error', max_attempts=2)
+    assert jobs.stats()[DEAD] == 1
+
+def test_run_due_jobs(mongo_client, jobs):
+    services = Services(test_client=mongo_client)
+    ratings = Ratings(test_client=mongo_client)
+    chunks = SummaryChunks(test_client=mongo_client)
+    service_id = services.insert('Plumbing', 'provider_1', 'Fixes pipes', 'Repair', 100,
+                                 {'longitude': 0, 'latitude': 0}, 10, 60, [])
+    ratings.insert(service_id, 5, 'Great work', 'user_1')
+    jobs.add(service_id, YESTERDAY)
+    jobs.add('missing_service', TODAY)
+    jobs.add(service_id, TOMORROW)
+    summarizer = EchoSummarizer()
+    assert run_due_jobs(jobs, services, ratings, chunks, summarizer, workers=2) == 2
+    assert summarizer.calls == 1
+    assert services.get(service_id)['reviews_summary'] == 'Great work'
+    assert jobs.stats()[DONE] == 2
+    assert jobs.stats()[PENDING] == 1
+    assert list(chunks.get(service_id).values()) == ['Great work']
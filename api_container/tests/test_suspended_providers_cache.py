@@ -0,0 +1,106 @@
+import pytest
+import threading
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
+from lib.suspended_providers_cache import SuspendedProvidersCache
+
+# Run with the following command:
+# pytest ServicesService/api_container/tests/test_suspended_providers_cache.py
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class FakeSupport:
+    def __init__(self, suspended):
+        self.suspended = suspended
+        self.calls = 0
+        self.fail = False
+
+    def get_all_users_suspended(self):
+        self.calls += 1
+        if self.fail:
+            raise Exception("Support service unavailable")
+        return set(self.suspended)
+
+@pytest.fixture(scope='function')
+def clock():
+    return FakeClock()
+
+@pytest.fixture(scope='function')
+def support():
+    return FakeSupport({'provider_1'})
+
+@pytest.fixture(scope='function')
+def cache(support, clock):
+    return SuspendedProvidersCache(support.get_all_users_suspended, ttl=10, clock=clock)
+
+def test_first_get_fetches(cache, support):
+    assert cache.get() == {'provider_1'}
+    assert support.calls == 1
+    assert cache.misses == 1
+    assert cache.hits == 0
+
+def test_get_within_ttl_is_a_hit(cache, support, clock):
+    cache.get()
+    clock.now = 9
+    support.suspended = {'provider_2'}
+    assert cache.get() == {'provider_1'}
+    assert support.calls == 1
+    assert cache.hits == 1
+
+def test_get_after_ttl_refreshes(cache, support, clock):
+    cache.get()
+    clock.now = 11
+    support.suspended = {'provider_2'}
+    assert cache.get() == {'provider_2'}
+    assert support.calls == 2
+    assert cache.version == 2
+
+def test_refresh_error_serves_stale(cache, support, clock):
+    cache.get()
+    clock.now = 11
+    support.fail = True
+    assert cache.get() == {'provider_1'}
+    assert cache.refresh_errors == 1
+    assert cache.stale_hits == 1
+
+def test_refresh_error_without_previous_value_raises(cache, support):
+    support.fail = True
+    with pytest.raises(Exception):
+        cache.get()
+
+def test_invalidate_forces_refresh(cache, support):
+    cache.get()
+    cache.invalidate()
+    cache.get()
+    assert support.calls == 2
+
+def test_concurrent_gets_fetch_once(clock):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {'provider_1'}
+
+    cache = SuspendedProvidersCache(slow_fetch, ttl=10, clock=clock)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [{'provider_1'}] * 5
@@ -0,0 +1,46 @@
+import pytest
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
+from lib.text_index import TextIndex, tokenize
+
+# Run with the following command:
+# pytest ServicesService/api_container/tests/test_text_index.py
+
+@pytest.fixture(scope='function')
+def index():
+    index = TextIndex({'service_name': 2.0, 'description': 1.0})
+    index.add('service_1', {'service_name': 'Plomero a domicilio', 'description': 'Reparación de cañerías'})
+    index.add('service_2', {'service_name': 'Test Service 1', 'description': 'Test Description 1'})
+    index.add('service_3', {'service_name': 'Test Service 2', 'description': 'Cleaning services'})
+    return index
+
+def test_tokenize_normalizes_and_stems():
+    assert tokenize('Reparación de Cañerías') == tokenize('reparacion de canerias')
+    assert tokenize('services') == tokenize('service')
+    assert tokenize(None) == []
+
+def test_search_all_terms_of_a_keyword(index):
+    assert [doc_id for doc_id, _ in index.search(['Test Service 1'])] == ['service_2']
+    assert index.search(['Nonexistent Service']) == []
+
+def test_search_any_keyword(index):
+    assert {doc_id for doc_id, _ in index.search(['plomero', 'cleaning'])} == {'service_1', 'service_3'}
+
+def test_search_prefix(index):
+    assert [doc_id for doc_id, _ in index.search(['plom'])] == ['service_1']
+
+def test_search_ranking_and_top_k(index):
+    results = index.search(['service'])
+    assert [doc_id for doc_id, _ in results] == ['service_3', 'service_2']
+    assert len(index.search(['service'], k=1)) == 1
+
+def test_search_candidates(index):
+    assert [doc_id for doc_id, _ in index.search(['service'], candidates={'service_2'})] == ['service_2']
+
+def test_remove(index):
+    index.remove('service_1')
+    assert index.search(['plomero']) == []
+    assert len(index) == 2
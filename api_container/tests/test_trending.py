@@ -0,0 +1,42 @@
+import pytest
+import random
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
+from lib.trending import TrendingAnaliser, SPARSE_ENGINE, NETWORKX_ENGINE
+
+# Run with the following command:
+# pytest ServicesService/api_container/tests/test_trending.py
+
+@pytest.fixture(scope='function')
+def scores():
+    rng = random.Random(0)
+    scores = [(f"U{rng.randrange(50)}", f"S{rng.randrange(30)}", float(rng.choice([3, 4, 5]))) for _ in range(300)]
+    # A client with a single service and a client scoring the same service twice
+    return scores + [("U_lonely", "S_lonely", 5.0), ("U0", "S0", 3.0), ("U0", "S0", 5.0)]
+
+def test_sparse_engine_matches_networkx(scores):
+    sparse_rank = TrendingAnaliser(scores, engine=SPARSE_ENGINE).get_services_rank()
+    networkx_rank = TrendingAnaliser(scores, engine=NETWORKX_ENGINE).get_services_rank()
+    assert sparse_rank.keys() == networkx_rank.keys()
+    for service, data in networkx_rank.items():
+        assert sparse_rank[service]["TRENDING_SCORE"] == pytest.approx(data["TRENDING_SCORE"], abs=1e-9)
+        assert sparse_rank[service]["REVIEWS_COUNT"] == data["REVIEWS_COUNT"]
+
+def test_scores_sum_to_one(scores):
+    rank = TrendingAnaliser(scores).get_services_rank()
+    assert sum(data["TRENDING_SCORE"] for data in rank.values()) == pytest.approx(1.0)
+
+def test_empty_scores():
+    assert TrendingAnaliser([]).get_services_rank() == {}
+
+def test_invalid_engine():
+    with pytest.raises(ValueError):
+        TrendingAnaliser([], engine="invalid")
+
+def test_reviews_count(scores):
+    rank = TrendingAnaliser(scores).get_services_rank()
+    for service, data in rank.items():
+        assert data["REVIEWS_COUNT"] == sum(1 for score in scores if score[1] == service)
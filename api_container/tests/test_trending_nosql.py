@@ -0,0 +1,100 @@
+import pytest
+import mongomock
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'lib')))
+from trending_nosql import Trending, compute_trending, update_trending_services, TRENDING_CELL_SIZE
+from services_nosql import Services
+from ratings_nosql import Ratings
+from lib.utils import location_cell
+
+# Run with the following command:
+# pytest ServicesService/api_container/tests/test_trending_nosql.py
+
+# Set the TESTING environment variable
+os.environ['TESTING'] = '1'
+os.environ['MONGOMOCK'] = '1'
+
+# Set a default MONGO_TEST_DB for testing
+os.environ['MONGO_TEST_DB'] = 'test_db'
+
+@pytest.fixture(scope='function')
+def mongo_client():
+    client = mongomock.MongoClient()
+    yield client
+    client.drop_database(os.getenv('MONGO_TEST_DB'))
+    client.close()
+
+@pytest.fixture(scope='function')
+def trending(mongo_client):
+    return Trending(test_client=mongo_client)
+
+@pytest.fixture(scope='function')
+def services(mongo_client):
+    return Services(test_client=mongo_client)
+
+@pytest.fixture(scope='function')
+def ratings(mongo_client):
+    return Ratings(test_client=mongo_client)
+
+def _trending_service(service, provider_id, score):
+    return {'service': service, 'provider_id': provider_id, 'trending_score': score, 'reviews_count': 1}
+
+def test_get_page(trending):
+    trending.save('1:1', [_trending_service(f'S{i}', f'provider_{i}', 1 / (i + 1)) for i in range(5)])
+    page = trending.get_page('1:1', 1, 2)
+    assert page['services_count'] == 5
+    assert [service['service'] for service in page['services']] == ['S1', 'S2']
+    assert page['updated_at'] is not None
+
+def test_get_page_skips_suspended_providers(trending):
+    trending.save('1:1', [_trending_service(f'S{i}', f'provider_{i}', 1 / (i + 1)) for i in range(5)])
+    page = trending.get_page('1:1', 0, 2, {'provider_0'})
+    assert page['services_count'] == 4
+    assert [service['service'] for service in page['services']] == ['S1', 'S2']
+
+def test_get_page_unknown_cell(trending):
+    assert trending.get_page('1:1', 0, 2) is None
+
+def test_save_replaces_ranking(trending):
+    trending.save('1:1', [_trending_service('S1', 'provider_1', 1)])
+    trending.save('1:1', [])
+    assert trending.get_page('1:1', 0, 2)['services_count'] == 0
+
+def _insert_service(services, name, provider_id):
+    return services.insert(
+        estimated_duration=None,
+        service_name=name,
+        provider_id=provider_id,
+        description=None,
+        category='Repair',
+        price=100,
+        location={'longitude': -58.37, 'latitude': -34.61},
+        max_distance=100
+    )
+
+def test_compute_trending(services, ratings):
+    popular = _insert_service(services, 'Popular', 'provider_1')
+    other = _insert_service(services, 'Other', 'provider_2')
+    for user in ['user_1', 'user_2', 'user_3']:
+        ratings.insert(popular, 5, None, user)
+    ratings.insert(other, 4, None, 'user_1')
+
+    trending_services = compute_trending(services, ratings, set(), {'longitude': -58.37, 'latitude': -34.61})
+    assert [service['service'] for service in trending_services] == [f'S{popular}', f'S{other}']
+    assert trending_services[0]['provider_id'] == 'provider_1'
+    assert trending_services[0]['reviews_count'] == 3
+
+    assert compute_trending(services, ratings, {'provider_1', 'provider_2'}, {'longitude': -58.37, 'latitude': -34.61}) == []
+
+def test_update_trending_services(trending, services, ratings):
+    service = _insert_service(services, 'Service', 'provider_1')
+    ratings.insert(service, 5, None, 'user_1')
+    trending.save('0:0', [_trending_service('S_old', 'provider_1', 1)])
+
+    assert update_trending_services(trending, services, ratings, set()) == 1
+    cell = location_cell({'longitude': -58.37, 'latitude': -34.61}, TRENDING_CELL_SIZE)
+    assert [service['service'] for service in trending.get_page(cell, 0, 10)['services']] == [f'S{service}']
+    assert trending.get_page('0:0', 0, 10) is None
@@ -0,0 +1,161 @@
+from typing import Optional, List, Dict
+from pymongo import ASCENDING
+import logging as logger
+import os
+import time
+
+from services_nosql import Services
+from ratings_nosql import Ratings
+from lib.trending import TrendingAnaliser
+from lib.utils import get_actual_time, get_mongo_client, cell_center, time_to_string
+from lib.indexes import Index, ensure_indexes
+
+HOUR = 60 * 60
+MINUTE = 60
+MILLISECOND = 1_000
+
+TRENDING_TIME = 30  # days
+TRENDING_MIN_REVIEWS = 0.1  # 10% of the average reviews
+TRENDING_CELL_SIZE = 0.1  # degrees (~11km)
+TRENDING_UPDATE_TIME = HOUR
+
+
+class Trending:
+    """
+    Trending class that stores data in a MongoDB collection.
+    Precomputed trending services ranking for each geographic cell (see lib.utils.location_cell).
+    Fields:
+    - cell (str): The id of the cell (unique) [pk]
+    - services (List[Dict]): The trending services sorted by trending score
+    - services_count (int): The number of trending services
+    - updated_at (datetime): The date when the ranking was computed
+
+    service structure:
+    - service (str): The uuid of the service prefixed with 'S'
+    - provider_id (str): The id of the account that provides the service
+    - trending_score (float): The PageRank score of the service
+    - reviews_count (int): The number of recent reviews of the service
+    """
+
+    INDEXES = {
+        'trending_services': [
+            Index([('cell', ASCENDING)], unique=True)
+        ]
+    }
+
+    def __init__(self, test_client=None):
+        self.client = test_client or get_mongo_client()
+        if not self._check_connection():
+            raise Exception("Failed to connect to MongoDB")
+        if test_client:
+            self.db = self.client[os.getenv('MONGO_TEST_DB')]
+        else:
+            self.db = self.client[os.getenv('MONGO_DB')]
+        self.collection = self.db['trending_services']
+        self._create_collection()
+
+    def _check_connection(self):
+        try:
+            self.client.admin.command('ping')
+        except Exception as e:
+            logger.error(e)
+            return False
+        return True
+
+    def _create_collection(self):
+        for collection, indexes in self.INDEXES.items():
+            ensure_indexes(self.db[collection], indexes)
+
+    def save(self, cell: str, services: List[Dict]) -> bool:
+        try:
+            self.collection.replace_one({'cell': cell}, {
+                'cell': cell,
+                'services': services,
+                'services_count': len(services),
+                'updated_at': get_actual_time()
+            }, upsert=True)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving trending services of cell '{cell}': {e}")
+            return False
+
+    def get_page(self, cell: str, offset: int, max_services: int, suspended_providers: set[str] = None) -> Optional[Dict]:
+        """
+        Returns the services [offset, offset + max_services) of the cell ranking,
+        skipping the ones of suspended providers, the total count of services and
+        the date of the ranking. None if the cell ranking was never computed.
+        """
+        services = '$services'
+        if suspended_providers:
+            services = {'$filter': {
+                'input': '$services',
+                'as': 'service',
+                'cond': {'$eq': [{'$in': ['$$service.provider_id', list(suspended_providers)]}, False]}
+            }}
+        results = list(self.collection.aggregate([
+            {'$match': {'cell': cell}},
+            {'$project': {'_id': 0, 'updated_at': 1, 'services': services}},
+            {'$project': {
+                'updated_at': 1,
+                'services_count': {'$size': '$services'},
+                'services': {'$slice': ['$services', offset, max_services]}
+            }}
+        ]))
+        return results[0] if results else None
+
+    def delete_cells_except(self, cells: List[str]) -> int:
+        result = self.collection.delete_many({'cell': {'$nin': cells}})
+        return result.deleted_count
+
+
+def compute_trending(services_manager: Services, ratings_manager: Ratings, suspended_providers: set[str], location: dict) -> List[Dict]:
+    services_pipeline = services_manager.search_fields_pipeline(suspended_providers, location, ['uuid', 'provider_id'], hidden=False)
+    if services_pipeline is None:
+        return []
+    recent_ratings = ratings_manager.get_recent_of_services(TRENDING_TIME, services_pipeline, ['provider_id'])
+    if not recent_ratings:
+        return []
+    providers = {r['service_uuid']: r['provider_id'] for r in recent_ratings}
+    ratings_list = [(f"U{r['user_uuid']}", f"S{r['service_uuid']}", float(r['rating'])) for r in recent_ratings]
+
+    trending_services = TrendingAnaliser(ratings_list).get_services_rank()
+    if not trending_services:
+        return []
+    avg_reviews = sum([service["REVIEWS_COUNT"] for service in trending_services.values()]) / len(trending_services)
+    min_reviews = avg_reviews * TRENDING_MIN_REVIEWS
+
+    trending_data = sorted(((service, data) for service, data in trending_services.items() if data["REVIEWS_COUNT"] >= min_reviews),
+                           key=lambda x: x[1]["TRENDING_SCORE"], reverse=True)
+    return [{
+        'service': service,
+        'provider_id': providers[service[1:]],
+        'trending_score': data["TRENDING_SCORE"],
+        'reviews_count': data["REVIEWS_COUNT"]
+    } for service, data in trending_data]
+
+
+def update_trending_services(trending_manager: Trending, services_manager: Services, ratings_manager: Ratings, suspended_providers: set[str]) -> int:
+    cells = services_manager.get_location_cells(TRENDING_CELL_SIZE)
+    for cell in cells:
+        services = compute_trending(services_manager, ratings_manager, suspended_providers, cell_center(cell, TRENDING_CELL_SIZE))
+        trending_manager.save(cell, services)
+    trending_manager.delete_cells_except(cells)
+    return len(cells)
+
+
+def trending_updater():
+    from imported_lib.SupportService.support_lib import SupportLib
+
+    trending_manager = Trending()
+    services_manager = Services()
+    ratings_manager = Ratings()
+    support_lib = SupportLib()
+    while True:
+        start = time.time()
+        try:
+            cells = update_trending_services(trending_manager, services_manager, ratings_manager,
+                                             support_lib.get_all_users_suspended())
+            logger.info(f"Trending services of {cells} cells updated in {time_to_string(time.time() - start)}")
+        except Exception as e:
+            logger.error(f"Error updating trending services: {e}")
+        time.sleep(max(TRENDING_UPDATE_TIME - (time.time() - start), 0))
@@ -0,0 +1,113 @@
+"""
+Compares the legacy hiring report (one count_documents per status, two per
+month and two per year, matching date prefixes with $regex) against
+Rentals.get_hiring_report (point reads of the rental stats rollup) for a
+provider with 100k rentals, among the rentals of other providers. Also
+reports the time to rebuild the rollup from scratch.
+
+Needs a real MongoDB, configured with the same environment variables as the
+API (MONGO_USER, MONGO_PASSWORD, ...). The rentals are written to
+MONGO_TEST_DB (default: 'bench_db') and dropped at the end.
+
+Run with the following command:
+python benchmarks/bench_hiring_report.py [num_rentals]
+"""
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api_container')))
+from lib.utils import get_mongo_client, get_actual_time, time_to_string
+from rentals_nosql import Rentals, RENTAL_STATUSES, HIRING_REPORT_MONTHS
+
+NUM_RENTALS = 100_000
+NUM_OTHER_RENTALS = 400_000
+NUM_OTHER_PROVIDERS = 5_000
+YEARS = range(2019, 2025)
+NUM_QUERIES = 10
+BATCH_SIZE = 10_000
+PROVIDER_ID = 'bench_provider'
+
+
+def _populate(rentals: Rentals, provider_ids, num_rentals: int):
+    batch = []
+    for _ in range(num_rentals):
+        batch.append({
+            'uuid': str(uuid.uuid4()),
+            'service_id': 'bench_service',
+            'provider_id': random.choice(provider_ids),
+            'client_id': f"client_{random.randrange(100_000)}",
+            'date': f"{random.choice(YEARS)}-{random.randint(1, 12):02d}-{random.randint(1, 28):02d} 10:00:00",
+            'status': random.choice(RENTAL_STATUSES)
+        })
+        if len(batch) == BATCH_SIZE:
+            rentals.collection.insert_many(batch)
+            batch = []
+    if batch:
+        rentals.collection.insert_many(batch)
+
+
+def _legacy_hiring_report(rentals: Rentals, provider_id: str) -> dict:
+    collection = rentals.collection
+    report = {
+        'total_rentals': collection.count_documents({'provider_id': provider_id}),
+        'finished_rentals': collection.count_documents({'provider_id': provider_id, 'status': 'FINISHED'}),
+        'breakdown_by_status': {status: collection.count_documents({'provider_id': provider_id, 'status': status})
+                                for status in RENTAL_STATUSES}
+    }
+    for key, prefixes in [('breakdown_by_month', Rentals._last_months(get_actual_time(), HIRING_REPORT_MONTHS)),
+                          ('breakdown_by_year', [str(year) for year in YEARS])]:
+        report[key] = {}
+        for prefix in prefixes:
+            total = collection.count_documents({'provider_id': provider_id, 'date': {'$regex': f'^{prefix}'}})
+            finished = collection.count_documents({'provider_id': provider_id, 'date': {'$regex': f'^{prefix}'}, 'status': 'FINISHED'})
+            report[key][prefix] = (total, finished)
+    return report
+
+
+def _run(report_function):
+    start = time.time()
+    for _ in range(NUM_QUERIES):
+        report = report_function()
+    return report, (time.time() - start) / NUM_QUERIES
+
+
+def main():
+    num_rentals = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_RENTALS
+    os.environ.setdefault('MONGO_TEST_DB', 'bench_db')
+    client = get_mongo_client()
+    rentals = Rentals(test_client=client)
+    rentals.collection.drop()
+    rentals.stats.drop()
+    rentals._create_collection()
+
+    print(f"Inserting {num_rentals} rentals of the provider and {NUM_OTHER_RENTALS} of other providers...")
+    start = time.time()
+    _populate(rentals, [PROVIDER_ID], num_rentals)
+    _populate(rentals, [f"provider_{i}" for i in range(NUM_OTHER_PROVIDERS)], NUM_OTHER_RENTALS)
+    print(f"Inserted in {time_to_string(time.time() - start)}")
+    start = time.time()
+    entries = rentals.rebuild_stats()
+    print(f"Rollup of {entries} (provider, month) entries rebuilt in {time_to_string(time.time() - start)}")
+
+    legacy_report, legacy_time = _run(lambda: _legacy_hiring_report(rentals, PROVIDER_ID))
+    report, report_time = _run(lambda: rentals.get_hiring_report(PROVIDER_ID))
+    assert report['total_rentals'] == legacy_report['total_rentals']
+    assert report['breakdown_by_status'] == legacy_report['breakdown_by_status']
+    assert all(report['breakdown_by_year'][year]['total'] == total
+               for year, (total, _) in legacy_report['breakdown_by_year'].items())
+
+    print(f"Legacy count_documents: {time_to_string(legacy_time)} per report")
+    print(f"Rental stats rollup:    {time_to_string(report_time)} per report")
+    print(f"Speedup: {legacy_time / report_time:.2f}x")
+
+    rentals.collection.drop()
+    rentals.stats.drop()
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
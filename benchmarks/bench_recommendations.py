@@ -0,0 +1,67 @@
+"""
+Compares the sparse-matrix InterestPredictor engine against the networkx one
+on synthetic reviews (200k by default) for a few users.
+
+The networkx engine computes all the shortest paths of the graph, pass a
+smaller number of reviews for it with the second argument (0 skips it).
+
+Run with the following command:
+python benchmarks/bench_recommendations.py [num_reviews] [num_networkx_reviews]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib.interest_prediction import InterestPredictor, SPARSE_ENGINE, NETWORKX_ENGINE
+from lib.utils import time_to_string
+
+NUM_REVIEWS = 200_000
+NUM_USERS = 50_000
+NUM_SERVICES = 10_000
+POPULARITY_EXPONENT = 0.8  # Zipf exponent of the services popularity
+NUM_TARGET_USERS = 5
+
+
+def _synthetic_reviews(num_reviews: int, seed: int = 42):
+    rng = random.Random(seed)
+    popularity = [1 / (rank + 1) ** POPULARITY_EXPONENT for rank in range(NUM_SERVICES)]
+    services = rng.choices(range(NUM_SERVICES), weights=popularity, k=num_reviews)
+    return [(f"U{rng.randrange(NUM_USERS)}", f"S{service}") for service in services]
+
+
+def _run(reviews, users, engine):
+    start = time.time()
+    predictions = [InterestPredictor(reviews, user, engine=engine).get_interest_prediction() for user in users]
+    return predictions, (time.time() - start) / len(users)
+
+
+def main():
+    num_reviews = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_REVIEWS
+    num_networkx_reviews = int(sys.argv[2]) if len(sys.argv) > 2 else num_reviews
+
+    reviews = _synthetic_reviews(num_reviews)
+    users = [reviews[i][0] for i in range(NUM_TARGET_USERS)]
+    _, sparse_time = _run(reviews, users, SPARSE_ENGINE)
+    print(f"{num_reviews} reviews, {NUM_TARGET_USERS} users")
+    print(f"Sparse engine:   {time_to_string(sparse_time)} per user")
+
+    if not num_networkx_reviews:
+        return
+    reviews = reviews[:num_networkx_reviews]
+    users = [reviews[i][0] for i in range(NUM_TARGET_USERS)]
+    sparse_predictions, sparse_time = _run(reviews, users, SPARSE_ENGINE)
+    networkx_predictions, networkx_time = _run(reviews, users, NETWORKX_ENGINE)
+    print(f"Sparse engine ({num_networkx_reviews} reviews): {time_to_string(sparse_time)} per user")
+    print(f"Networkx engine ({num_networkx_reviews} reviews): {time_to_string(networkx_time)} per user")
+    print(f"Speedup: {networkx_time / sparse_time:.1f}x")
+
+    max_error = max(abs(sparse[service] - score)
+                    for sparse, networkx in zip(sparse_predictions, networkx_predictions)
+                    for service, score in networkx.items())
+    print(f"Max score difference: {max_error:.2e}")
+
+
+if __name__ == '__main__':
+    main()
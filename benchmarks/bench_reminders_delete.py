@@ -0,0 +1,81 @@
+"""
+Compares cancelling the reminders of a rental with the legacy update_many({})
+$pull over every reminder document against Reminders.delete_rental_reminders,
+which only updates the buckets found through the reminders.rental_id index.
+The collection holds a year of reminder dates.
+
+Needs a real MongoDB (mongomock does not use indexes), configured with the
+same environment variables as the API (MONGO_USER, MONGO_PASSWORD, ...). The
+reminders are written to MONGO_TEST_DB (default: 'bench_db') and dropped at
+the end.
+
+Run with the following command:
+python benchmarks/bench_reminders_delete.py [reminders_per_day]
+"""
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api_container')))
+from lib.utils import get_mongo_client, time_to_string
+from reminders_nosql import Reminders
+
+NUM_DAYS = 365
+REMINDERS_PER_DAY = 2_000
+NUM_CANCELLATIONS = 20
+
+
+def _populate(reminders: Reminders, reminders_per_day: int):
+    first_day = datetime.date.today()
+    for day in range(NUM_DAYS):
+        date = (first_day + datetime.timedelta(days=day)).strftime('%Y-%m-%d')
+        reminders.add_reminders([(date, {
+            'rental_id': f"rental_{day}_{i}",
+            'user_id': f"user_{random.randrange(100_000)}",
+            'title': "Upcoming rental: Bench service",
+            'description': "Your rental of Bench service is today"
+        }) for i in range(reminders_per_day)])
+
+
+def _legacy_delete(reminders: Reminders, rental_id: str) -> bool:
+    result = reminders.collection.update_many({}, {'$pull': {'reminders': {'rental_id': rental_id}}})
+    return result.modified_count > 0
+
+
+def _run(delete, rental_ids):
+    start = time.time()
+    for rental_id in rental_ids:
+        assert delete(rental_id)
+    return (time.time() - start) / len(rental_ids)
+
+
+def main():
+    reminders_per_day = int(sys.argv[1]) if len(sys.argv) > 1 else REMINDERS_PER_DAY
+    os.environ.setdefault('MONGO_TEST_DB', 'bench_db')
+    client = get_mongo_client()
+    reminders = Reminders(test_client=client)
+    reminders.collection.drop()
+    reminders._create_collection()
+
+    print(f"Inserting {NUM_DAYS} days of {reminders_per_day} reminders...")
+    start = time.time()
+    _populate(reminders, reminders_per_day)
+    print(f"Inserted {reminders.collection.count_documents({})} buckets in {time_to_string(time.time() - start)}")
+
+    rental_ids = [f"rental_{random.randrange(NUM_DAYS)}_{random.randrange(reminders_per_day)}" for _ in range(2 * NUM_CANCELLATIONS)]
+    legacy_time = _run(lambda rental_id: _legacy_delete(reminders, rental_id), rental_ids[:NUM_CANCELLATIONS])
+    indexed_time = _run(reminders.delete_rental_reminders, rental_ids[NUM_CANCELLATIONS:])
+
+    print(f"Legacy update_many({{}}): {time_to_string(legacy_time)} per cancellation")
+    print(f"Indexed by rental_id:   {time_to_string(indexed_time)} per cancellation")
+    print(f"Speedup: {legacy_time / indexed_time:.1f}x")
+
+    reminders.collection.drop()
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Compares the legacy Services.search stage ordering (every filter as a $match
+after $geoNear) against the planned pipeline (filters folded into the
+$geoNear query) on a few hundred thousand synthetic services.
+
+Needs a real MongoDB ($geoNear is not supported by mongomock), configured with
+the same environment variables as the API (MONGO_USER, MONGO_PASSWORD, ...).
+The services are written to MONGO_TEST_DB (default: 'bench_db') and dropped
+at the end.
+
+Run with the following command:
+python benchmarks/bench_search_pipeline.py [num_services]
+"""
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api_container')))
+from lib.utils import get_mongo_client, time_to_string
+from services_nosql import Services
+
+NUM_SERVICES = 300_000
+NUM_PROVIDERS = 20_000
+NUM_SUSPENDED = 500
+NUM_QUERIES = 20
+BATCH_SIZE = 10_000
+CATEGORIES = ["Repair", "Cleaning", "Cooking", "Childcare", "Petcare",
+              "Gardening", "Stilist", "Healthcare", "Education", "Entertainment", "Other"]
+# Around Buenos Aires
+CENTER = (-58.38, -34.60)
+SPREAD = 0.5  # degrees
+
+
+def _random_location():
+    return [CENTER[0] + random.uniform(-SPREAD, SPREAD), CENTER[1] + random.uniform(-SPREAD, SPREAD)]
+
+
+def _populate(services: Services, num_services: int):
+    batch = []
+    for i in range(num_services):
+        batch.append({
+            'uuid': str(uuid.uuid4()),
+            'service_name': f"Service {i}",
+            'provider_id': f"provider_{random.randrange(NUM_PROVIDERS)}",
+            'description': f"Synthetic service number {i}",
+            'category': random.choice(CATEGORIES),
+            'price': random.uniform(10, 1000),
+            'hidden': random.random() < 0.1,
+            'sum_rating': 0,
+            'num_ratings': 0,
+            'location': {'type': 'Point', 'coordinates': _random_location()},
+            'max_distance': random.uniform(1, 30)
+        })
+        if len(batch) == BATCH_SIZE:
+            services.collection.insert_many(batch)
+            batch = []
+    if batch:
+        services.collection.insert_many(batch)
+
+
+def _legacy_pipeline(suspended_providers, client_location, min_price, max_price, hidden, category):
+    return [
+        {'$geoNear': {
+            'near': {'type': 'Point', 'coordinates': [client_location['longitude'], client_location['latitude']]},
+            'distanceField': 'distance',
+            'spherical': True
+        }},
+        {'$match': {'$expr': {'$lte': ['$distance', {'$multiply': ['$max_distance', 1000]}]}}},
+        {'$match': {'category': category}},
+        {'$match': {'price': {'$gte': min_price, '$lte': max_price}}},
+        {'$match': {'hidden': hidden}},
+        {'$match': {'provider_id': {'$nin': list(suspended_providers)}}},
+        {'$project': {'images': 0}}
+    ]
+
+
+def _run(services: Services, pipelines):
+    start = time.time()
+    total = 0
+    for pipeline in pipelines:
+        total += sum(1 for _ in services.collection.aggregate(pipeline))
+    elapsed = time.time() - start
+    return elapsed, total
+
+
+def main():
+    num_services = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_SERVICES
+    os.environ.setdefault('MONGO_TEST_DB', 'bench_db')
+    os.environ.pop('MONGOMOCK', None)
+    client = get_mongo_client()
+    services = Services(test_client=client)
+    services.collection.drop()
+    services._create_collection()
+
+    print(f"Inserting {num_services} synthetic services...")
+    start = time.time()
+    _populate(services, num_services)
+    print(f"Inserted in {time_to_string(time.time() - start)}")
+
+    suspended_providers = {f"provider_{i}" for i in random.sample(range(NUM_PROVIDERS), NUM_SUSPENDED)}
+    queries = []
+    for _ in range(NUM_QUERIES):
+        longitude, latitude = _random_location()
+        queries.append({
+            'client_location': {'longitude': longitude, 'latitude': latitude},
+            'min_price': 100,
+            'max_price': 400,
+            'hidden': False,
+            'category': random.choice(CATEGORIES)
+        })
+
+    legacy = [_legacy_pipeline(suspended_providers, **query) for query in queries]
+    planned = [services._build_search_pipeline(suspended_providers, **query) for query in queries]
+
+    legacy_time, legacy_total = _run(services, legacy)
+    planned_time, planned_total = _run(services, planned)
+    assert legacy_total == planned_total, "Both pipelines must return the same services"
+
+    print(f"Results per query: {legacy_total / NUM_QUERIES:.0f}")
+    print(f"Legacy stage ordering:  {time_to_string(legacy_time / NUM_QUERIES)} per query")
+    print(f"Filters in $geoNear:    {time_to_string(planned_time / NUM_QUERIES)} per query")
+    print(f"Speedup: {legacy_time / planned_time:.2f}x")
+
+    services.collection.drop()
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Recall and latency of the IVF similarity index against a brute force search
+(the matrix-vector product over every vector of the category), on synthetic
+clustered embeddings of the size of the name embeddings (384).
+
+Searches are run without a filter and filtered by a candidate set (e.g. the
+services available at a location), for a few probe ratios.
+
+Run with the following command:
+python benchmarks/bench_similarity_index.py [num_services]
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib.ann_index import PartitionedIndex
+from lib.utils import time_to_string
+
+NUM_SERVICES = 100_000
+DIMENSION = 384
+NUM_CLUSTERS = 500  # Kinds of services
+NOISE = 1.5
+NUM_QUERIES = 200
+K = 10
+CANDIDATES_RATIO = 0.2
+PROBE_RATIOS = [0.02, 0.05, 0.1, 0.2]
+PARTITION = "Repair"
+
+
+def _synthetic_embeddings(count: int, seed: int = 42) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(NUM_CLUSTERS, DIMENSION))
+    vectors = centers[rng.integers(0, NUM_CLUSTERS, count)] + NOISE * rng.normal(size=(count, DIMENSION))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _brute_force(vectors: np.ndarray, rows: np.ndarray, query: np.ndarray) -> set:
+    scores = (vectors if len(rows) == len(vectors) else vectors[rows]) @ query
+    return set(rows[np.argpartition(-scores, K - 1)[:K]].tolist())
+
+
+def _run(index, vectors, queries, rows, candidates, probe_ratio):
+    ann_time = brute_time = 0.0
+    found = 0
+    for query in queries:
+        start = time.perf_counter()
+        results = index.search(PARTITION, query, K, candidates, probe_ratio)
+        ann_time += time.perf_counter() - start
+        start = time.perf_counter()
+        exact = _brute_force(vectors, rows, query)
+        brute_time += time.perf_counter() - start
+        found += len({int(id) for id, _ in results} & exact)
+    return found / (K * len(queries)), ann_time / len(queries), brute_time / len(queries)
+
+
+def main():
+    num_services = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_SERVICES
+    vectors = _synthetic_embeddings(num_services + NUM_QUERIES)
+    vectors, queries = vectors[:num_services], vectors[num_services:]
+
+    start = time.time()
+    index = PartitionedIndex.build(DIMENSION, ((str(i), PARTITION, vector) for i, vector in enumerate(vectors)))
+    print(f"{num_services} services, {DIMENSION} dimensions: built in {time_to_string(time.time() - start)}")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "index")
+        index.save(path)
+        start = time.time()
+        index = PartitionedIndex.load(path)
+        print(f"Loaded (memory mapped) in {time_to_string(time.time() - start)}")
+
+        rng = np.random.default_rng(0)
+        all_rows = np.arange(num_services)
+        candidate_rows = np.sort(rng.choice(num_services, int(CANDIDATES_RATIO * num_services), replace=False))
+        candidates = [str(row) for row in candidate_rows.tolist()]
+        for name, rows, filter in [("all", all_rows, None), (f"{CANDIDATES_RATIO:.0%} candidates", candidate_rows, candidates)]:
+            for probe_ratio in PROBE_RATIOS:
+                recall, ann_time, brute_time = _run(index, vectors, queries, rows, filter, probe_ratio)
+                print(f"{name:>15} | probe {probe_ratio:>4.0%} | recall@{K} {recall:.3f} | "
+                      f"ann {ann_time * 1000:.2f}ms | brute force {brute_time * 1000:.2f}ms | "
+                      f"speedup {brute_time / ann_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compares the sparse-matrix TrendingAnaliser engine against the networkx one
+on synthetic ratings (1M by default) and checks that both rank the same top
+services.
+
+The networkx engine takes minutes at this size, pass a smaller number of
+ratings for it with the second argument (0 skips it).
+
+Run with the following command:
+python benchmarks/bench_trending.py [num_ratings] [num_networkx_ratings]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib.trending import TrendingAnaliser, SPARSE_ENGINE, NETWORKX_ENGINE
+from lib.utils import time_to_string
+
+NUM_RATINGS = 1_000_000
+NUM_USERS = 200_000
+NUM_SERVICES = 20_000
+POPULARITY_EXPONENT = 0.8  # Zipf exponent of the services popularity
+TOP_K = 20
+
+
+def _synthetic_ratings(num_ratings: int, seed: int = 42):
+    rng = random.Random(seed)
+    popularity = [1 / (rank + 1) ** POPULARITY_EXPONENT for rank in range(NUM_SERVICES)]
+    services = rng.choices(range(NUM_SERVICES), weights=popularity, k=num_ratings)
+    return [(f"U{rng.randrange(NUM_USERS)}", f"S{service}", float(rng.choice([3, 4, 5]))) for service in services]
+
+
+def _run(scores, engine):
+    start = time.time()
+    ranking = TrendingAnaliser(scores, engine=engine).get_services_rank()
+    return ranking, time.time() - start
+
+
+def _top(ranking):
+    # Rounded so that float noise between engines does not reorder ties
+    return [service for service, _ in sorted(ranking.items(), key=lambda x: (-round(x[1]["TRENDING_SCORE"], 12), x[0]))[:TOP_K]]
+
+
+def main():
+    num_ratings = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_RATINGS
+    num_networkx_ratings = int(sys.argv[2]) if len(sys.argv) > 2 else num_ratings
+
+    scores = _synthetic_ratings(num_ratings)
+    sparse_ranking, sparse_time = _run(scores, SPARSE_ENGINE)
+    print(f"{num_ratings} ratings, {len(sparse_ranking)} services")
+    print(f"Sparse engine:   {time_to_string(sparse_time)}")
+
+    if not num_networkx_ratings:
+        return
+    if num_networkx_ratings != num_ratings:
+        scores = scores[:num_networkx_ratings]
+        sparse_ranking, sparse_time = _run(scores, SPARSE_ENGINE)
+        print(f"Sparse engine ({num_networkx_ratings} ratings): {time_to_string(sparse_time)}")
+    networkx_ranking, networkx_time = _run(scores, NETWORKX_ENGINE)
+    print(f"Networkx engine ({num_networkx_ratings} ratings): {time_to_string(networkx_time)}")
+    print(f"Speedup: {networkx_time / sparse_time:.1f}x")
+
+    max_error = max(abs(sparse_ranking[service]["TRENDING_SCORE"] - networkx_ranking[service]["TRENDING_SCORE"])
+                    for service in networkx_ranking)
+    print(f"Max score difference: {max_error:.2e}")
+    print(f"Same top {TOP_K}: {_top(sparse_ranking) == _top(networkx_ranking)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -36,6 +36,7 @@ class Rentals:
         else:
             self.db = self.client[os.getenv('MONGO_DB')]
         self.collection = self.db['rentals']
+        self.stats = self.db['rental_stats']
         self._create_collection()
     
     def _check_connection(self):
@@ -48,11 +49,19 @@ class Rentals:
 
     def _create_collection(self):
         self.collection.create_index([('uuid', ASCENDING)], unique=True)
-        self.collection.create_index([('provider_id', ASCENDING)])
+        self.collection.create_index([('provider_id', ASCENDING), ('date', ASCENDING)])
         self.collection.create_index([('client_id', ASCENDING)])
     
+    # Read from the per (provider, month) rollup maintained by the ServicesService rentals manager.
+    # A provider without entries (e.g. the rollup is not seeded yet) is counted from the rentals
     def total_rentals(self, provider_id: str) -> int:
-        return self.collection.count_documents({'provider_id': provider_id})
+        stats = list(self.stats.find({'provider_id': provider_id}, {'total': 1}))
+        if not stats:
+            return self.collection.count_documents({'provider_id': provider_id})
+        return sum(entry['total'] for entry in stats)
     
     def finished_rentals(self, provider_id: str) -> int:
-        return self.collection.count_documents({'provider_id': provider_id, 'status': 'FINISHED'})
\ No newline at end of file
+        stats = list(self.stats.find({'provider_id': provider_id}, {'by_status': 1}))
+        if not stats:
+            return self.collection.count_documents({'provider_id': provider_id, 'status': 'FINISHED'})
+        return sum(entry['by_status'].get('FINISHED', 0) for entry in stats)
\ No newline at end of file
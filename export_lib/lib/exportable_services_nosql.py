@@ -53,7 +53,8 @@ class Services:
 
     def _create_collection(self):
         self.collection.create_index([('uuid', ASCENDING)], unique=True)
-        self.collection.create_index([('location', '2dsphere')])
+        # Same location index as the ServicesService manager: $geoNear fails with two 2dsphere indexes
+        self.collection.create_index([('location', '2dsphere'), ('category', ASCENDING), ('avg_rating', ASCENDING)])
     
     def ratings_by_provider(self, provider_id: str) -> Optional[Dict]:
         results = self.collection.aggregate([
@@ -0,0 +1,337 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import fcntl
+import json
+import math
+import os
+import shutil
+import threading
+import numpy as np
+
+MIN_TRAIN_SIZE = 1_000  # Below it a partition is searched exhaustively
+RETRAIN_FACTOR = 2  # The centroids are trained again when the partition doubles since the last training
+KMEANS_ITERATIONS = 10
+DEFAULT_PROBE_RATIO = 0.1  # Of the lists probed by a search
+# Scoring a candidate exhaustively (id lookup and copy of its vector) costs about
+# this many vectors scored in place by a probed list (see benchmarks/bench_similarity_index.py)
+EXACT_SEARCH_COST = 6
+RATIO_SAMPLE_SIZE = 256  # Vectors sampled to estimate the ratio of candidates of a search
+
+MANIFEST_FILE = "manifest.json"
+
+
+class IVFIndex:
+    """
+    Inverted file index over normalized vectors (inner product = cosine similarity).
+    The vectors are clustered with k-means in about sqrt(n) lists and a search only
+    scores the vectors of the lists whose centroids are closest to the query.
+    - The vectors of each list are contiguous, so that a list is scored without
+      copying it. Vectors added after the training are appended and go to the
+      extra rows of their closest list; deleted ones are marked and dropped on
+      the next training or save.
+    - The vectors can be memory mapped from disk (see load), they are copied
+      to memory on the first write.
+    """
+
+    def __init__(self, dim: int, seed: int = 0):
+        self.dim = dim
+        self._rng = np.random.default_rng(seed)
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self._size = 0  # Rows in use, deleted ones included
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self.centroids = np.empty((0, dim), dtype=np.float32)
+        self._bounds = np.zeros(1, dtype=np.int64)  # List i is rows bounds[i]:bounds[i + 1]
+        self._extra_rows: List[np.ndarray] = []  # Rows added to each list after the training
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self._rows
+
+    def _reserve(self, rows: int):
+        capacity = len(self._vectors)
+        if self._size + rows <= capacity and self._vectors.flags.writeable:
+            return
+        capacity = max(self._size + rows, 2 * capacity, 16)
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._vectors, self._alive = vectors, alive
+
+    def add(self, id: str, vector: np.ndarray, train: bool = True):
+        """
+        With train=False the centroids are not trained again (e.g. while building).
+        """
+        if id in self._rows:
+            self.delete(id)
+        self._reserve(1)
+        row = self._size
+        self._vectors[row] = vector
+        self._alive[row] = True
+        self._ids.append(id)
+        self._rows[id] = row
+        self._size += 1
+        if len(self.centroids):
+            closest = int(np.argmax(self.centroids @ self._vectors[row]))
+            self._extra_rows[closest] = np.append(self._extra_rows[closest], row)
+        if train and len(self) >= MIN_TRAIN_SIZE and len(self) >= RETRAIN_FACTOR * self._trained_size:
+            self.train()
+
+    def get_vector(self, id: str) -> Optional[np.ndarray]:
+        row = self._rows.get(id)
+        return None if row is None else self._vectors[row]
+
+    def delete(self, id: str) -> bool:
+        row = self._rows.pop(id, None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        return True
+
+    def _assignments(self) -> np.ndarray:
+        assignments = np.zeros(self._size, dtype=np.int64)
+        for i in range(len(self.centroids)):
+            assignments[self._bounds[i]:self._bounds[i + 1]] = i
+            assignments[self._extra_rows[i]] = i
+        return assignments
+
+    def _reorganize(self, assignments: np.ndarray):
+        """
+        Keeps the vectors not deleted, sorted by list (assignments: list of each row).
+        """
+        rows = np.flatnonzero(self._alive[:self._size])
+        rows = rows[np.argsort(assignments[rows], kind="stable")]
+        self._vectors = np.ascontiguousarray(self._vectors[rows])
+        self._alive = np.ones(len(rows), dtype=bool)
+        self._ids = [self._ids[row] for row in rows.tolist()]
+        self._rows = {id: row for row, id in enumerate(self._ids)}
+        self._size = len(rows)
+        self._bounds = np.searchsorted(assignments[rows], np.arange(len(self.centroids) + 1))
+        self._bounds[-1] = self._size
+        self._extra_rows = [np.empty(0, dtype=np.int64) for _ in range(len(self.centroids))]
+
+    def train(self, num_lists: Optional[int] = None):
+        """
+        Drops the deleted vectors and clusters the rest with spherical k-means.
+        """
+        self.centroids = np.empty((0, self.dim), dtype=np.float32)
+        self._reorganize(np.zeros(self._size, dtype=np.int64))
+        vectors = self._vectors[:self._size]
+        num_lists = min(num_lists or int(math.sqrt(self._size)), self._size)
+        self._trained_size = self._size
+        if num_lists <= 1:
+            return
+        centroids = vectors[self._rng.choice(self._size, num_lists, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, vectors)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # An empty list keeps its centroid
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids).astype(np.float32)
+        self.centroids = centroids
+        self._reorganize(np.argmax(vectors @ centroids.T, axis=1))
+
+    def _top_k(self, rows: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        if len(rows) == 0 or k <= 0:
+            return []
+        if len(rows) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[best], scores[best]
+        order = np.argsort(-scores, kind="stable")
+        return [(self._ids[row], float(score)) for row, score in zip(rows[order].tolist(), scores[order].tolist())]
+
+    def _exact(self, rows: np.ndarray, query: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        return self._top_k(rows, self._vectors[rows] @ query, k)
+
+    def _score_lists(self, lists: np.ndarray, query: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if len(lists) == len(self.centroids):
+            # Every row, in a single product
+            return np.arange(self._size), self._vectors[:self._size] @ query
+        rows = [np.arange(self._bounds[i], self._bounds[i + 1]) for i in lists]
+        scores = [self._vectors[self._bounds[i]:self._bounds[i + 1]] @ query for i in lists]
+        extra_rows = np.concatenate([self._extra_rows[i] for i in lists])
+        return np.concatenate(rows + [extra_rows]), np.concatenate(scores + [self._vectors[extra_rows] @ query])
+
+    def _candidates_ratio(self, candidates: Set[str]) -> float:
+        # Evenly spaced rows, so that the sample spans every list
+        rows = np.arange(0, self._size, max(1, self._size // RATIO_SAMPLE_SIZE))
+        rows = rows[self._alive[rows]]
+        return sum(self._ids[row] in candidates for row in rows.tolist()) / max(len(rows), 1)
+
+    def _top_k_candidates(self, rows: np.ndarray, scores: np.ndarray, k: int, candidates: Set[str],
+                          ratio: float) -> List[Tuple[str, float]]:
+        # Only the best scores are checked, about k / ratio of them are candidates
+        checked = min(len(rows), math.ceil(2 * k / ratio))
+        while True:
+            results = [(id, score) for id, score in self._top_k(rows, scores, checked) if id in candidates]
+            if len(results) >= k or checked == len(rows):
+                return results[:k]
+            checked = min(len(rows), 2 * checked)
+
+    def search(self, query: np.ndarray, k: int, candidates: Optional[Iterable[str]] = None,
+               probe_ratio: float = DEFAULT_PROBE_RATIO) -> List[Tuple[str, float]]:
+        """
+        Top k (id, similarity) of the query, only among the candidates if given.
+        The candidates are spread over the lists, so a filtered search probes
+        1 / ratio (of the candidates) times more lists for the recall of an
+        unfiltered one. When that costs more than scoring the candidates
+        exhaustively (see EXACT_SEARCH_COST), they are scored exhaustively.
+        More lists are probed until k results are found.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        if candidates is not None:
+            if not isinstance(candidates, (set, frozenset)):
+                candidates = set(candidates)
+            ratio = self._candidates_ratio(candidates) if len(self.centroids) else 0
+            if min(1, probe_ratio / ratio if ratio else 1) >= EXACT_SEARCH_COST * ratio:
+                rows = np.array([row for row in map(self._rows.get, candidates) if row is not None], dtype=np.int64)
+                return self._exact(rows, query, k)
+            probe_ratio /= ratio
+        elif not len(self.centroids):
+            return self._exact(np.flatnonzero(self._alive[:self._size]), query, k)
+
+        lists = np.argsort(-(self.centroids @ query))
+        probe = max(1, math.ceil(probe_ratio * len(lists)))
+        while True:
+            rows, scores = self._score_lists(lists[:probe], query)
+            alive = self._alive[rows]
+            rows, scores = rows[alive], scores[alive]
+            if candidates is None:
+                results = self._top_k(rows, scores, k)
+            else:
+                results = self._top_k_candidates(rows, scores, k, candidates, ratio)
+            if len(results) >= k or probe >= len(lists):
+                return results
+            probe *= 2
+
+    def save(self, path: str):
+        self._reorganize(self._assignments())
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), self._vectors[:self._size])
+        np.save(os.path.join(path, "ids.npy"), np.array(self._ids, dtype=str))
+        np.save(os.path.join(path, "centroids.npy"), self.centroids)
+        np.save(os.path.join(path, "bounds.npy"), self._bounds)
+        with open(os.path.join(path, "trained_size.json"), "w") as file:
+            json.dump(self._trained_size, file)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        index = cls(vectors.shape[1])
+        index._vectors = vectors
+        index._size = len(vectors)
+        index._alive = np.ones(index._size, dtype=bool)
+        index._ids = np.load(os.path.join(path, "ids.npy")).tolist()
+        index._rows = {id: row for row, id in enumerate(index._ids)}
+        index.centroids = np.load(os.path.join(path, "centroids.npy"))
+        index._bounds = np.load(os.path.join(path, "bounds.npy"))
+        index._extra_rows = [np.empty(0, dtype=np.int64) for _ in range(len(index.centroids))]
+        with open(os.path.join(path, "trained_size.json")) as file:
+            index._trained_size = json.load(file)
+        return index
+
+
+class PartitionedIndex:
+    """
+    One IVFIndex per partition (e.g. the category of the services), an id
+    belongs to a single partition. The metadata (JSON) is saved with the index.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self.partitions: Dict[str, IVFIndex] = {}
+        self._partition_of: Dict[str, str] = {}
+        self.metadata: Dict = {}
+
+    def __len__(self) -> int:
+        return len(self._partition_of)
+
+    @classmethod
+    def build(cls, dim: int, items: Iterable[Tuple[str, str, np.ndarray]]) -> "PartitionedIndex":
+        """
+        items: (id, partition, vector)
+        """
+        index = cls(dim)
+        for id, partition, vector in items:
+            index._add(id, partition, vector, train=False)
+        for partition in index.partitions.values():
+            if len(partition) >= MIN_TRAIN_SIZE:
+                partition.train()
+        return index
+
+    def _add(self, id: str, partition: str, vector: np.ndarray, train: bool = True):
+        old_partition = self._partition_of.get(id)
+        if old_partition == partition and np.array_equal(self.partitions[partition].get_vector(id), vector):
+            return
+        if old_partition is not None and old_partition != partition:
+            self.partitions[old_partition].delete(id)
+        if partition not in self.partitions:
+            self.partitions[partition] = IVFIndex(self.dim)
+        self.partitions[partition].add(id, vector, train)
+        self._partition_of[id] = partition
+
+    def add(self, id: str, partition: str, vector: np.ndarray):
+        with self._lock:
+            self._add(id, partition, vector)
+
+    def delete(self, id: str) -> bool:
+        with self._lock:
+            partition = self._partition_of.pop(id, None)
+            if partition is None:
+                return False
+            return self.partitions[partition].delete(id)
+
+    def get_partition(self, id: str) -> Optional[str]:
+        return self._partition_of.get(id)
+
+    def search(self, partition: str, query: np.ndarray, k: int, candidates: Optional[Iterable[str]] = None,
+               probe_ratio: float = DEFAULT_PROBE_RATIO) -> List[Tuple[str, float]]:
+        with self._lock:
+            if partition not in self.partitions:
+                return []
+            return self.partitions[partition].search(query, k, candidates, probe_ratio)
+
+    def save(self, path: str):
+        """
+        Writes the index to a new directory that then replaces the one at path.
+        Several processes can save to the same path (the last one wins).
+        """
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        with self._lock:
+            partitions = {}
+            for i, (name, partition) in enumerate(self.partitions.items()):
+                partitions[name] = f"partition_{i}"
+                partition.save(os.path.join(tmp_path, partitions[name]))
+            with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as file:
+                json.dump({"dim": self.dim, "partitions": partitions, "metadata": self.metadata}, file)
+        with open(f"{path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            old_path = f"{path}.old"
+            shutil.rmtree(old_path, ignore_errors=True)
+            if os.path.exists(path):
+                os.replace(path, old_path)
+            os.replace(tmp_path, path)
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str) -> "PartitionedIndex":
+        """
+        The vectors are memory mapped, only the ids and the centroids are read.
+        """
+        with open(os.path.join(path, MANIFEST_FILE)) as file:
+            manifest = json.load(file)
+        index = cls(manifest["dim"])
+        index.metadata = manifest.get("metadata", {})
+        for name, directory in manifest["partitions"].items():
+            partition = IVFIndex.load(os.path.join(path, directory))
+            index.partitions[name] = partition
+            index._partition_of.update((id, name) for id in partition._rows)
+        return index
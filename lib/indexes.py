@@ -0,0 +1,80 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+from pymongo.errors import OperationFailure
+import logging as logger
+
+ID_INDEX = '_id_'
+
+
+class Index(NamedTuple):
+    """
+    Index declared by a manager for the queries it runs.
+    The name is the default one of MongoDB, so existing indexes are recognized.
+    """
+    keys: List[Tuple[str, Union[int, str]]]
+    unique: bool = False
+
+    @property
+    def name(self) -> str:
+        return '_'.join(f"{field}_{direction}" for field, direction in self.keys)
+
+
+def ensure_indexes(collection, indexes: List[Index]) -> List[str]:
+    """
+    Creates the indexes that do not exist yet (create_index is a no-op for the
+    existing ones) and returns the names of the indexes in place.
+    An index that can not be created (e.g. a unique index over duplicated values)
+    is logged and left missing, so that it shows up in index_report.
+    """
+    created = []
+    for index in indexes:
+        try:
+            collection.create_index(index.keys, unique=index.unique, name=index.name)
+            created.append(index.name)
+        except OperationFailure as e:
+            logger.error(f"Error creating index '{index.name}' on '{collection.name}': {e}")
+    return created
+
+
+def drop_indexes(collection, names: List[str]) -> List[str]:
+    """
+    Drops the given indexes if they exist (e.g. replaced ones that would conflict
+    with the new layout), returns the names of the dropped ones.
+    """
+    existing = collection.index_information()
+    dropped = []
+    for name in names:
+        if name in existing:
+            collection.drop_index(name)
+            dropped.append(name)
+    return dropped
+
+
+def _index_usage(collection) -> Optional[Dict[str, int]]:
+    try:
+        return {stats['name']: stats['accesses']['ops'] for stats in collection.aggregate([{'$indexStats': {}}])}
+    except (OperationFailure, NotImplementedError):
+        return None
+
+
+def index_report(collection, indexes: List[Index]) -> dict:
+    """
+    - missing: declared indexes that do not exist
+    - mismatched: declared indexes that exist with other unique option
+    - undeclared: existing indexes that no manager declares
+    - unused: existing indexes without accesses since the server started
+      (None if $indexStats is not available)
+    """
+    existing = collection.index_information()
+    declared = {index.name: index for index in indexes}
+    usage = _index_usage(collection)
+    return {
+        'missing': [name for name in declared if name not in existing],
+        'mismatched': [name for name, index in declared.items()
+                       if name in existing and existing[name].get('unique', False) != index.unique],
+        'undeclared': [name for name in existing if name not in declared and name != ID_INDEX],
+        'unused': None if usage is None else [name for name, ops in usage.items() if ops == 0 and name != ID_INDEX]
+    }
+
+
+def report_indexes(db, collections: Dict[str, List[Index]]) -> Dict[str, dict]:
+    return {name: index_report(db[name], indexes) for name, indexes in collections.items()}
@@ -1,19 +1,33 @@
-from typing import List, Tuple
+from typing import List, Tuple, Union
 import networkx as nx
+import numpy as np
 import operator
 import random
+from lib.ratings_table import RatingsTable
 
 CLIENT_INDEX = 0
 SERVICE_INDEX = 1
 
+# Weight of the common neighbors against the centrality term of nx.common_neighbor_centrality
+CCPA_ALPHA = 0.8
+
+SPARSE_ENGINE = "sparse"
+NETWORKX_ENGINE = "networkx"
+
 class InterestPredictor:
-    def __init__(self, reviews: List[Tuple[str, str]], user_id: str):
-        self.bipartite_graph = self._create_bipartite_graph(reviews)
-        self.services = {r[SERVICE_INDEX]: reviews.count(r) for r in reviews}
+    def __init__(self, reviews: Union[RatingsTable, List[Tuple[str, str]]], user_id: str, engine: str = SPARSE_ENGINE):
+        if engine not in {SPARSE_ENGINE, NETWORKX_ENGINE}:
+            raise ValueError(f"Invalid engine: {engine}")
+        self.engine = engine
+        self.table = RatingsTable.of(reviews)
+        self.services = self.table.services_reviews()
         self.user_id = user_id
-        # self.existing_services = {service for (user, service) in reviews if user == user_id}
-        self._ebunch = self._get_ebunch(self.bipartite_graph, self.user_id)
-        self.data_graph = self._connect_users(reviews)
+        if engine == NETWORKX_ENGINE:
+            reviews = self.table.tuples()
+            self.bipartite_graph = self._create_bipartite_graph(reviews)
+            # self.existing_services = {service for (user, service) in reviews if user == user_id}
+            self._ebunch = self._get_ebunch(self.bipartite_graph, self.user_id)
+            self.data_graph = self._connect_users(reviews)
 
     def _create_bipartite_graph(self, reviews: List[Tuple[str, str]]) -> nx.Graph:
         bipartite_graph = nx.Graph()
@@ -35,7 +49,52 @@ class InterestPredictor:
                         data_graph.add_edge(user, other_user)
         return data_graph
                         
+    def _sparse_interest_prediction(self) -> dict:
+        """
+        Same scores as nx.common_neighbor_centrality on the graph of _connect_users
+        without building it: alpha * common_neighbors + (1 - alpha) * nodes / distance.
+        - The common neighbors of the user and a service are the users that scored
+          the service and share another service with the user (co-occurrences).
+        - The distance to a service is 1 + the distance to its closest reviewer in
+          the users graph, found with a breadth first search over the ratings matrix.
+        """
+        if not self.services:
+            return {}
+        user = self.table.clients_index.get(self.user_id)
+        if user is None:
+            raise nx.NodeNotFound(f"Node {self.user_id} not in graph.")
+        ratings = self.table.to_matrix(binary=True)
+        ratings_by_service = ratings.T.tocsr()
+        num_clients, num_services = ratings.shape
+
+        services_distance = np.full(num_services, np.inf)
+        visited = np.zeros(num_clients, dtype=bool)
+        visited[user] = True
+        frontier = np.zeros(num_clients)
+        frontier[user] = 1
+        common_neighbors = None
+        distance = 1
+        while True:
+            reached_services = (ratings_by_service @ frontier) > 0
+            services_distance[reached_services & np.isinf(services_distance)] = distance
+            reached_clients = ((ratings @ reached_services.astype(np.float64)) > 0) & ~visited
+            if common_neighbors is None:
+                common_neighbors = ratings_by_service @ reached_clients.astype(np.float64)
+            if not reached_clients.any():
+                break
+            visited |= reached_clients
+            frontier = reached_clients.astype(np.float64)
+            distance += 1
+
+        scores = CCPA_ALPHA * common_neighbors + (1 - CCPA_ALPHA) * (num_clients + num_services) / services_distance
+        candidates = np.ones(num_services, dtype=bool)
+        candidates[ratings.indices[ratings.indptr[user]:ratings.indptr[user + 1]]] = False
+        candidates = np.flatnonzero(candidates)
+        return dict(zip((self.table.service_ids[service] for service in candidates.tolist()), scores[candidates].tolist()))
+
     def get_interest_prediction(self) -> List[str]:
+        if self.engine == SPARSE_ENGINE:
+            return self._sparse_interest_prediction()
         predictions = nx.common_neighbor_centrality(self.data_graph, ebunch=self._ebunch)
         return {service: score for (user, service, score) in predictions}
 
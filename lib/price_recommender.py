@@ -31,8 +31,15 @@ nivel de fiabilidad:
         si el score es menor a 1 -> percentil hasta 30 (no hay minimo)
 """
 
+from typing import Dict, List, Optional, Tuple
+import os
+import threading
+import time
 from services_nosql import Services
-from lib.sentence_similarity import SentenceComparator
+from service_embeddings_nosql import ServiceEmbeddings, name_hash
+from lib.sentence_similarity import SentenceComparator, MODEL
+from lib.ann_index import PartitionedIndex
+from lib.utils import get_actual_time
 import numpy as np
 
 PERCENTILE_RANGES = {
@@ -56,6 +63,10 @@ RECOMMENDATION_FORMAT = {
 
 MINIMUM_SIMILARITY = 0.5
 
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH")  # Without it the index is built on start
+SIMILARITY_INDEX_SYNC_INTERVAL = float(os.getenv("SIMILARITY_INDEX_SYNC_INTERVAL", 60))  # Seconds
+BACKFILL_BATCH_SIZE = 256  # Names embedded at the same time when rebuilding
+
 # TODO: Test this class
 
 
@@ -63,6 +74,121 @@ class PriceRecommender:
     def __init__(self, test_client=None):
         self.services_manager = Services(test_client=test_client)
         self.sentences_comparator = SentenceComparator()
+        self.embeddings_manager = ServiceEmbeddings(MODEL, test_client=test_client)
+        self._sync_lock = threading.Lock()
+        self._last_sync = None
+        self._changed = False
+        if SIMILARITY_INDEX_PATH and os.path.exists(SIMILARITY_INDEX_PATH):
+            self.similarity_index = PartitionedIndex.load(SIMILARITY_INDEX_PATH)
+            # The snapshot misses the services written since it was saved
+            self.sync_similarity_index(force=True)
+        else:
+            self.rebuild_similarity_index()
+
+    def _save_similarity_index(self):
+        self._changed = False
+        if SIMILARITY_INDEX_PATH:
+            self.similarity_index.save(SIMILARITY_INDEX_PATH)
+
+    def rebuild_similarity_index(self) -> int:
+        """
+        Builds the index (one partition per category) from the stored embeddings of
+        the current names, embedding the services without one (e.g. created before
+        the embeddings were stored) in batches of BACKFILL_BATCH_SIZE.
+        """
+        synced_at = get_actual_time()
+        services = self.services_manager.get_names_and_categories()
+        embeddings = {uuid: embedding for uuid, stored_hash, embedding in self.embeddings_manager.get_all()
+                      if uuid in services and stored_hash == name_hash(services[uuid][0])}
+        missing = [uuid for uuid in services if uuid not in embeddings]
+        for start in range(0, len(missing), BACKFILL_BATCH_SIZE):
+            names = {uuid: services[uuid][0] for uuid in missing[start:start + BACKFILL_BATCH_SIZE]}
+            new_embeddings = dict(zip(names, self.sentences_comparator.embed(list(names.values()))))
+            self.embeddings_manager.save_many(new_embeddings, names)
+            embeddings.update(new_embeddings)
+        similarity_index = PartitionedIndex.build(self.sentences_comparator.dimension, (
+            (uuid, services[uuid][1], embedding) for uuid, embedding in embeddings.items()))
+        similarity_index.metadata['synced_at'] = synced_at
+        self.similarity_index = similarity_index
+        self._save_similarity_index()
+        return len(self.similarity_index)
+
+    def sync_similarity_index(self, force: bool = False) -> int:
+        """
+        Adds the services created or updated (by any process) since the index was
+        synced and saves it, at most every SIMILARITY_INDEX_SYNC_INTERVAL seconds.
+        Returns the number of services synced.
+        """
+        now = time.monotonic()
+        if not force and self._last_sync is not None and now - self._last_sync < SIMILARITY_INDEX_SYNC_INTERVAL:
+            return 0
+        if not self._sync_lock.acquire(blocking=False):
+            return 0  # Another request is syncing
+        try:
+            self._last_sync = now
+            synced_at = get_actual_time()
+            # Services updated in the same second are synced again, adding them is a no-op
+            services = self.services_manager.get_names_and_categories(self.similarity_index.metadata.get('synced_at'))
+            if services:
+                embeddings = self._get_name_embeddings({uuid: name for uuid, (name, _) in services.items()})
+                for uuid, (_, category) in services.items():
+                    self.similarity_index.add(uuid, category, embeddings[uuid])
+            self.similarity_index.metadata['synced_at'] = synced_at
+            if services or self._changed:
+                self._save_similarity_index()
+            return len(services)
+        finally:
+            self._sync_lock.release()
+
+    def index_service(self, service_id: str, service_name: str, category: str):
+        """
+        Computes the embedding of the name of a created or updated service.
+        """
+        embedding = self.sentences_comparator.embed([service_name])[0]
+        self.embeddings_manager.save_many({service_id: embedding}, {service_id: service_name})
+        self.similarity_index.add(service_id, category, embedding)
+        self._changed = True
+
+    def remove_service(self, service_id: str):
+        """
+        The other processes keep the service until they rebuild, the searches
+        only return the services still available.
+        """
+        self.embeddings_manager.delete(service_id)
+        self.similarity_index.delete(service_id)
+        self._changed = True
+
+    def _get_name_embeddings(self, names: Dict[str, str]) -> Dict[str, np.ndarray]:
+        """
+        Embeddings of the names of the given services (uuid -> name). Only the
+        services without an embedding of their current name (e.g. created before
+        them) are embedded.
+        """
+        embeddings = self.embeddings_manager.get_many(names)
+        missing = [uuid for uuid in names if uuid not in embeddings]
+        if missing:
+            new_embeddings = dict(zip(missing, self.sentences_comparator.embed([names[uuid] for uuid in missing])))
+            self.embeddings_manager.save_many(new_embeddings, names)
+            embeddings.update(new_embeddings)
+        return embeddings
+
+    def get_similar_services(self, service_id: str, suspended_providers: set[str], k: int) -> Optional[List[Tuple[str, float]]]:
+        """
+        Top k (uuid, similarity) of the services of the same category, available
+        at the location of the service, by similarity of their names.
+        """
+        self.sync_similarity_index()
+        service = self.services_manager.get(service_id)
+        if not service:
+            return None
+        location = {'longitude': service['location']['coordinates'][0],
+                    'latitude': service['location']['coordinates'][1]}
+        candidates = self.services_manager.search_uuids(suspended_providers, location, hidden=False)
+        embedding = self._get_name_embeddings({service_id: service['service_name']})[service_id]
+        if self.similarity_index.get_partition(service_id) is None:
+            self.similarity_index.add(service_id, service['category'], embedding)
+        return self.similarity_index.search(service['category'], embedding, k,
+                                            {uuid for uuid in candidates if uuid != service_id})
 
     def _get_similar_services_percentiles(self, location, category):
         services = self.services_manager.get_similar_services(
@@ -151,15 +277,19 @@ class PriceRecommender:
         category = service['category']
         
         similar_services = self.services_manager.search(
-            suspended_providers, location=location, category=category, min_avg_rating=score-0.5, max_avg_rating=score+0.5)
+            suspended_providers, client_location=location, category=category, min_avg_rating=score-0.5, max_avg_rating=score+0.5)
+        if not similar_services:
+            return np.nan
         similar_services = {
-            service['service_name']: service['price'] for service in similar_services}
-
-        similar_names = self.sentences_comparator.compare(
-            service['service_name'], list(similar_services.keys()))
-        similar_names = [
-            name for name, similarity in similar_names if similarity > MINIMUM_SIMILARITY]
-        similar_prices = [similar_services[name] for name in similar_names]
+            similar_service['uuid']: similar_service for similar_service in similar_services}
+
+        embeddings = self._get_name_embeddings({service_id: service['service_name'], **{
+            uuid: similar_service['service_name'] for uuid, similar_service in similar_services.items()}})
+        uuids = list(similar_services)
+        # Normalized embeddings: the cosine similarities are a single matrix-vector product
+        similarities = np.stack([embeddings[uuid] for uuid in uuids]) @ embeddings[service_id]
+        similar_prices = [similar_services[uuid]['price']
+                          for uuid, similarity in zip(uuids, similarities) if similarity > MINIMUM_SIMILARITY]
 
         return np.mean(similar_prices)
 
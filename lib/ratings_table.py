@@ -0,0 +1,70 @@
+from typing import Dict, List, Sequence, Tuple, Union
+import numpy as np
+import scipy.sparse as sp
+
+CLIENT_INDEX = 0
+SERVICE_INDEX = 1
+SCORE_INDEX = 2
+
+
+class RatingsTable:
+    """
+    Columnar view of (client, service[, score]) tuples, built in one pass.
+    - clients_index / services_index: id -> row / column index (in order of appearance)
+    - clients, services, scores: one entry per tuple (scores are 1 without a score column)
+    - reviews_count: number of reviews of each service
+    - clients_degree: number of reviews of each client
+    """
+
+    def __init__(self, ratings: Sequence[Tuple]):
+        self.clients_index: Dict[str, int] = {}
+        self.services_index: Dict[str, int] = {}
+        size = len(ratings)
+        self.clients = np.fromiter((self.clients_index.setdefault(rating[CLIENT_INDEX], len(self.clients_index))
+                                    for rating in ratings), dtype=np.int64, count=size)
+        self.services = np.fromiter((self.services_index.setdefault(rating[SERVICE_INDEX], len(self.services_index))
+                                     for rating in ratings), dtype=np.int64, count=size)
+        if size and len(ratings[0]) > SCORE_INDEX:
+            self.scores = np.fromiter((rating[SCORE_INDEX] for rating in ratings), dtype=np.float64, count=size)
+        else:
+            self.scores = np.ones(size, dtype=np.float64)
+
+        self.client_ids: List[str] = list(self.clients_index)
+        self.service_ids: List[str] = list(self.services_index)
+        self.reviews_count = np.bincount(self.services, minlength=len(self.service_ids))
+        self.clients_degree = np.bincount(self.clients, minlength=len(self.client_ids))
+        self._matrices: Dict[bool, sp.csr_matrix] = {}
+
+    @classmethod
+    def of(cls, ratings: Union["RatingsTable", Sequence[Tuple]]) -> "RatingsTable":
+        return ratings if isinstance(ratings, RatingsTable) else cls(ratings)
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def services_reviews(self) -> Dict[str, int]:
+        return dict(zip(self.service_ids, self.reviews_count.tolist()))
+
+    def tuples(self) -> List[Tuple[str, str, float]]:
+        return [(self.client_ids[client], self.service_ids[service], score)
+                for client, service, score in zip(self.clients.tolist(), self.services.tolist(), self.scores.tolist())]
+
+    def _last_scores(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # A client reviewing the same service twice keeps the last score
+        keys = self.clients * len(self.service_ids) + self.services
+        _, last = np.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - last
+        return self.clients[last], self.services[last], self.scores[last]
+
+    def to_matrix(self, binary: bool = False) -> sp.csr_matrix:
+        """
+        clients x services matrix with the scores (or 1 if binary). It is built
+        once per table (the table does not change), so it must not be modified.
+        """
+        matrix = self._matrices.get(binary)
+        if matrix is None:
+            clients, services, scores = self._last_scores()
+            values = np.ones_like(scores) if binary else scores
+            matrix = sp.csr_matrix((values, (clients, services)), shape=(len(self.client_ids), len(self.service_ids)))
+            self._matrices[binary] = matrix
+        return matrix
@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import threading
+import time
+
+DEFAULT_MAX_ENTRIES = 1_000
+DEFAULT_TTL = 10 * 60  # seconds
+DEFAULT_SYNC_INTERVAL = 5  # seconds
+
+
+class RegionCache:
+    """
+    In-process LRU cache for values computed from the ratings of a region.
+    Each entry remembers the services it was computed from (if any), so that a
+    review of a service only invalidates the entries that include that service.
+    Entries also expire after ttl seconds, as the time window of the ratings
+    moves forward.
+    The invalidations only reach this process, see ServicesUpdatesFeed for the
+    updates made through other processes.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Set[str], float]]" = OrderedDict()
+        self._keys_by_service: Dict[str, Set[Hashable]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._clock() >= entry[2]:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, services: Iterable[str]):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            services = set(services)
+            self._entries[key] = (value, services, self._clock() + self.ttl)
+            for service in services:
+                self._keys_by_service.setdefault(service, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_service(self, service: str) -> int:
+        """
+        Removes the entries computed from the given service, returns how many.
+        """
+        with self._lock:
+            keys = list(self._keys_by_service.get(service, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def _remove(self, key: Hashable):
+        _, services, _ = self._entries.pop(key)
+        for service in services:
+            keys = self._keys_by_service.get(service)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_service[service]
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl
+        }
+
+
+class ServicesUpdatesFeed:
+    """
+    Invalidates the cached entries of the services updated by any process (e.g.
+    reviewed through another worker), polling at most every interval seconds.
+    updated_since(since) returns the (service, updated_at) pairs of the services
+    updated at or after since. The timestamps are strings that sort in time order
+    (with a resolution of a second), so the services already seen at the last
+    timestamp are skipped when it is polled again.
+    """
+
+    def __init__(self, caches: List[RegionCache], updated_since: Callable[[str], Iterable[Tuple[str, str]]], since: str,
+                 interval: float = DEFAULT_SYNC_INTERVAL, clock: Callable[[], float] = time.monotonic):
+        self.caches = caches
+        self.interval = interval
+        self._updated_since = updated_since
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._since = since
+        self._seen: Set[str] = set()
+        self._synced_at: Optional[float] = None
+        self.updates = 0
+
+    def sync(self, force: bool = False) -> int:
+        """
+        Returns the number of updated services found since the last sync.
+        """
+        with self._lock:
+            now = self._clock()
+            if not force and self._synced_at is not None and now - self._synced_at < self.interval:
+                return 0
+            self._synced_at = now
+            updates = [(service, updated_at) for service, updated_at in self._updated_since(self._since)
+                       if updated_at > self._since or service not in self._seen]
+            for service, updated_at in updates:
+                for cache in self.caches:
+                    cache.invalidate_service(service)
+                if updated_at > self._since:
+                    self._since, self._seen = updated_at, set()
+                if updated_at == self._since:
+                    self._seen.add(service)
+            self.updates += len(updates)
+            return len(updates)
+
+    def stats(self) -> dict:
+        return {
+            'updates': self.updates,
+            'since': self._since,
+            'interval': self.interval
+        }
@@ -1,73 +1,51 @@
 import datetime
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
-from random import shuffle
-import multiprocessing
-from queue import Queue
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import logging as logger
 from services_nosql import Services
 from ratings_nosql import Ratings
+from summary_jobs_nosql import SummaryJobs
+from summary_chunks_nosql import SummaryChunks
+from lib.summarization_server import SummarizationServer
+from lib.utils import time_to_string
 import time
 
-MAX_INPUT_LEN = 2**13  # 8192
 HEADER_TEXT = "Customers reviews about <NAME>:\n"
-MODEL = "facebook/bart-large-cnn"
-MAX_WORKERS = 10
+MAX_WORKERS = 10  # Services summarized at the same time, their chunks share the model batches
 MAX_REVIEWS_TIME = 365  # days
 
-WAIT_WORKER_TIME = 60  # seconds
+SUMMARY_POLL_INTERVAL = 60  # seconds
 
-# TODO: Test this class
+SPECIAL_TOKENS = 2  # Added by the tokenizer to each input (e.g. <s> and </s>)
+# A review whose hash is a multiple of it ends the chunk if it is at least CHUNK_MIN_FILL
+# full, so that after a changed review the following chunks are the same as before
+CHUNK_BOUNDARY_MODULUS = 4
+CHUNK_MIN_FILL = 0.5
 
 
 class ReviewSummarizer:
+    """
+    Enqueues the services whose reviews changed. There is one job per service and
+    day, so all the reviews of a day cost a single summary, run by summary_scheduler.
+    """
+
     def __init__(self, test_client=None):
-        self.services_manager = Services(test_client=test_client)
-        self.ratings_manager = Ratings(test_client=test_client)
-        self.services_queues = {}
-        self.actual_workers = []
-
-    def _attempt_to_process_services(self):
-        self.actual_workers = [
-            worker for worker in self.actual_workers if worker.is_alive()]
-        while len(self.actual_workers) < MAX_WORKERS:
-            days_to_process = self.services_queues.keys()
-            next_day_to_process = None if not days_to_process else min(
-                days_to_process)
-            if not days_to_process or (next_day_to_process - datetime.datetime.now().date()).days > 1:
-                return
-            queue = self.services_queues[next_day_to_process]
-            next_service_id = queue.get()
-            if queue.empty():
-                self.services_queues.pop(next_day_to_process)
-            worker = multiprocessing.Process(
-                target=update_service, args=(next_service_id,))
-            worker.start()
-            self.actual_workers.append(worker)
-
-    def add_service(self, service_id):
+        self.jobs_manager = SummaryJobs(test_client=test_client)
+
+    def add_service(self, service_id) -> bool:
         tomorrow_date = (datetime.datetime.now() +
                          datetime.timedelta(days=1)).date()
-        if not self.services_queues.get(tomorrow_date):
-            self.services_queues[tomorrow_date] = Queue()
-        self.services_queues[tomorrow_date].put(service_id)
-        self._attempt_to_process_services()
+        return self.jobs_manager.add(service_id, tomorrow_date)
 
-def update_service(service_id):
-    services_manager = Services()
-    ratings_manager = Ratings()
+    def stats(self) -> dict:
+        return self.jobs_manager.stats()
 
+def update_service(services_manager: Services, ratings_manager: Ratings, chunks_manager: SummaryChunks, summarizer, service_id):
     service = services_manager.get(service_id)
     if not service:
         return
 
-    last_update = service.get(
-        'reviews_summary_updated_at', datetime.datetime.min)
-    if last_update:
-        if isinstance(last_update, str):
-            last_update = datetime.datetime.fromisoformat(last_update)
-        if (datetime.datetime.now() - last_update).days < 1:
-            return
-        return
-
     reviews = ratings_manager.get_recent_comments_by_service(
         MAX_REVIEWS_TIME, service_id)
 
@@ -75,61 +53,138 @@ def update_service(service_id):
         return
 
     service_name = service["service_name"]
-    summary = sum_all(reviews, service_name)
+    summary, chunks = sum_all(reviews, service_name, summarizer, chunks_manager.get(service_id))
+    chunks_manager.replace(service_id, chunks)
     if not summary or len(summary) == 0:
-
         return
 
-
     services_manager.update(service_id, {
                             'reviews_summary': summary, 'reviews_summary_updated_at': datetime.datetime.now()})
-    
-def sum_all(reviews, service_name):
-    if len(reviews) == 0:
-        return ""
 
-    inputs = prepare_inputs(reviews, service_name)
-    summaries = []
-
-    # for inp in inputs:
-    #     summary = self._summarize(inp, max_length=600, min_length=180)
-    #     summaries.append(summary)
-    with multiprocessing.Pool() as pool:
-        summaries = pool.map(summarize, inputs)
-
-    return summaries[0] if len(summaries) == 1 else sum_all(summaries, service_name)
+def _run_job(jobs_manager: SummaryJobs, services_manager: Services, ratings_manager: Ratings, chunks_manager: SummaryChunks,
+             summarizer, job) -> int:
+    try:
+        update_service(services_manager, ratings_manager, chunks_manager, summarizer, job['service_id'])
+    except Exception as e:
+        dead = jobs_manager.fail(job, str(e))
+        logger.error(f"Error summarizing the reviews of service '{job['service_id']}'{' (dead)' if dead else ''}: {e}")
+        return 0
+    jobs_manager.complete(job)
+    return 1
+
+def run_due_jobs(jobs_manager: SummaryJobs, services_manager: Services, ratings_manager: Ratings, chunks_manager: SummaryChunks,
+                 summarizer, workers: int = MAX_WORKERS) -> int:
+    """
+    Runs the available jobs, up to `workers` at the same time, until there are none
+    left. Returns the number of jobs done.
+    """
+    def worker() -> int:
+        done = 0
+        while (job := jobs_manager.claim()) is not None:
+            done += _run_job(jobs_manager, services_manager, ratings_manager, chunks_manager, summarizer, job)
+        return done
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(lambda _: worker(), range(workers)))
+
+def summary_scheduler():
+    jobs_manager = SummaryJobs()
+    services_manager = Services()
+    ratings_manager = Ratings()
+    chunks_manager = SummaryChunks()
+    server = SummarizationServer().start()
+    while True:
+        start = time.time()
+        try:
+            done = run_due_jobs(jobs_manager, services_manager, ratings_manager, chunks_manager, server)
+            if done:
+                logger.info(f"{done} reviews summaries updated in {time_to_string(time.time() - start)} ({server.stats()})")
+            jobs_manager.delete_finished_before(datetime.datetime.now().date())
+        except Exception as e:
+            logger.error(f"Error running the summary jobs: {e}")
+        time.sleep(SUMMARY_POLL_INTERVAL)
     
-def prepare_inputs(reviews, name):
+def sum_all(reviews: List[str], service_name: str, summarizer, cached: Optional[Dict[str, str]] = None) -> Tuple[str, Dict[str, str]]:
+    """
+    Map-reduce: summarizes the chunks of reviews, then the chunks of their summaries,
+    until a single summary is left. Chunks whose summary is in cached (by hash of
+    the chunk text) are not summarized again.
+    summarizer: Summarizer or SummarizationServer, the chunks of each level are sent in one job.
+    Returns the summary and the summaries of every chunk used, to cache for the next run.
+    """
+    if len(reviews) == 0:
+        return "", {}
+
+    cached = cached or {}
+    used = {}
+    texts = reviews
+    while True:
+        inputs = prepare_inputs(texts, service_name, summarizer)
+        if texts is not reviews and len(inputs) == len(texts):
+            # The summaries do not fit together, they are paired so that every level halves them
+            inputs = prepare_pairs(texts, service_name, summarizer)
+        hashes = [_hash(text) for text in inputs]
+        missing = {text_hash: text for text_hash, text in zip(hashes, inputs) if text_hash not in cached}
+        if missing:
+            summaries = summarizer.summarize(list(missing.values()))
+            cached = {**cached, **dict(zip(missing, summaries))}
+        used.update({text_hash: cached[text_hash] for text_hash in hashes})
+        texts = [cached[text_hash] for text_hash in hashes]
+        if len(texts) == 1:
+            return texts[0], used
+
+def prepare_inputs(reviews: List[str], name: str, summarizer) -> List[str]:
+    """
+    Splits the reviews in chunks of up to the input tokens of the model, each
+    with the header of the service.
+    """
     header_text = HEADER_TEXT.replace("<NAME>", name)
-    extended_reviews = reviews * 3  # Extend reviews three times
-    shuffle(extended_reviews)
-
-    inputs = []
-    current_input = header_text
-
-    for review in extended_reviews:
-        review = review.replace('\\n', '  ')
-        if len(current_input) + len(review) + 1 >= MAX_INPUT_LEN:
-            inputs.append(current_input)
-            current_input = header_text
-        current_input += f"{review}\n"
-
-    if len(current_input) > len(header_text):
-        inputs.append(current_input)
-
-    return inputs
-
-def summarize(text, max_length=150, min_length=50):
-    tokenizer = AutoTokenizer.from_pretrained(MODEL)
-    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL)
-
-    input_ids = tokenizer.encode(
-        text, return_tensors="pt", add_special_tokens=True)
-
-    generated_ids = model.generate(input_ids=input_ids, num_beams=2, max_length=max_length,
-                                    min_length=min_length, repetition_penalty=2.5, length_penalty=0.5, early_stopping=True)
-
-    preds = [tokenizer.decode(
-        g, skip_special_tokens=True, clean_up_tokenization_spaces=True) for g in generated_ids]
-
-    return preds[0]
\ No newline at end of file
+    reviews = [review.replace('\\n', '  ') for review in reviews]
+    header_tokens, *reviews_tokens = summarizer.count_tokens([header_text] + reviews)
+    max_tokens = summarizer.max_input_tokens - header_tokens - SPECIAL_TOKENS
+    return [header_text + "".join(f"{review}\n" for review in chunk)
+            for chunk in split_chunks(reviews, reviews_tokens, max_tokens)]
+
+def prepare_pairs(texts: List[str], name: str, summarizer) -> List[str]:
+    """
+    Pairs of the texts, each truncated to half of the input tokens of the model,
+    with the header of the service.
+    """
+    header_text = HEADER_TEXT.replace("<NAME>", name)
+    texts = [text.replace('\\n', '  ') for text in texts]
+    header_tokens, *texts_tokens = summarizer.count_tokens([header_text] + texts)
+    max_tokens = (summarizer.max_input_tokens - header_tokens - SPECIAL_TOKENS) // 2 - 1  # Line break
+    texts = [_truncate(text, text_tokens, max_tokens, summarizer) for text, text_tokens in zip(texts, texts_tokens)]
+    return [header_text + "".join(f"{text}\n" for text in texts[start:start + 2]) for start in range(0, len(texts), 2)]
+
+def _truncate(text: str, tokens: int, max_tokens: int, summarizer) -> str:
+    """
+    Drops the last words of the text until it has up to max_tokens tokens.
+    """
+    words = text.split(" ")
+    while tokens > max_tokens and len(words) > 1:
+        words = words[:max(1, min(len(words) - 1, len(words) * max_tokens // tokens))]
+        text = " ".join(words)
+        tokens = summarizer.count_tokens([text])[0]
+    return text
+
+def split_chunks(texts: List[str], tokens: List[int], max_tokens: int) -> List[List[str]]:
+    chunks = []
+    chunk = []
+    chunk_tokens = 0
+    for text, text_tokens in zip(texts, tokens):
+        text_tokens += 1  # Line break
+        if chunk and chunk_tokens + text_tokens > max_tokens:
+            chunks.append(chunk)
+            chunk, chunk_tokens = [], 0
+        chunk.append(text)
+        chunk_tokens += text_tokens
+        if chunk_tokens >= max_tokens * CHUNK_MIN_FILL and int(_hash(text), 16) % CHUNK_BOUNDARY_MODULUS == 0:
+            chunks.append(chunk)
+            chunk, chunk_tokens = [], 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
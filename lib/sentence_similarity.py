@@ -1,41 +1,51 @@
 from transformers import AutoTokenizer, AutoModel
+from typing import List, Tuple
+import numpy as np
 import torch
 import torch.nn.functional as F
 
 MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = 64  # Sentences per forward pass
 
 class SentenceComparator:
     def __init__(self):
         self.tokenizer = AutoTokenizer.from_pretrained(MODEL)
         self.model = AutoModel.from_pretrained(MODEL)
 
+    @property
+    def dimension(self) -> int:
+        return self.model.config.hidden_size
+
     #Mean Pooling - Take attention mask into account for correct averaging
-    def _mean_pooling(model_output, attention_mask):
+    def _mean_pooling(self, model_output, attention_mask):
         token_embeddings = model_output[0] #First element of model_output contains all token embeddings
         input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
         return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
 
-    def compare(self, main_sentence, sentences):
-        sentences = [main_sentence] + sentences
+    def embed(self, sentences: List[str]) -> np.ndarray:
+        """
+        Normalized float32 embeddings (one row per sentence), so that the cosine
+        similarity of two sentences is the dot product of their rows.
+        """
+        embeddings = []
+        for start in range(0, len(sentences), EMBEDDING_BATCH_SIZE):
+            # Tokenize sentences
+            encoded_input = self.tokenizer(sentences[start:start + EMBEDDING_BATCH_SIZE], padding=True, truncation=True, return_tensors='pt')
 
-        # Tokenize sentences
-        encoded_input = self.tokenizer(sentences, padding=True, truncation=True, return_tensors='pt')
+            # Compute token embeddings
+            with torch.no_grad():
+                model_output = self.model(**encoded_input)
 
-        # Compute token embeddings
-        with torch.no_grad():
-            model_output = self.model(**encoded_input)
+            # Perform pooling
+            sentence_embeddings = self._mean_pooling(model_output, encoded_input['attention_mask'])
 
-        # Perform pooling
-        sentence_embeddings = self._mean_pooling(model_output, encoded_input['attention_mask'])
+            # Normalize embeddings
+            embeddings.append(F.normalize(sentence_embeddings, p=2, dim=1).numpy().astype(np.float32))
+        return np.concatenate(embeddings) if embeddings else np.empty((0, self.dimension), dtype=np.float32)
 
-        # Normalize embeddings
-        sentence_embeddings = F.normalize(sentence_embeddings, p=2, dim=1)
+    def compare(self, main_sentence: str, sentences: List[str]) -> List[Tuple[str, float]]:
+        sentences = [main_sentence] + sentences
+        embeddings = self.embed(sentences)
 
         # Get similarity results
-        results = []
-
-        for sentence, embedding in zip(sentences, sentence_embeddings):
-            distance = F.cosine_similarity(embedding.unsqueeze(0), sentence_embeddings[0].unsqueeze(0)).item()
-            results.append((sentence, distance))
-
-        return results
+        return list(zip(sentences, (embeddings @ embeddings[0]).tolist()))
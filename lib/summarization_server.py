@@ -0,0 +1,230 @@
+import logging as logger
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+from lib.utils import time_to_string
+
+MODEL = "facebook/bart-large-cnn"
+SUMMARY_BATCH_SIZE = 8  # Texts per generate call
+BATCH_WAIT_TIME = 0.1  # seconds, waiting for jobs of other services to fill a batch
+SUMMARY_TIMEOUT = 30 * 60  # seconds
+
+DEFAULT_MAX_LENGTH = 150  # tokens
+DEFAULT_MIN_LENGTH = 50  # tokens
+GENERATE_OPTIONS = {"num_beams": 2, "repetition_penalty": 2.5, "length_penalty": 0.5, "early_stopping": True}
+
+
+class Summarizer:
+    """
+    Seq2seq model loaded once, that summarizes several texts per generate call:
+    texts of similar length are padded together in batches of batch_size.
+    Keeps the load time and the tokens processed to report the throughput.
+    """
+
+    def __init__(self, tokenizer, model, batch_size: int = SUMMARY_BATCH_SIZE):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.batch_size = batch_size
+        self.max_input_tokens = min(tokenizer.model_max_length,
+                                    getattr(model.config, 'max_position_embeddings', tokenizer.model_max_length))
+        self.load_time = 0.0
+        self.texts = 0
+        self.batches = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.generate_time = 0.0
+
+    @classmethod
+    def load(cls, model_name: str = MODEL, batch_size: int = SUMMARY_BATCH_SIZE) -> "Summarizer":
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+        start = time.time()
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+        model.eval()
+        summarizer = cls(tokenizer, model, batch_size)
+        summarizer.load_time = time.time() - start
+        logger.info(f"Summarization model {model_name} loaded in {time_to_string(summarizer.load_time)}")
+        return summarizer
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        return _count_tokens(self.tokenizer, texts)
+
+    def summarize(self, texts: List[str], max_length: int = DEFAULT_MAX_LENGTH, min_length: int = DEFAULT_MIN_LENGTH) -> List[str]:
+        summaries = [None] * len(texts)
+        # Sorted by length, so that each batch pads as few tokens as possible
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+        for start in range(0, len(order), self.batch_size):
+            indexes = order[start:start + self.batch_size]
+            batch_summaries = self._generate([texts[index] for index in indexes], max_length, min_length)
+            for index, summary in zip(indexes, batch_summaries):
+                summaries[index] = summary
+        return summaries
+
+    def _generate(self, texts: List[str], max_length: int, min_length: int) -> List[str]:
+        import torch
+
+        inputs = self.tokenizer(texts, padding=True, truncation=True,
+                                max_length=self.max_input_tokens, return_tensors="pt")
+        start = time.time()
+        with torch.no_grad():
+            generated_ids = self.model.generate(**inputs, max_length=max_length, min_length=min_length, **GENERATE_OPTIONS)
+        self.generate_time += time.time() - start
+        self.texts += len(texts)
+        self.batches += 1
+        self.input_tokens += int(inputs["attention_mask"].sum())
+        self.output_tokens += int((generated_ids != self.tokenizer.pad_token_id).sum())
+        return self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True, clean_up_tokenization_spaces=True)
+
+    def stats(self) -> dict:
+        tokens = self.input_tokens + self.output_tokens
+        return {
+            "load_time": self.load_time,
+            "texts": self.texts,
+            "batches": self.batches,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "generate_time": self.generate_time,
+            "tokens_per_second": tokens / self.generate_time if self.generate_time else 0.0
+        }
+
+
+class SummarizationServer:
+    """
+    Long-lived process that owns the Summarizer. The threads of the parent process
+    send their jobs over a local queue and wait for the result; the texts of the
+    jobs waiting at the same time are summarized together.
+    """
+
+    def __init__(self, model_name: str = MODEL, batch_size: int = SUMMARY_BATCH_SIZE, batch_wait_time: float = BATCH_WAIT_TIME):
+        self.model_name = model_name
+        self._tokenizer = None
+        self._requests = multiprocessing.Queue()
+        self._responses = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=_serve, daemon=True, args=(
+            self._requests, self._responses, model_name, batch_size, batch_wait_time))
+        self._receiver = threading.Thread(target=self._receive, daemon=True)
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}
+        self._stats = {}
+
+    def start(self) -> "SummarizationServer":
+        self._process.start()
+        self._receiver.start()
+        return self
+
+    def stop(self):
+        self._requests.put(None)
+        self._process.join()
+
+    def is_alive(self) -> bool:
+        return self._process.is_alive()
+
+    def _get_tokenizer(self):
+        # Only the tokenizer is loaded here, to split the inputs in chunks
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return self._tokenizer
+
+    @property
+    def max_input_tokens(self) -> int:
+        return self._get_tokenizer().model_max_length
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        return _count_tokens(self._get_tokenizer(), texts)
+
+    def summarize(self, texts: List[str], max_length: int = DEFAULT_MAX_LENGTH, min_length: int = DEFAULT_MIN_LENGTH,
+                  timeout: float = SUMMARY_TIMEOUT) -> List[str]:
+        if not texts:
+            return []
+        job_id = str(uuid.uuid4())
+        future = Future()
+        with self._lock:
+            self._pending[job_id] = future
+        self._requests.put((job_id, texts, max_length, min_length))
+        try:
+            return future.result(timeout)
+        finally:
+            with self._lock:
+                self._pending.pop(job_id, None)
+
+    def _receive(self):
+        while True:
+            job_id, summaries, error, stats = self._responses.get()
+            self._stats = stats
+            with self._lock:
+                future = self._pending.pop(job_id, None)
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(summaries)
+
+    def stats(self) -> dict:
+        return dict(self._stats, alive=self.is_alive(), pending_jobs=len(self._pending))
+
+
+Job = Tuple[str, List[str], int, int]
+
+
+def _count_tokens(tokenizer, texts: List[str]) -> List[int]:
+    if not texts:
+        return []
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+
+def _next_jobs(requests, batch_size: int, batch_wait_time: float) -> Tuple[List[Job], bool]:
+    """
+    Waits for a job, then takes the ones that arrive in the next batch_wait_time
+    seconds until there are batch_size texts. Returns the jobs and whether to stop.
+    """
+    job = requests.get()
+    if job is None:
+        return [], True
+    jobs = [job]
+    texts = len(job[1])
+    deadline = time.time() + batch_wait_time
+    while texts < batch_size:
+        try:
+            job = requests.get(timeout=max(deadline - time.time(), 0))
+        except queue.Empty:
+            break
+        if job is None:
+            return jobs, True
+        jobs.append(job)
+        texts += len(job[1])
+    return jobs, False
+
+
+def _serve(requests, responses, model_name: str, batch_size: int, batch_wait_time: float):
+    summarizer = Summarizer.load(model_name, batch_size)
+    responses.put((None, None, None, summarizer.stats()))
+    stop = False
+    while not stop:
+        jobs, stop = _next_jobs(requests, batch_size, batch_wait_time)
+        groups: Dict[Tuple[int, int], List[Job]] = {}
+        for job in jobs:
+            groups.setdefault((job[2], job[3]), []).append(job)
+        for (max_length, min_length), group in groups.items():
+            texts = [text for job in group for text in job[1]]
+            start = time.time()
+            try:
+                summaries = summarizer.summarize(texts, max_length, min_length)
+            except Exception as e:
+                logger.error(f"Error summarizing {len(texts)} texts: {e}")
+                for job in group:
+                    responses.put((job[0], None, str(e), summarizer.stats()))
+                continue
+            stats = summarizer.stats()
+            logger.info(f"{len(texts)} texts of {len(group)} jobs summarized in {time_to_string(time.time() - start)} "
+                        f"({stats['tokens_per_second']:.1f} tokens/s)")
+            offset = 0
+            for job in group:
+                responses.put((job[0], summaries[offset:offset + len(job[1])], None, stats))
+                offset += len(job[1])
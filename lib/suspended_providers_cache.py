@@ -0,0 +1,82 @@
+from typing import Callable, FrozenSet, Iterable, Optional
+import logging as logger
+import threading
+import time
+
+DEFAULT_TTL = 30  # seconds
+ERROR_RETRY_TIME = 5  # seconds
+
+
+class SuspendedProvidersCache:
+    """
+    In-process TTL cache in front of SupportLib.get_all_users_suspended.
+    - Only one caller refreshes an expired entry at a time (single-flight); the
+      rest keep being served the previous set while the refresh is running.
+    - If the refresh fails and there is a previous set, it is served stale and
+      the refresh is retried after ERROR_RETRY_TIME seconds.
+    """
+
+    def __init__(self, fetch: Callable[[], Optional[Iterable[str]]], ttl: float = DEFAULT_TTL, clock: Callable[[], float] = time.monotonic):
+        self._fetch = fetch
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._value: Optional[FrozenSet[str]] = None
+        self._expires_at = 0.0
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refresh_errors = 0
+
+    def _is_fresh(self) -> bool:
+        return self._value is not None and self._clock() < self._expires_at
+
+    def get(self) -> FrozenSet[str]:
+        if self._is_fresh():
+            self.hits += 1
+            return self._value
+
+        # Without a previous set there is nothing to serve, so wait for the refresh
+        if not self._lock.acquire(blocking=self._value is None):
+            self.stale_hits += 1
+            return self._value
+        try:
+            if self._is_fresh():
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            return self._refresh()
+        finally:
+            self._lock.release()
+
+    def _refresh(self) -> FrozenSet[str]:
+        try:
+            value = frozenset(self._fetch() or [])
+        except Exception as e:
+            self.refresh_errors += 1
+            if self._value is None:
+                raise
+            logger.error(f"Error refreshing suspended providers, serving stale data: {e}")
+            self._expires_at = self._clock() + min(self.ttl, ERROR_RETRY_TIME)
+            self.stale_hits += 1
+            return self._value
+        if value != self._value:
+            self.version += 1
+        self._value = value
+        self._expires_at = self._clock() + self.ttl
+        return value
+
+    def invalidate(self):
+        self._expires_at = 0.0
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'refresh_errors': self.refresh_errors,
+            'version': self.version,
+            'size': len(self._value) if self._value is not None else 0,
+            'ttl': self.ttl
+        }
@@ -0,0 +1,150 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from collections import Counter, defaultdict
+import bisect
+import math
+import re
+import threading
+import unicodedata
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+PREFIX_WEIGHT = 0.5  # Score multiplier for terms matched only by prefix
+MIN_STEM_LEN = 3
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Longest suffixes first, Spanish and English (the services are written in both)
+SUFFIXES = ("aciones", "amiento", "imiento", "acion", "ation", "mente", "ings", "ing", "edly",
+            "ness", "ers", "ies", "es", "ed", "er", "ly", "os", "as", "s", "o", "a", "e")
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def stem(token: str) -> str:
+    if token.isdigit():
+        return token
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM_LEN:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [stem(token) for token in TOKEN_PATTERN.findall(normalize(text))]
+
+
+class TextIndex:
+    """
+    In-memory inverted index with BM25 ranking.
+    - Documents are made of weighted fields (e.g. the name weights more than the description).
+    - Each keyword is a phrase: a document matches it when it contains all of its terms,
+      the last one can also match as a prefix (so "plom" finds "plomero").
+    - A document matches a query when it matches any of its keywords.
+    """
+
+    def __init__(self, field_weights: Dict[str, float]):
+        self.field_weights = field_weights
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._doc_terms: Dict[str, Dict[str, float]] = {}
+        self._doc_len: Dict[str, float] = {}
+        self._total_len = 0.0
+        self._sorted_terms: List[str] = []
+        self._sorted_terms_dirty = False
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._doc_terms
+
+    def add(self, doc_id: str, fields: Dict[str, Optional[str]]):
+        terms = Counter()
+        for field, weight in self.field_weights.items():
+            for token in tokenize(fields.get(field)):
+                terms[token] += weight
+        with self._lock:
+            self._remove(doc_id)
+            for term, frequency in terms.items():
+                if term not in self._postings:
+                    self._sorted_terms_dirty = True
+                self._postings[term][doc_id] = frequency
+            self._doc_terms[doc_id] = dict(terms)
+            self._doc_len[doc_id] = sum(terms.values())
+            self._total_len += self._doc_len[doc_id]
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+                self._sorted_terms_dirty = True
+        self._total_len -= self._doc_len.pop(doc_id)
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        if self._sorted_terms_dirty:
+            self._sorted_terms = sorted(self._postings)
+            self._sorted_terms_dirty = False
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        end = bisect.bisect_left(self._sorted_terms, prefix + "\uffff")
+        return self._sorted_terms[start:end]
+
+    def _term_scores(self, term: str, weight: float, avg_len: float) -> Dict[str, float]:
+        postings = self._postings.get(term, {})
+        idf = math.log(1 + (len(self._doc_terms) - len(postings) + 0.5) / (len(postings) + 0.5))
+        return {doc_id: weight * idf * frequency * (BM25_K1 + 1) /
+                (frequency + BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len[doc_id] / avg_len))
+                for doc_id, frequency in postings.items()}
+
+    def _keyword_scores(self, keyword: str, avg_len: float) -> Dict[str, float]:
+        tokens = TOKEN_PATTERN.findall(normalize(keyword))
+        if not tokens:
+            return {}
+        scores = None
+        for i, token in enumerate(tokens):
+            term = stem(token)
+            term_scores = self._term_scores(term, 1.0, avg_len)
+            if i == len(tokens) - 1:
+                for prefix_term in self._prefix_terms(token):
+                    if prefix_term == term:
+                        continue
+                    for doc_id, score in self._term_scores(prefix_term, PREFIX_WEIGHT, avg_len).items():
+                        term_scores[doc_id] = max(term_scores.get(doc_id, 0.0), score)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {doc_id: score + term_scores[doc_id] for doc_id, score in scores.items() if doc_id in term_scores}
+            if not scores:
+                return {}
+        return scores
+
+    def search(self, keywords: Iterable[str], k: Optional[int] = None, candidates: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Returns the top k (doc_id, score) pairs sorted by descending score,
+        optionally restricted to the candidates doc ids.
+        """
+        with self._lock:
+            if not self._doc_terms:
+                return []
+            avg_len = max(self._total_len / len(self._doc_terms), 1e-9)
+            scores = {}
+            for keyword in keywords:
+                for doc_id, score in self._keyword_scores(keyword, avg_len).items():
+                    if candidates is not None and doc_id not in candidates:
+                        continue
+                    scores[doc_id] = max(scores.get(doc_id, 0.0), score)
+        ranking = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranking[:k] if k is not None else ranking
@@ -1,24 +1,41 @@
-from typing import List, Tuple
+from typing import List, Tuple, Union
 import networkx as nx
+import numpy as np
+import scipy.sparse as sp
 import operator
 import random
+from lib.ratings_table import RatingsTable
 
 CLIENT_INDEX = 0
 SERVICE_INDEX = 1
 SCORE_INDEX = 2
 
+PAGERANK_ALPHA = 0.85
+PAGERANK_MAX_ITER = 100
+PAGERANK_TOL = 1.0e-6
+
+SPARSE_ENGINE = "sparse"
+NETWORKX_ENGINE = "networkx"
+
 class TrendingAnaliser:
-    def __init__(self, scores: List[Tuple[str, str, int]]):
-        self.bipartite_graph = self._create_bipartite_graph(scores)
-        self.services_graph = self._create_services_graph()
-        self.services = {score[SERVICE_INDEX]: scores.count(score) for score in scores}
-    
+    def __init__(self, scores: Union[RatingsTable, List[Tuple[str, str, int]]], engine: str = SPARSE_ENGINE):
+        if engine not in {SPARSE_ENGINE, NETWORKX_ENGINE}:
+            raise ValueError(f"Invalid engine: {engine}")
+        self.engine = engine
+        table = RatingsTable.of(scores)
+        if engine == NETWORKX_ENGINE:
+            self.bipartite_graph = self._create_bipartite_graph(table.tuples())
+            self.services_graph = self._create_services_graph()
+        else:
+            self.services_ids, self.services_matrix = self._create_services_matrix(table)
+        self.services = table.services_reviews()
+
     def _create_bipartite_graph(self, scores: List[Tuple[str, str, int]]) -> nx.DiGraph:
         bipartite_graph = nx.DiGraph()
         for score in scores:
             bipartite_graph.add_edge(score[CLIENT_INDEX], score[SERVICE_INDEX], weight=score[SCORE_INDEX])
         return bipartite_graph
-    
+
     def _create_services_graph(self) -> nx.DiGraph:
         services_graph = nx.DiGraph()
         clients = set()
@@ -40,7 +57,42 @@ class TrendingAnaliser:
                     else:
                         services_graph[service1][service2]["weight"] += service2_weight
         return services_graph
-    
+
+    def _create_services_matrix(self, table: RatingsTable) -> Tuple[List[str], sp.csr_matrix]:
+        """
+        Same graph as _create_services_graph as a sparse matrix: the weight of
+        service1 -> service2 is the sum of the scores given to service2 by the
+        clients that also scored service1 (ratings^T x scores, without the diagonal).
+        """
+        services_matrix = (table.to_matrix(binary=True).T @ table.to_matrix()).tocsr()
+        services_matrix.setdiag(0)
+        services_matrix.eliminate_zeros()
+        return table.service_ids, services_matrix
+
+    def _sparse_page_rank(self) -> dict:
+        """
+        Power iteration equivalent to nx.pagerank (uniform teleport, dangling
+        nodes spread uniformly).
+        """
+        n = len(self.services_ids)
+        if n == 0:
+            return {}
+        out_weight = np.asarray(self.services_matrix.sum(axis=1)).ravel()
+        dangling = out_weight == 0
+        inverse_weight = np.divide(1.0, out_weight, out=np.zeros_like(out_weight), where=~dangling)
+        transition = (sp.diags(inverse_weight) @ self.services_matrix).T.tocsr()
+
+        rank = np.full(n, 1.0 / n)
+        for _ in range(PAGERANK_MAX_ITER):
+            last_rank = rank
+            rank = PAGERANK_ALPHA * (transition @ last_rank) + (PAGERANK_ALPHA * last_rank[dangling].sum() + 1 - PAGERANK_ALPHA) / n
+            if np.abs(rank - last_rank).sum() < n * PAGERANK_TOL:
+                break
+        return dict(zip(self.services_ids, rank.tolist()))
+
     def get_services_rank(self) -> List[str]:
-        page_rank = nx.pagerank(self.services_graph, alpha=0.85)
+        if self.engine == NETWORKX_ENGINE:
+            page_rank = nx.pagerank(self.services_graph, alpha=PAGERANK_ALPHA)
+        else:
+            page_rank = self._sparse_page_rank()
         return {service: {"TRENDING_SCORE": page_rank[service], "REVIEWS_COUNT": self.services[service]} for service in self.services if service in page_rank}
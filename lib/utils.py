@@ -1,8 +1,14 @@
+import base64
 import datetime
+import json
+import math
 import os
 import time
-from typing import Optional, Union
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar, Union
 from fastapi import HTTPException
+from pymongo import UpdateOne
+from pymongo.client_session import ClientSession
+from pymongo.errors import OperationFailure
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 import logging as logger
@@ -14,6 +20,13 @@ HOUR = 60 * 60
 MINUTE = 60
 MILLISECOND = 1_000
 
+ILLEGAL_OPERATION = 20  # Error code of transactions on a standalone server
+
+T = TypeVar('T')
+
+# One client per process, shared by its managers (a client must not be used after a fork)
+_mongo_clients = {}
+
 def time_to_string(time_in_seconds: float) -> str:
     minutes = int(time_in_seconds // MINUTE)
     seconds = int(time_in_seconds % MINUTE)
@@ -24,9 +37,44 @@ def get_mongo_client() -> MongoClient:
     if not all([os.getenv('MONGO_USER'), os.getenv('MONGO_PASSWORD'), os.getenv('MONGO_HOST'), os.getenv('MONGO_APP_NAME')]):
         raise HTTPException(status_code=500, detail="MongoDB environment variables are not set properly")
     uri = f"mongodb+srv://{os.getenv('MONGO_USER')}:{os.getenv('MONGO_PASSWORD')}@{os.getenv('MONGO_HOST')}/?retryWrites=true&w=majority&appName={os.getenv('MONGO_APP_NAME')}"
-    print(f"Connecting to MongoDB: {uri}")
-    logger.getLogger('pymongo').setLevel(logger.WARNING)
-    return MongoClient(uri)
+    if os.getpid() not in _mongo_clients:
+        print(f"Connecting to MongoDB: {uri}")
+        logger.getLogger('pymongo').setLevel(logger.WARNING)
+        _mongo_clients[os.getpid()] = MongoClient(uri)
+    return _mongo_clients[os.getpid()]
+
+def run_in_transaction(client, callback: Callable[[Optional[ClientSession]], T]) -> T:
+    """
+    Runs callback(session) inside a transaction, so that an exception undoes every
+    write done with the session. Without transactions support (standalone server,
+    mongomock) it runs callback(None) and the writes are not undone.
+    """
+    try:
+        session = client.start_session()
+    except NotImplementedError:
+        return callback(None)
+    with session:
+        try:
+            return session.with_transaction(callback)
+        except OperationFailure as e:
+            if e.code != ILLEGAL_OPERATION:
+                raise
+    return callback(None)
+
+def bulk_upsert(collection, upserts: List[Tuple[Dict, Dict]], session: Optional[ClientSession] = None):
+    """
+    Applies the (filter, update) upserts in a single unordered bulk write.
+    mongomock does not support the UpdateOne requests of recent pymongo versions,
+    so there they are applied one by one.
+    """
+    if not upserts:
+        return
+    if os.environ.get('MONGOMOCK'):
+        for filter, update in upserts:
+            collection.update_one(filter, update, upsert=True, session=session)
+        return
+    collection.bulk_write([UpdateOne(filter, update, upsert=True) for filter, update in upserts],
+                          ordered=False, session=session)
 
 def get_actual_time() -> str:
     return datetime.datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d %H:%M:%S')
@@ -100,6 +148,34 @@ def create_repetitions_list(interval: str, max_repetitions: int, first_date: str
 
     return repetitions
 
+def location_cell(location: dict, cell_size: float) -> str:
+    """
+    Id of the grid cell (of cell_size degrees) that contains the location.
+    """
+    return f"{math.floor(location['longitude'] / cell_size)}:{math.floor(location['latitude'] / cell_size)}"
+
+def cell_center(cell: str, cell_size: float) -> dict:
+    longitude_index, latitude_index = (int(index) for index in cell.split(":"))
+    return {'longitude': (longitude_index + 0.5) * cell_size, 'latitude': (latitude_index + 0.5) * cell_size}
+
+def encode_cursor(sort_key: list, mode: str) -> str:
+    """
+    The search mode is kept in the cursor, the sort keys of the modes are not comparable.
+    """
+    return base64.urlsafe_b64encode(json.dumps({'mode': mode, 'after': sort_key}).encode()).decode()
+
+def decode_cursor(cursor: str, mode: str) -> list:
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    sort_key = decoded.get('after') if isinstance(decoded, dict) else None
+    if not isinstance(sort_key, list) or len(sort_key) != 2 or not isinstance(sort_key[0], (int, float)) or not isinstance(sort_key[1], str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if decoded.get('mode') != mode:
+        raise HTTPException(status_code=400, detail="The cursor belongs to another search mode")
+    return sort_key
+
 def sentry_init():
     sentry_sdk.init(
         dsn=os.getenv('SENTRY_DSN'),